@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Сравнение JSON декодеров на примерах из test_messages_mqtt.json
+
+Для каждого доступного декодера (json, orjson, msgspec) измеряется время
+полного пути обработки пакета: разбор bytes и сборка типизированного пакета.
+Строка "json (str)" - прежний путь json.loads(payload.decode('utf-8')).
+
+Запуск из корня репозитория:
+    python benchmarks/decode_benchmark.py [--iterations N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.packet_codec import json_loader
+from src.packets import build_packet
+
+SAMPLES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test_messages_mqtt.json')
+
+
+def load_samples():
+    """Пары (тип сообщения, payload в bytes) из файла примеров"""
+    with open(SAMPLES_PATH, 'r', encoding='utf-8') as f:
+        messages = json.load(f)['test_messages']['messages']
+    samples = []
+    for message in messages:
+        message_type = message['topic'].rsplit('/', 1)[-1]
+        samples.append((message_type, json.dumps(message['payload'], ensure_ascii=False).encode('utf-8')))
+    return samples
+
+
+def run(name, loads, samples, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for message_type, payload in samples:
+            build_packet(message_type, loads(payload))
+    elapsed = time.perf_counter() - started
+    packets = iterations * len(samples)
+    print(f"{name:<12} {packets / elapsed:>12,.0f} пакетов/с {elapsed / packets * 1e6:>8.2f} мкс/пакет")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=50000)
+    args = parser.parse_args()
+
+    samples = load_samples()
+    print(f"Примеров: {len(samples)}, повторов: {args.iterations}")
+
+    run('json (str)', lambda payload: json.loads(payload.decode('utf-8')), samples, args.iterations)
+    for backend in ('json', 'orjson', 'msgspec'):
+        try:
+            name, loads = json_loader(backend)
+        except ValueError:
+            print(f"{backend:<12} не установлен")
+            continue
+        run(name, loads, samples, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
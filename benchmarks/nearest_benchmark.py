@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Поиск ближайших узлов: сетка NodeSpatialIndex против полного перебора
+
+Узлы случайно распределены вокруг заданной точки (нормальное
+распределение), запросы выполняются из той же области.
+
+Запуск из корня репозитория:
+    python benchmarks/nearest_benchmark.py [--nodes N] [--queries N] [--k K]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.geo import haversine_km
+from src.spatial_index import NodeSpatialIndex
+
+CENTER = (55.75, 37.62)
+
+
+def random_point(rng):
+    return CENTER[0] + rng.gauss(0, 2), CENTER[1] + rng.gauss(0, 3)
+
+
+def run(name, nearest, queries):
+    started = time.perf_counter()
+    for lat, lon in queries:
+        nearest(lat, lon)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<16} {elapsed / len(queries) * 1e3:>8.3f} мс/запрос")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--cell-size', type=float, default=0.1)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    positions = {f"!{index:08x}": random_point(rng) for index in range(args.nodes)}
+    queries = [random_point(rng) for _ in range(args.queries)]
+
+    index = NodeSpatialIndex(args.cell_size)
+    for node_id, (lat, lon) in positions.items():
+        index.update(node_id, lat, lon)
+    print(f"Узлов: {args.nodes}, запросов: {args.queries}, k={args.k}, ячейка {args.cell_size}°")
+
+    def brute_force(lat, lon):
+        return sorted((haversine_km(lat, lon, *point), node_id) for node_id, point in positions.items())[:args.k]
+
+    run('сетка', lambda lat, lon: index.nearest(lat, lon, args.k), queries)
+    run('полный перебор', brute_force, queries[:max(1, args.queries // 100)])
+
+
+if __name__ == "__main__":
+    main()
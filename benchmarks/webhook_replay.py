@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Воспроизведение записанных обновлений Telegram через webhook
+
+Без --url запускается локальный WebhookServer, который разбирает
+обновления в telegram.Update и только считает их - так проверяется сам
+прием без токена бота. С --url обновления отправляются в работающий мост
+(telegram.webhook.enabled: true), секрет - значение secret_token из
+конфигурации.
+
+Запуск из корня репозитория:
+    python benchmarks/webhook_replay.py [--file test_updates_telegram.json]
+        [--url http://127.0.0.1:8443/telegram --secret TOKEN]
+        [--repeat N] [--connections N]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+
+from src.webhook import WebhookServer
+
+LOCAL_SECRET = 'replay-secret'
+
+
+def load_updates(path):
+    with open(path, encoding='utf-8') as f:
+        samples = json.load(f)['test_updates']['updates']
+    return [sample['update'] for sample in samples]
+
+
+async def post(reader, writer, host, path, secret, body):
+    """POST по открытому keep-alive соединению, возвращает код ответа"""
+    headers = [
+        f"POST {path} HTTP/1.1",
+        f"Host: {host}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+    ]
+    if secret is not None:
+        headers.append(f"X-Telegram-Bot-Api-Secret-Token: {secret}")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+async def replay(url, secret, bodies, connections):
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    queue = asyncio.Queue()
+    for body in bodies:
+        queue.put_nowait(body)
+    statuses = Counter()
+    latencies = []
+
+    async def worker():
+        reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=parts.scheme == 'https' or None)
+        try:
+            while not queue.empty():
+                body = queue.get_nowait()
+                started = time.perf_counter()
+                statuses[await post(reader, writer, parts.netloc, parts.path or '/', secret, body)] += 1
+                latencies.append(time.perf_counter() - started)
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    return statuses, latencies, time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--file', default='test_updates_telegram.json')
+    parser.add_argument('--url', help='адрес webhook работающего моста')
+    parser.add_argument('--secret', help='секретный токен webhook')
+    parser.add_argument('--repeat', type=int, default=1, help='повторов всего набора')
+    parser.add_argument('--connections', type=int, default=4)
+    args = parser.parse_args()
+
+    updates = load_updates(args.file)
+    bodies = [json.dumps(update, ensure_ascii=False).encode('utf-8') for update in updates] * args.repeat
+
+    server = None
+    received = Counter()
+    url, secret = args.url, args.secret
+    if url is None:
+        async def handle(data):
+            update = Update.de_json(data, None)
+            received['message' if update.effective_message else 'other'] += 1
+
+        server = WebhookServer(handle, path='/telegram', secret_token=LOCAL_SECRET, host='127.0.0.1', port=0)
+        await server.start()
+        url, secret = f"http://127.0.0.1:{server.port}/telegram", LOCAL_SECRET
+
+    try:
+        statuses, latencies, elapsed = await replay(url, secret, bodies, args.connections)
+        # Запрос с неверным секретом должен быть отклонен
+        rejected, _, _ = await replay(url, 'wrong-secret', bodies[:1], 1)
+    finally:
+        if server is not None:
+            await server.stop()
+
+    latencies.sort()
+    print(f"Обновлений: {len(bodies)}, соединений: {args.connections}, {url}")
+    print(f"Ответы: {dict(statuses)}, с неверным секретом: {dict(rejected)}")
+    print(
+        f"Задержка: медиана {latencies[len(latencies) // 2] * 1e3:.2f} мс, "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.2f} мс, "
+        f"{len(bodies) / elapsed:.0f} обновлений/с"
+    )
+    if server is not None:
+        print(f"Разобрано сервером: {dict(received)}, статистика: {server.stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
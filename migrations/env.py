@@ -0,0 +1,70 @@
+"""
+Окружение Alembic: адрес БД берется из config/config.yaml (database.url),
+как и при запуске моста
+"""
+
+import os
+from logging.config import fileConfig
+
+import yaml
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+from src.models import Base
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def _database_url() -> str:
+    """Адрес БД из конфигурации моста или alembic.ini"""
+    config_path = os.getenv('BRIDGE_CONFIG', 'config/config.yaml')
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            bridge_config = yaml.safe_load(f) or {}
+        url = bridge_config.get('database', {}).get('url')
+        if url:
+            return url
+    except FileNotFoundError:
+        pass
+    return config.get_main_option('sqlalchemy.url')
+
+
+def run_migrations_offline():
+    """Генерация SQL без подключения к БД"""
+    context.configure(
+        url=_database_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={'paramstyle': 'named'},
+        render_as_batch=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """Применение миграций к БД"""
+    section = config.get_section(config.config_ini_section, {})
+    section['sqlalchemy.url'] = _database_url()
+    connectable = engine_from_config(section, prefix='sqlalchemy.', poolclass=pool.NullPool)
+
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            # SQLite не поддерживает большинство ALTER TABLE
+            render_as_batch=True,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,70 @@
+"""Исходная схема (users, messages, mesh_nodes)
+
+Таблицы создаются только если их еще нет: базы, созданные мостом
+через create_all до появления миграций, просто помечаются этой ревизией.
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-11-02
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'users' not in existing:
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('chat_id', sa.Integer(), nullable=False, unique=True),
+            sa.Column('username', sa.String(100)),
+            sa.Column('first_name', sa.String(100)),
+            sa.Column('last_name', sa.String(100)),
+            sa.Column('is_admin', sa.Boolean()),
+            sa.Column('is_approved', sa.Boolean()),
+            sa.Column('created_at', sa.DateTime()),
+            sa.Column('message_count', sa.Integer()),
+            sa.Column('last_active', sa.DateTime()),
+        )
+
+    if 'messages' not in existing:
+        op.create_table(
+            'messages',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('direction', sa.String(10)),
+            sa.Column('chat_id', sa.Integer()),
+            sa.Column('mesh_node', sa.String(50)),
+            sa.Column('content', sa.Text()),
+            sa.Column('message_type', sa.String(20)),
+            sa.Column('timestamp', sa.DateTime()),
+        )
+
+    if 'mesh_nodes' not in existing:
+        op.create_table(
+            'mesh_nodes',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('node_id', sa.String(50), unique=True),
+            sa.Column('long_name', sa.String(100)),
+            sa.Column('short_name', sa.String(50)),
+            sa.Column('hardware_model', sa.String(50)),
+            sa.Column('last_seen', sa.DateTime()),
+            sa.Column('battery_level', sa.Integer()),
+            sa.Column('latitude', sa.Float()),
+            sa.Column('longitude', sa.Float()),
+            sa.Column('altitude', sa.Float()),
+            sa.Column('message_count', sa.Integer()),
+        )
+
+
+def downgrade():
+    op.drop_table('mesh_nodes')
+    op.drop_table('messages')
+    op.drop_table('users')
@@ -0,0 +1,60 @@
+"""Индексы messages и таблица счетчиков bridge_stats
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+MESSAGE_INDEXES = {
+    'ix_messages_direction': 'direction',
+    'ix_messages_timestamp': 'timestamp',
+    'ix_messages_mesh_node': 'mesh_node',
+}
+
+# Начальные значения счетчиков по уже накопленной истории
+COUNTER_QUERIES = {
+    'messages_to_mesh': "SELECT COUNT(*) FROM messages WHERE direction = 'to_mesh'",
+    'messages_from_mesh': "SELECT COUNT(*) FROM messages WHERE direction = 'from_mesh'",
+    'users_total': "SELECT COUNT(*) FROM users",
+    'users_active': "SELECT COUNT(*) FROM users WHERE last_active IS NOT NULL",
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    existing_indexes = {index['name'] for index in inspector.get_indexes('messages')}
+    for name, column in MESSAGE_INDEXES.items():
+        if name not in existing_indexes:
+            op.create_index(name, 'messages', [column])
+
+    if 'bridge_stats' not in inspector.get_table_names():
+        op.create_table(
+            'bridge_stats',
+            sa.Column('key', sa.String(50), primary_key=True),
+            sa.Column('value', sa.Integer(), nullable=False),
+        )
+
+    present = {row[0] for row in bind.execute(sa.text("SELECT key FROM bridge_stats"))}
+    for key, query in COUNTER_QUERIES.items():
+        if key not in present:
+            value = bind.execute(sa.text(query)).scalar() or 0
+            bind.execute(
+                sa.text("INSERT INTO bridge_stats (key, value) VALUES (:key, :value)"),
+                {'key': key, 'value': value}
+            )
+
+
+def downgrade():
+    op.drop_table('bridge_stats')
+    for name in MESSAGE_INDEXES:
+        op.drop_index(name, table_name='messages')
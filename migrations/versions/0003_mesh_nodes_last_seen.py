@@ -0,0 +1,24 @@
+"""Индекс mesh_nodes.last_seen для постраничного /nodes
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing_indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('mesh_nodes')}
+    if 'ix_mesh_nodes_last_seen' not in existing_indexes:
+        op.create_index('ix_mesh_nodes_last_seen', 'mesh_nodes', ['last_seen'])
+
+
+def downgrade():
+    op.drop_index('ix_mesh_nodes_last_seen', table_name='mesh_nodes')
@@ -0,0 +1,143 @@
+"""Приведение ID узлов к виду '!%08x'
+
+JSON прошивки передает номер узла числом, поэтому в базах, заполненных
+до нормализации, ID хранятся как '123456789', а новые пакеты приходят
+как '!075bcd15'. Строки одного узла в mesh_nodes объединяются, ссылки в
+журнале сообщений, телеметрии и истории координат переписываются.
+Таблицы, которых еще нет, пропускаются.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+BROADCAST_NUM = 0xFFFFFFFF
+
+NODE_FIELDS = (
+    'long_name', 'short_name', 'hardware_model', 'battery_level', 'latitude', 'longitude', 'altitude'
+)
+
+
+def _normalize(value):
+    """Копия packets.normalize_node_id: миграция не зависит от кода моста"""
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    try:
+        if text.startswith('!'):
+            number = int(text[1:], 16)
+        elif text.isdigit():
+            number = int(text)
+        else:
+            return value
+    except ValueError:
+        return value
+    if number == BROADCAST_NUM:
+        return '^all'
+    return f"!{number & BROADCAST_NUM:08x}"
+
+
+def _renames(bind, table, column):
+    """Старый ID -> канонический для значений столбца, которые меняются"""
+    values = [row[0] for row in bind.execute(sa.text(f"SELECT DISTINCT {column} FROM {table}"))]
+    return {value: _normalize(value) for value in values if _normalize(value) != value}
+
+
+def _merge_nodes(bind):
+    """Переименование узлов; строки одного узла сливаются в самую свежую"""
+    columns = ('id', 'node_id', 'last_seen', 'message_count') + NODE_FIELDS
+    rows = bind.execute(sa.text(f"SELECT {', '.join(columns)} FROM mesh_nodes")).mappings().all()
+    groups = {}
+    for row in rows:
+        groups.setdefault(_normalize(row['node_id']), []).append(row)
+
+    for node_id, group in groups.items():
+        if len(group) == 1:
+            if group[0]['node_id'] != node_id:
+                bind.execute(sa.text("UPDATE mesh_nodes SET node_id = :node_id WHERE id = :id"),
+                             {'node_id': node_id, 'id': group[0]['id']})
+            continue
+
+        # Поле берется из самой свежей строки, где оно заполнено
+        group.sort(key=lambda row: str(row['last_seen'] or ''), reverse=True)
+        keep = group[0]
+        values = {name: next((row[name] for row in group if row[name] is not None), None) for name in NODE_FIELDS}
+        values.update(
+            id=keep['id'],
+            node_id=node_id,
+            last_seen=keep['last_seen'],
+            message_count=sum(row['message_count'] or 0 for row in group),
+        )
+        bind.execute(sa.text("DELETE FROM mesh_nodes WHERE id IN :ids").bindparams(sa.bindparam('ids', expanding=True)),
+                     {'ids': [row['id'] for row in group[1:]]})
+        assignments = ', '.join(f"{name} = :{name}" for name in values if name != 'id')
+        bind.execute(sa.text(f"UPDATE mesh_nodes SET {assignments} WHERE id = :id"), values)
+
+
+def _rename_column(bind, table, column):
+    for old, new in _renames(bind, table, column).items():
+        bind.execute(sa.text(f"UPDATE {table} SET {column} = :new WHERE {column} = :old"), {'old': old, 'new': new})
+
+
+def _rename_samples(bind):
+    """Значения телеметрии: повтор значения под новым ID удаляется"""
+    for old, new in _renames(bind, 'telemetry_samples', 'node_id').items():
+        params = {'old': old, 'new': new}
+        bind.execute(sa.text(
+            "DELETE FROM telemetry_samples WHERE node_id = :old AND EXISTS ("
+            "SELECT 1 FROM telemetry_samples AS other WHERE other.node_id = :new "
+            "AND other.metric = telemetry_samples.metric AND other.ts = telemetry_samples.ts)"
+        ), params)
+        bind.execute(sa.text("UPDATE telemetry_samples SET node_id = :new WHERE node_id = :old"), params)
+
+
+def _merge_rollups(bind):
+    """Агрегаты телеметрии: совпавшие интервалы складываются"""
+    for old, new in _renames(bind, 'telemetry_rollups', 'node_id').items():
+        rows = bind.execute(sa.text(
+            "SELECT metric, resolution, bucket, count, total, min_value, max_value "
+            "FROM telemetry_rollups WHERE node_id = :old"
+        ), {'old': old}).mappings().all()
+        for row in rows:
+            params = dict(row, old=old, new=new)
+            merged = bind.execute(sa.text(
+                "UPDATE telemetry_rollups SET count = count + :count, total = total + :total, "
+                "min_value = CASE WHEN :min_value < min_value THEN :min_value ELSE min_value END, "
+                "max_value = CASE WHEN :max_value > max_value THEN :max_value ELSE max_value END "
+                "WHERE node_id = :new AND metric = :metric AND resolution = :resolution AND bucket = :bucket"
+            ), params).rowcount
+            if merged:
+                bind.execute(sa.text(
+                    "DELETE FROM telemetry_rollups WHERE node_id = :old AND metric = :metric "
+                    "AND resolution = :resolution AND bucket = :bucket"
+                ), params)
+        bind.execute(sa.text("UPDATE telemetry_rollups SET node_id = :new WHERE node_id = :old"),
+                     {'old': old, 'new': new})
+
+
+def upgrade():
+    bind = op.get_bind()
+    tables = set(sa.inspect(bind).get_table_names())
+    if 'mesh_nodes' in tables:
+        _merge_nodes(bind)
+    if 'messages' in tables:
+        _rename_column(bind, 'messages', 'mesh_node')
+    if 'position_history' in tables:
+        _rename_column(bind, 'position_history', 'node_id')
+    if 'telemetry_samples' in tables:
+        _rename_samples(bind)
+    if 'telemetry_rollups' in tables:
+        _merge_rollups(bind)
+
+
+def downgrade():
+    # Исходный вид ID (число или строка) не сохраняется, откат не меняет данные
+    pass
@@ -0,0 +1,49 @@
+"""История телеметрии: значения и агрегаты за 1 минуту и 1 час
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'telemetry_samples' not in tables:
+        op.create_table(
+            'telemetry_samples',
+            sa.Column('node_id', sa.String(50), primary_key=True),
+            sa.Column('metric', sa.String(30), primary_key=True),
+            sa.Column('ts', sa.DateTime(), primary_key=True),
+            sa.Column('value', sa.Float(), nullable=False),
+            sqlite_with_rowid=False,
+        )
+        op.create_index('ix_telemetry_samples_ts', 'telemetry_samples', ['ts'])
+
+    if 'telemetry_rollups' not in tables:
+        op.create_table(
+            'telemetry_rollups',
+            sa.Column('node_id', sa.String(50), primary_key=True),
+            sa.Column('metric', sa.String(30), primary_key=True),
+            sa.Column('resolution', sa.Integer(), primary_key=True),
+            sa.Column('bucket', sa.DateTime(), primary_key=True),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('total', sa.Float(), nullable=False),
+            sa.Column('min_value', sa.Float(), nullable=False),
+            sa.Column('max_value', sa.Float(), nullable=False),
+            sqlite_with_rowid=False,
+        )
+        op.create_index('ix_telemetry_rollups_resolution_bucket', 'telemetry_rollups', ['resolution', 'bucket'])
+
+
+def downgrade():
+    op.drop_table('telemetry_rollups')
+    op.drop_table('telemetry_samples')
@@ -0,0 +1,35 @@
+"""История координат узлов
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'position_history' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'position_history',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('node_id', sa.String(50), nullable=False),
+        sa.Column('ts', sa.DateTime(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('altitude', sa.Float()),
+    )
+    op.create_index('ix_position_history_node_ts', 'position_history', ['node_id', 'ts'])
+    op.create_index('ix_position_history_ts', 'position_history', ['ts'])
+
+
+def downgrade():
+    op.drop_table('position_history')
@@ -0,0 +1,41 @@
+import math
+from typing import Dict, Tuple
+
+# Пресеты модема Meshtastic: (spreading factor, полоса кГц, coding rate 4/x)
+MODEM_PRESETS: Dict[str, Tuple[int, float, int]] = {
+    'SHORT_TURBO': (7, 500.0, 5),
+    'SHORT_FAST': (7, 250.0, 5),
+    'SHORT_SLOW': (8, 250.0, 5),
+    'MEDIUM_FAST': (9, 250.0, 5),
+    'MEDIUM_SLOW': (10, 250.0, 5),
+    'LONG_FAST': (11, 250.0, 5),
+    'LONG_MODERATE': (11, 125.0, 8),
+    'LONG_SLOW': (12, 125.0, 8),
+    'VERY_LONG_SLOW': (12, 62.5, 8),
+}
+
+# Заголовок пакета Meshtastic (16 байт) и обертка protobuf Data
+PACKET_OVERHEAD_BYTES = 20
+PREAMBLE_SYMBOLS = 16
+
+
+def airtime_ms(payload_bytes: int, preset: str = 'LONG_FAST') -> float:
+    """Время в эфире пакета LoRa с полезной нагрузкой payload_bytes, мс
+
+    Формула Semtech (AN1200.13): явный заголовок, CRC включен,
+    оптимизация низкой скорости при длительности символа больше 16 мс.
+    """
+    try:
+        spreading_factor, bandwidth_khz, coding_rate = MODEM_PRESETS[preset]
+    except KeyError:
+        raise ValueError(f"Неизвестный пресет модема: {preset}")
+
+    symbol_ms = (2 ** spreading_factor) / bandwidth_khz
+    low_data_rate = 1 if symbol_ms > 16 else 0
+    length = payload_bytes + PACKET_OVERHEAD_BYTES
+
+    preamble_ms = (PREAMBLE_SYMBOLS + 4.25) * symbol_ms
+    numerator = 8 * length - 4 * spreading_factor + 28 + 16
+    denominator = 4 * (spreading_factor - 2 * low_data_rate)
+    payload_symbols = 8 + max(math.ceil(numerator / denominator) * coding_rate, 0)
+    return preamble_ms + payload_symbols * symbol_ms
@@ -0,0 +1,64 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class AsyncDatabase:
+    """Неблокирующий доступ к Database из цикла asyncio
+
+    Каждый вызов выполняется в отдельном пуле потоков, поэтому медленный
+    запрос не останавливает обработку остальных чатов. Database использует
+    сессию на единицу работы, так что вызовы из разных потоков безопасны.
+    """
+
+    def __init__(self, database, max_workers: int = 4):
+        self.database = database
+        self.logger = logging.getLogger(__name__)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнение синхронной функции в пуле потоков БД"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def add_user(self, chat_id, username, first_name, last_name, is_admin=False):
+        return await self.run(self.database.add_user, chat_id, username, first_name, last_name, is_admin)
+
+    async def get_user(self, chat_id):
+        return await self.run(self.database.get_user, chat_id)
+
+    async def get_recipient_ids(self):
+        cached = self.database.cached_recipient_ids()
+        if cached is not None:
+            return cached
+        return await self.run(self.database.get_recipient_ids)
+
+    async def set_user_flags(self, chat_id, is_admin=None, is_approved=None):
+        return await self.run(self.database.set_user_flags, chat_id, is_admin, is_approved)
+
+    async def query_nodes(self, page=0, page_size=10, node_filter=None, hours=24, battery_threshold=20):
+        return await self.run(self.database.query_nodes, page, page_size, node_filter, hours, battery_threshold)
+
+    async def query_telemetry(self, node_id, hours=24):
+        return await self.run(self.database.query_telemetry, node_id, hours)
+    
+    async def query_track(self, node_id, hours=24):
+        return await self.run(self.database.query_track, node_id, hours)
+    
+    async def nodes_within(self, latitude, longitude, radius_km, hours=24):
+        return await self.run(self.database.nodes_within, latitude, longitude, radius_km, hours)
+    
+    async def find_node(self, query):
+        return await self.run(self.database.find_node, query)
+    
+    async def get_stats(self):
+        return await self.run(self.database.get_stats)
+
+    async def log_message(self, direction, chat_id, content, mesh_node=None, message_type='text'):
+        return await self.run(self.database.log_message, direction, chat_id, content, mesh_node, message_type)
+
+    def shutdown(self):
+        """Ожидание завершения начатых запросов"""
+        self.executor.shutdown(wait=True)
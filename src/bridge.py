@@ -2,13 +2,19 @@ import logging
 import asyncio
 import os
 import yaml
-from typing import Dict, Any
+from typing import Dict, Any, Callable, Optional
 from datetime import datetime
-from queue import Queue
 
 from .mqtt_client import MeshtasticMQTTClient
 from .telegram_bot import TelegramBot
 from .models import Database
+from .channel import AsyncMessageChannel
+from .digest import AdminDigest
+from .chunking import FrameAssembler
+from .coalesce import TextCoalescer
+from .routing import RoutingTable
+from .outbound import AirtimeScheduler, SubmitResult
+from .packets import Packet, TextPacket, PositionPacket, NodeInfoPacket, TelemetryPacket
 
 class MeshtasticTelegramBridge:
     def __init__(self, config_path: str = "config/config.yaml"):
@@ -20,17 +26,69 @@ class MeshtasticTelegramBridge:
         self.logger.info("Инициализация Meshtastic-Telegram Bridge...")
         
         # Очередь для передачи сообщений из MQTT в Telegram
-        self.message_queue = Queue()
+        self.message_queue = AsyncMessageChannel()
         
         # Инициализация компонентов
         try:
-            self.database = Database(self.config.get('database', {}).get('url', 'sqlite:///storage/database.db'))
+            database_config = self.config.get('database', {})
+            self.database = Database(
+                database_config.get('url', 'sqlite:///storage/database.db'),
+                database_config
+            )
         except Exception as e:
             self.logger.error(f"Ошибка инициализации базы данных: {e}")
             raise
         
+        # Маршруты между каналами Mesh и чатами Telegram
+        self.routing = RoutingTable(self.config.get('routing'))
+        
         self.mqtt_client = MeshtasticMQTTClient(self.config)
-        self.telegram_bot = TelegramBot(self.config, self.database, self.message_queue)
+        self.telegram_bot = TelegramBot(self.config, self.database, self.message_queue, self.routing)
+        
+        # Отправка в Mesh с учетом бюджета эфира
+        outbound_config = self.config['mqtt'].get('outbound', {})
+        self.outbound = None
+        if outbound_config.get('enabled', True):
+            self.outbound = AirtimeScheduler(
+                self._send_to_mesh,
+                modem_preset=outbound_config.get('modem_preset', 'LONG_FAST'),
+                duty_cycle=outbound_config.get('duty_cycle', 0.1),
+                burst_ms=outbound_config.get('burst_ms', 10000),
+                max_queue=outbound_config.get('max_queue', 100),
+                max_per_user=outbound_config.get('max_per_user', 5),
+                max_wait=outbound_config.get('max_wait', 600),
+                max_payload_bytes=outbound_config.get('max_payload_bytes', 200),
+                drain_timeout=outbound_config.get('drain_timeout', 5.0)
+            )
+        
+        # Сводка событий узлов для администраторов
+        digest_config = self.config['bridge'].get('admin_digest', {})
+        self.admin_digest = AdminDigest(
+            lambda text: self.message_queue.put(('notify_admins', text)),
+            window=digest_config.get('window', 300),
+            battery_low=digest_config.get('battery_low', 20),
+            battery_recovered=digest_config.get('battery_recovered', 30),
+            position_min_move_km=digest_config.get('position_min_move_km', 0.5),
+            name_resolver=self._node_name
+        )
+        
+        # Сборка длинных сообщений из Mesh, разбитых на фрагменты
+        frames_config = self.config['bridge'].get('frames', {})
+        self.frame_assembler = FrameAssembler(
+            timeout=frames_config.get('reassembly_timeout', 60),
+            on_expired=self._forward_text
+        )
+        
+        # Серия коротких сообщений узла уходит в Telegram одним сообщением
+        coalesce_config = self.config['bridge'].get('coalesce', {})
+        self.coalescer = TextCoalescer(
+            self._broadcast_text,
+            window=coalesce_config.get('window', 3.0),
+            max_delay=coalesce_config.get('max_delay', 15.0),
+            max_chars=coalesce_config.get('max_chars', 3500)
+        )
+        
+        self._intake_stopped = False
         
         # Регистрация обработчиков
         self._register_handlers()
@@ -86,48 +144,128 @@ class MeshtasticTelegramBridge:
     
     def _register_handlers(self):
         """Регистрация обработчиков событий"""
+        # Обработчики пакетов Mesh по типу сообщения
+        self.packet_handlers: Dict[str, Callable[[Packet], None]] = {
+            'text': self._handle_text_message,
+            'position': self._handle_position_message,
+            'nodeinfo': self._handle_nodeinfo_message,
+            'telemetry': self._handle_telemetry_message,
+        }
+        
         # MQTT -> Telegram
         self.mqtt_client.add_message_handler(self._handle_mqtt_message)
         
         # Telegram -> MQTT
         self.telegram_bot.add_message_handler(self._handle_telegram_message)
+        
+        # Прием из Mesh останавливается, пока бот еще может доставить остаток
+        self.telegram_bot.add_stop_handler(self._stop_intake)
+        
+        # Статистика для /admin
+        if self.mqtt_client.deduplicator is not None:
+            self.telegram_bot.add_status_provider(self._dedup_status)
+        self.telegram_bot.add_status_provider(self._digest_status)
+        self.telegram_bot.add_status_provider(self._coalesce_status)
+        self.telegram_bot.add_status_provider(self._write_buffer_status)
+        self.telegram_bot.add_status_provider(self.routing.describe)
+        if self.outbound is not None:
+            self.telegram_bot.add_status_provider(self._outbound_status)
     
-    def _handle_mqtt_message(self, message_type: str, data: Dict, topic: str):
+    def register_packet_handler(self, message_type: str, handler: Callable[[Packet], None]):
+        """Регистрация обработчика пакетов заданного типа (порта)"""
+        self.packet_handlers[message_type] = handler
+    
+    def _dedup_status(self) -> str:
+        """Строка статуса дедупликации пакетов"""
+        stats = self.mqtt_client.deduplicator.stats()
+        return (
+            f"Дубликаты пакетов: {stats['hits']} из {stats['hits'] + stats['misses']} "
+            f"({stats['hit_ratio']:.0%}), в индексе {stats['size']}/{stats['capacity']}"
+        )
+    
+    def _digest_status(self) -> str:
+        """Строка статуса сводок администраторам"""
+        digest = self.admin_digest
+        return (
+            f"Сводки админам: отправлено {digest.digests}, событий {digest.events}, "
+            f"подавлено повторов {digest.suppressed}, в ожидании {digest.pending()}"
+        )
+    
+    def _coalesce_status(self) -> str:
+        """Строка статуса объединения сообщений из Mesh"""
+        coalescer = self.coalescer
+        return (
+            f"Сообщения из Mesh: получено {coalescer.received}, отправлено в Telegram "
+            f"{coalescer.emitted}, в ожидании {coalescer.pending()}"
+        )
+    
+    def _write_buffer_status(self) -> str:
+        """Строка статуса пакетной записи в БД"""
+        buffers = [buffer for buffer in (self.database.message_buffer, self.database.telemetry_buffer,
+                                         self.database.positions_buffer) if buffer is not None]
+        if not buffers:
+            return "Пакетная запись в БД: выключена"
+        return "Пакетная запись в БД: " + ", ".join(
+            f"{buffer.name} {buffer.flushed} (в буфере {len(buffer)}, повторов {buffer.retries}, "
+            f"отложено {buffer.dead_lettered})"
+            for buffer in buffers
+        )
+    
+    def _outbound_status(self) -> str:
+        """Строка статуса планировщика отправки в Mesh"""
+        stats = self.outbound.stats()
+        return (
+            f"Эфир ({self.outbound.modem_preset}, {self.outbound.duty_cycle:.0%}): "
+            f"за час {stats['airtime_last_hour_ms'] / 1000:.1f} с, бюджет {stats['budget_ms'] / 1000:.1f} с\n"
+            f"Очередь в Mesh: {stats['depth']} ({stats['users_waiting']} польз.), "
+            f"отправлено {stats['sent']}, объединено {stats['merged']}, "
+            f"отклонено {stats['rejected']}, просрочено {stats['expired']}, "
+            f"отброшено при остановке {stats['dropped']}, "
+            f"ср. ожидание {stats['avg_wait']:.1f} с"
+        )
+    
+    def _node_name(self, node_id: str):
+        names = self.database.get_node_names(node_id)
+        return names and (names[0] or names[1])
+    
+    def _handle_mqtt_message(self, message_type: str, packet: Packet, topic: str):
         """Обработка входящих MQTT сообщений"""
         try:
-            if message_type == 'text':
-                self._handle_text_message(data)
-            elif message_type == 'position':
-                self._handle_position_message(data)
-            elif message_type == 'nodeinfo':
-                self._handle_nodeinfo_message(data)
-            elif message_type == 'telemetry':
-                self._handle_telemetry_message(data)
+            handler = self.packet_handlers.get(message_type)
+            if handler is not None:
+                handler(packet)
                 
         except Exception as e:
             self.logger.error(f"Ошибка обработки MQTT сообщения: {e}")
     
-    def _handle_text_message(self, data: Dict):
+    def _handle_text_message(self, packet: TextPacket):
         """Обработка текстовых сообщений из Mesh"""
-        payload = data.get('payload', {})
-        text = payload.get('text', '')
-        from_node = data.get('from', 'unknown')
+        text = packet.text
+        from_node = packet.from_node
         
         if not text:
             return
         
-        # Получение информации об узле
-        node_info = f"Узел {from_node}"
-        if from_node in self.mqtt_client.mesh_nodes:
-            node_data = self.mqtt_client.mesh_nodes[from_node]
-            if 'user' in node_data:
-                node_info = node_data['user'].get('longName', f"Узел {from_node}")
-        
-        # Форматирование сообщения для Telegram
-        telegram_message = f"📡 {node_info}: {text}"
+        # Получатели в Telegram по каналу, шлюзу и адресату пакета
+        targets = self.routing.telegram_targets(
+            from_node, packet.to, packet.channel, packet.channel_name, packet.sender
+        )
+        if targets == ():
+            self.logger.debug(f"Нет маршрута для сообщения {from_node} (канал {packet.channel_name or packet.channel})")
+            return
+        source = (from_node, targets)
         
-        # Добавление сообщения в очередь для отправки в Telegram
-        self.message_queue.put(('broadcast', telegram_message))
+        # Фрагменты длинного сообщения пересылаются после сборки
+        text = self.frame_assembler.add(source, text)
+        if text is None:
+            return
+        self._forward_text(source, text)
+    
+    def _forward_text(self, source: tuple, text: str):
+        """Пересылка текста из Mesh в Telegram, source - (узел, получатели)"""
+        from_node = source[0]
+        # Сообщения узла копятся в окне объединения
+        self.coalescer.add(source, text)
         
         # Логирование
         try:
@@ -137,78 +275,99 @@ class MeshtasticTelegramBridge:
         
         self.logger.info(f"Сообщение из Mesh: {from_node} -> {text}")
     
-    def _handle_position_message(self, data: Dict):
-        """Обработка позиционных сообщений"""
-        payload = data.get('payload', {})
-        from_node = data.get('from', 'unknown')
+    def _broadcast_text(self, source: tuple, text: str):
+        """Постановка текста узла в очередь рассылки Telegram"""
+        from_node, targets = source
+        # Получение имени узла из реестра
+        node_info = self._node_name(from_node) or f"Узел {from_node}"
         
-        lat = payload.get('latitude')
-        lon = payload.get('longitude')
-        alt = payload.get('altitude', 0)
+        # Форматирование сообщения для Telegram
+        telegram_message = f"📡 {node_info}: {text}"
+        if targets is None:
+            self.message_queue.put(('broadcast', telegram_message))
+        else:
+            self.message_queue.put(('send_routed', (targets, telegram_message)))
+    
+    def _handle_position_message(self, packet: PositionPacket):
+        """Обработка позиционных сообщений"""
+        from_node = packet.from_node
+        lat = packet.latitude
+        lon = packet.longitude
+        alt = packet.altitude
         
         if lat and lon:
-            # Обновление информации об узле
-            self.database.update_node(from_node, {'position': payload})
-            
-            # Форматирование сообщения для Telegram
-            position_message = (
-                f"📍 Позиция от {from_node}:\n"
-                f"Широта: {lat:.6f}\n"
-                f"Долгота: {lon:.6f}\n"
-                f"Высота: {alt:.0f} м"
-            )
+            # Обновление информации об узле и истории координат
+            self.database.update_node(from_node, {'position': packet.as_position()})
+            self.database.log_position(from_node, lat, lon, alt)
             
-            # Отправка в Telegram (только админам) через очередь
-            self.message_queue.put(('notify_admins', position_message))
+            # Координаты доступны через /track и /near, в сводку админам - по настройке
+            if self.config['bridge'].get('position_notifications', False):
+                self.admin_digest.record_position(from_node, lat, lon)
             
             self.logger.info(f"Позиция от {from_node}: {lat}, {lon}")
     
-    def _handle_nodeinfo_message(self, data: Dict):
+    def _handle_nodeinfo_message(self, packet: NodeInfoPacket):
         """Обработка информации об узле"""
-        from_node = data.get('from', 'unknown')
-        payload = data.get('payload', {})
+        from_node = packet.from_node
+        user_info = packet.as_user()
         
-        # Сохранение информации об узле в mesh_nodes
-        if from_node not in self.mqtt_client.mesh_nodes:
-            self.mqtt_client.mesh_nodes[from_node] = {}
-        self.mqtt_client.mesh_nodes[from_node]['user'] = payload.get('user', {})
-        
-        # Обновление информации об узле в БД
+        # Обновление информации об узле в БД и реестре имен
         try:
-            self.database.update_node(from_node, {'user': payload})
+            self.database.update_node(from_node, {'user': user_info})
         except Exception as e:
             self.logger.error(f"Ошибка обновления информации об узле: {e}")
         
-        user_info = payload.get('user', {})
-        long_name = user_info.get('longName', from_node)
+        long_name = packet.long_name or from_node
         
         self.logger.info(f"Информация об узле: {long_name} ({from_node})")
     
-    def _handle_telemetry_message(self, data: Dict):
+    def _handle_telemetry_message(self, packet: TelemetryPacket):
         """Обработка телеметрии"""
-        from_node = data.get('from', 'unknown')
-        payload = data.get('payload', {})
-        
-        battery_level = payload.get('batteryLevel')
-        voltage = payload.get('voltage')
+        from_node = packet.from_node
+        battery_level = packet.battery_level
         
-        if battery_level and battery_level < 20:
-            # Уведомление о низком заряде батареи через очередь
-            warning_message = f"⚠️ Низкий заряд батареи у {from_node}: {battery_level}%"
-            self.message_queue.put(('notify_admins', warning_message))
+        # Низкий заряд попадает в сводку администраторам один раз до восстановления
+        if battery_level is not None:
+            self.admin_digest.record_battery(from_node, battery_level)
         
         # Обновление телеметрии в БД
         try:
-            self.database.update_node(from_node, {'deviceMetrics': payload})
+            if battery_level is not None:
+                self.database.update_node(from_node, {'deviceMetrics': packet.as_device_metrics()})
+            else:
+                self.database.update_node(from_node, {})
+            self.database.log_telemetry(from_node, packet.as_metrics())
         except Exception as e:
             self.logger.error(f"Ошибка обновления телеметрии: {e}")
     
     
-    def _handle_telegram_message(self, action: str, data: Dict):
+    def _handle_telegram_message(self, action: str, data: Dict) -> Optional[SubmitResult]:
         """Обработка сообщений из Telegram"""
-        if action == 'send_text':
-            self.mqtt_client.send_text_message(data['text'])
-        elif action == 'send_position':
+        kinds = {'send_text': 'text', 'send_position': 'position'}
+        kind = kinds.get(action)
+        if kind is None:
+            return None
+        if kind == 'text' and 'destination' not in data:
+            # Канал и адресат по маршруту чата (темы)
+            target = self.routing.mesh_target(data.get('chat_id'), data.get('thread_id'))
+            if target is None:
+                return SubmitResult(SubmitResult.REJECTED, reason='no_route')
+            data = dict(data, channel=target.channel, destination=target.destination)
+        # Длинный текст приходит нумерованными фрагментами
+        payloads = [dict(data, text=frame) for frame in data['frames']] if data.get('frames') else [data]
+        if self.outbound is None:
+            for payload in payloads:
+                self._send_to_mesh(kind, payload)
+            return SubmitResult(SubmitResult.SENT)
+        return self.outbound.submit_frames(data.get('user'), kind, payloads)
+    
+    def _send_to_mesh(self, kind: str, data: Dict):
+        """Публикация сообщения в MQTT (поток планировщика отправки)"""
+        if kind == 'text':
+            self.mqtt_client.send_text_message(
+                data['text'], data.get('destination', '^all'), data.get('channel', 0)
+            )
+        elif kind == 'position':
             self.mqtt_client.send_position(data['lat'], data['lon'])
     
     def run(self):
@@ -218,6 +377,11 @@ class MeshtasticTelegramBridge:
         try:
             # Подключение к MQTT
             self.mqtt_client.connect()
+            self.admin_digest.start()
+            self.frame_assembler.start()
+            self.coalescer.start()
+            if self.outbound is not None:
+                self.outbound.start()
             
             # Запуск Telegram бота (блокирующий, но с обработкой очереди)
             self.telegram_bot.run()
@@ -229,14 +393,34 @@ class MeshtasticTelegramBridge:
         finally:
             self.shutdown()
     
-    def shutdown(self):
-        """Корректное завершение работы"""
-        self.logger.info("Завершение работы...")
+    def _stop_intake(self):
+        """Остановка приема из MQTT и сброс накопленных текстов в очередь Telegram
+        
+        Вызывается из цикла бота до его завершения, чтобы очередь успела
+        доставить недособранные и накопленные тексты; повторный вызов ничего
+        не делает.
+        """
+        if self._intake_stopped:
+            return
+        self._intake_stopped = True
+        self.admin_digest.stop()
+        if self.outbound is not None:
+            self.outbound.stop()
         try:
             self.mqtt_client.disconnect()
         except Exception as e:
             self.logger.error(f"Ошибка при отключении от MQTT: {e}")
+        self.frame_assembler.stop()
+        self.coalescer.stop()
+    
+    def shutdown(self):
+        """Корректное завершение работы"""
+        self.logger.info("Завершение работы...")
+        # Обычно прием уже остановлен ботом; здесь - при ошибке запуска
+        self._stop_intake()
         try:
-            self.database.session.close()
+            # Сброс буфера журнала сообщений после остановки MQTT конвейера
+            self.database.flush()
+            self.database.close()
         except Exception as e:
             self.logger.error(f"Ошибка при закрытии БД: {e}")
\ No newline at end of file
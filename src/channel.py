@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class LatencyStats:
+    """Накопительная статистика задержек (мс)"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, value_ms: float):
+        self.count += 1
+        self.total_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def as_dict(self) -> Dict[str, float]:
+        avg = self.total_ms / self.count if self.count else 0.0
+        return {'count': self.count, 'avg_ms': round(avg, 3), 'max_ms': round(self.max_ms, 3)}
+
+
+class AsyncMessageChannel:
+    """Потокобезопасный канал MQTT -> Telegram на основе asyncio.Queue
+
+    Производители (потоки MQTT) вызывают put() из любого потока, элемент
+    передается в цикл событий через call_soon_threadsafe и сразу будит
+    потребителя. До привязки к циклу событий элементы копятся в буфере.
+    """
+
+    def __init__(self, max_batch: int = 100):
+        self.logger = logging.getLogger(__name__)
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: List[Tuple[float, Any]] = []
+
+        # Задержка передачи (постановка -> выборка) и доставки (постановка -> отправка)
+        self.handoff_latency = LatencyStats()
+        self.delivery_latency = LatencyStats()
+
+    def bind(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Привязка к циклу событий (вызывать из этого цикла)"""
+        with self._lock:
+            self._loop = loop or asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            for entry in self._pending:
+                self._queue.put_nowait(entry)
+            self._pending = []
+
+    def unbind(self):
+        """Отвязка от цикла событий при его остановке, недоставленное отбрасывается с записью в лог"""
+        with self._lock:
+            self._loop = None
+            dropped = len(self._pending) + (self._queue.qsize() if self._queue is not None else 0)
+            self._pending = []
+            self._queue = None
+        if dropped:
+            self.logger.warning(f"Канал Telegram закрыт, не доставлено сообщений: {dropped}")
+
+    def put(self, item: Any):
+        """Постановка элемента в канал (из любого потока)"""
+        entry = (time.monotonic(), item)
+        with self._lock:
+            loop, queue = self._loop, self._queue
+            if loop is None:
+                self._pending.append(entry)
+                return
+        try:
+            loop.call_soon_threadsafe(self._enqueue, queue, entry)
+        except RuntimeError as e:
+            # Цикл событий уже закрыт
+            self.logger.warning(f"Канал Telegram закрыт, сообщение отброшено: {e}")
+
+    def _enqueue(self, queue: asyncio.Queue, entry: Tuple[float, Any]):
+        """Помещение элемента в очередь (в цикле событий), если канал еще привязан к ней"""
+        if self._queue is not queue:
+            self.logger.warning("Канал Telegram закрыт, сообщение отброшено")
+            return
+        queue.put_nowait(entry)
+
+    def qsize(self) -> int:
+        with self._lock:
+            if self._queue is None:
+                return len(self._pending)
+            return self._queue.qsize()
+
+    async def get_batch(self) -> List[Tuple[float, Any]]:
+        """Ожидание элемента и выборка всего, что уже накопилось"""
+        batch = [await self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+        now = time.monotonic()
+        for enqueued_at, _ in batch:
+            self.handoff_latency.add((now - enqueued_at) * 1000)
+        return batch
+
+    def mark_delivered(self, enqueued_at: float):
+        """Фиксация задержки доставки элемента, выбранного get_batch"""
+        self.delivery_latency.add((time.monotonic() - enqueued_at) * 1000)
+        queue = self._queue
+        if queue is not None:
+            queue.task_done()
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Ожидание доставки всех поставленных элементов, False - не успели за timeout"""
+        # Элементы, поставленные из потоков, попадают в очередь следующей итерацией цикла
+        await asyncio.sleep(0)
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'depth': self.qsize(),
+            'handoff': self.handoff_latency.as_dict(),
+            'delivery': self.delivery_latency.as_dict(),
+        }
@@ -0,0 +1,206 @@
+import logging
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Номер фрагмента в начале текста: "[2/5] ..."
+FRAME_PREFIX_RE = re.compile(r'^\[(\d{1,2})/(\d{1,2})\] ')
+MAX_FRAMES = 99
+MISSING_FRAME = '…'
+
+
+def utf8_len(text: str) -> int:
+    """Длина текста в байтах UTF-8"""
+    return len(text.encode('utf-8'))
+
+
+def _char_bytes(char: str) -> int:
+    code = ord(char)
+    if code < 0x80:
+        return 1
+    if code < 0x800:
+        return 2
+    if code < 0x10000:
+        return 3
+    return 4
+
+
+def _split(text: str, limit: int) -> List[str]:
+    """Разбиение на части не длиннее limit байт по границам слов
+
+    Пробел, на котором сделан разрыв, остается в конце части, поэтому
+    исходный текст восстанавливается простой конкатенацией.
+    """
+    parts = []
+    start, length = 0, len(text)
+    while start < length:
+        end, size = start, 0
+        while end < length:
+            char_size = _char_bytes(text[end])
+            if size + char_size > limit:
+                break
+            size += char_size
+            end += 1
+        if end < length:
+            cut = max(text.rfind(' ', start, end), text.rfind('\n', start, end))
+            if cut > start:
+                end = cut + 1
+        parts.append(text[start:end])
+        start = end
+    return parts
+
+
+def split_frames(text: str, max_bytes: int = 200, max_frames: int = 8) -> Tuple[List[str], bool]:
+    """Нумерованные фрагменты текста не длиннее max_bytes байт UTF-8
+
+    Возвращает (фрагменты, обрезан ли текст). Короткий текст возвращается
+    без номера. Если фрагментов больше max_frames, последний заканчивается
+    многоточием, а остаток отбрасывается.
+    """
+    if utf8_len(text) <= max_bytes:
+        return [text], False
+    max_frames = min(max_frames, MAX_FRAMES)
+
+    # Ширина номера зависит от числа фрагментов, а оно - от ширины
+    digits = 1
+    while True:
+        prefix_bytes = len(f"[{'9' * digits}/{'9' * digits}] ")
+        limit = max_bytes - prefix_bytes
+        if limit < 4:
+            raise ValueError("max_bytes слишком мал для нумерованных фрагментов")
+        parts = _split(text, limit)
+        total = min(len(parts), max_frames)
+        if len(str(total)) <= digits:
+            break
+        digits = len(str(total))
+
+    truncated = len(parts) > max_frames
+    if truncated:
+        parts = parts[:max_frames]
+        ellipsis_bytes = utf8_len(MISSING_FRAME)
+        last = parts[-1]
+        while last and utf8_len(last) + ellipsis_bytes > limit:
+            last = last[:-1]
+        parts[-1] = last.rstrip() + MISSING_FRAME
+
+    total = len(parts)
+    return [f"[{index}/{total}] {part}" for index, part in enumerate(parts, 1)], truncated
+
+
+def parse_frame(text: str) -> Optional[Tuple[int, int, str]]:
+    """(номер, всего, текст) для нумерованного фрагмента, иначе None"""
+    match = FRAME_PREFIX_RE.match(text)
+    if not match:
+        return None
+    index, total = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= total or total < 2:
+        return None
+    return index, total, text[match.end():]
+
+
+class _PendingMessage:
+    """Полученные фрагменты одного сообщения"""
+
+    __slots__ = ('total', 'parts', 'started')
+
+    def __init__(self, total: int):
+        self.total = total
+        self.parts: Dict[int, str] = {}
+        self.started = time.monotonic()
+
+    def text(self) -> str:
+        return ''.join(self.parts.get(index, MISSING_FRAME) for index in range(1, self.total + 1))
+
+
+class FrameAssembler:
+    """Сборка нумерованных фрагментов из Mesh в исходные сообщения
+
+    Фрагменты копятся по отправителю и числу частей. Собранное сообщение
+    возвращается из add(); неполное по истечении `timeout` секунд передается
+    в `on_expired` с многоточием на месте потерянных частей.
+    """
+
+    def __init__(self, timeout: float = 60.0,
+                 on_expired: Optional[Callable[[str, str], None]] = None):
+        self.logger = logging.getLogger(__name__)
+        self.timeout = timeout
+        self.on_expired = on_expired
+        self._pending: Dict[Tuple[str, int], _PendingMessage] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.assembled = 0
+        self.incomplete = 0
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='frame-assembler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        # Недособранные сообщения не теряются при остановке
+        self.expire(force=True)
+
+    def add(self, sender: str, text: str) -> Optional[str]:
+        """Текст для отправки: обычное или собранное сообщение, None - ждем остальные части"""
+        frame = parse_frame(text)
+        if frame is None:
+            return text
+        index, total, part = frame
+        key = (sender, total)
+        expired = None
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None and index in pending.parts:
+                # Повтор номера - началось новое сообщение, старое уже не дополнится
+                expired = self._pending.pop(key)
+                self.incomplete += 1
+                pending = None
+            if pending is None:
+                pending = self._pending[key] = _PendingMessage(total)
+            pending.parts[index] = part
+            complete = len(pending.parts) == total
+            if complete:
+                del self._pending[key]
+                self.assembled += 1
+        if expired is not None:
+            self._emit(sender, expired)
+        return pending.text() if complete else None
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def expire(self, force: bool = False) -> int:
+        """Передача неполных сообщений старше timeout (или всех при force)"""
+        now = time.monotonic()
+        with self._lock:
+            keys = [key for key, pending in self._pending.items()
+                    if force or now - pending.started >= self.timeout]
+            expired = [(key[0], self._pending.pop(key)) for key in keys]
+            self.incomplete += len(expired)
+        for sender, pending in expired:
+            self._emit(sender, pending)
+        return len(expired)
+
+    def _emit(self, sender: str, pending: _PendingMessage):
+        self.logger.warning(
+            f"Сообщение от {sender} собрано не полностью: {len(pending.parts)} из {pending.total} частей"
+        )
+        if self.on_expired is None:
+            return
+        try:
+            self.on_expired(sender, pending.text())
+        except Exception as e:
+            self.logger.error(f"Ошибка отправки неполного сообщения: {e}")
+
+    def _run(self):
+        interval = max(1.0, self.timeout / 4)
+        while not self._stop_event.wait(interval):
+            self.expire()
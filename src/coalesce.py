@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class _SenderBuffer:
+    """Тексты одного узла, ожидающие отправки"""
+
+    __slots__ = ('texts', 'size', 'first_at', 'last_at')
+
+    def __init__(self, now: float):
+        self.texts: List[str] = []
+        self.size = 0
+        self.first_at = now
+        self.last_at = now
+
+
+class TextCoalescer:
+    """Объединение серии сообщений одного узла в одно сообщение Telegram
+
+    Первый текст серии передается сразу, без задержки. Следующие тексты
+    того же узла копятся и уходят одним сообщением, когда узел молчит
+    `window` секунд, первый из них ждет дольше `max_delay` или объединенный
+    текст превысил бы `max_chars`. При window <= 0 или без запущенного
+    потока (до start и после stop) тексты передаются сразу.
+    """
+
+    def __init__(self, emit: Callable[[str, str], None], window: float = 3.0,
+                 max_delay: float = 15.0, max_chars: int = 3500):
+        self.logger = logging.getLogger(__name__)
+        self.emit = emit
+        self.window = window
+        self.max_delay = max(max_delay, window)
+        self.max_chars = max_chars
+
+        self._buffers: Dict[str, _SenderBuffer] = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.received = 0
+        self.emitted = 0
+
+    def start(self):
+        if self.window <= 0:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='text-coalescer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+            with self._condition:
+                self._thread = None
+        self.flush()
+
+    def add(self, sender: str, text: str):
+        """Добавление текста узла в окно объединения"""
+        ready = None
+        with self._condition:
+            self.received += 1
+            if self.window <= 0 or self._thread is None:
+                ready = text
+            else:
+                now = time.monotonic()
+                buffer = self._buffers.get(sender)
+                if buffer is None:
+                    # Начало серии: текст уходит сразу, окно ловит продолжение
+                    self._buffers[sender] = _SenderBuffer(now)
+                    self._condition.notify_all()
+                    ready = text
+                else:
+                    if buffer.texts and buffer.size + 1 + len(text) > self.max_chars:
+                        # Текст не помещается - накопленное уходит отдельным сообщением
+                        ready = "\n".join(buffer.texts)
+                        buffer.texts, buffer.size = [], 0
+                    if not buffer.texts:
+                        buffer.first_at = now
+                    buffer.texts.append(text)
+                    buffer.size += len(text) + (1 if len(buffer.texts) > 1 else 0)
+                    buffer.last_at = now
+        if ready is not None:
+            self._emit(sender, ready)
+
+    def pending(self) -> int:
+        with self._condition:
+            return sum(len(buffer.texts) for buffer in self._buffers.values())
+
+    def flush(self, force: bool = True) -> int:
+        """Отправка накопленного (при force=False - только с истекшим окном)"""
+        now = time.monotonic()
+        with self._condition:
+            senders = [sender for sender, buffer in self._buffers.items()
+                       if force or self._deadline(buffer) <= now]
+            # Серия без продолжения просто закрывается
+            ready = [(sender, "\n".join(buffer.texts))
+                     for sender, buffer in ((sender, self._buffers.pop(sender)) for sender in senders)
+                     if buffer.texts]
+        for sender, text in ready:
+            self._emit(sender, text)
+        return len(ready)
+
+    def _deadline(self, buffer: _SenderBuffer) -> float:
+        return min(buffer.last_at + self.window, buffer.first_at + self.max_delay)
+
+    def _emit(self, sender: str, text: str):
+        try:
+            self.emit(sender, text)
+            self.emitted += 1
+        except Exception as e:
+            self.logger.error(f"Ошибка отправки объединенного сообщения: {e}")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                if self._buffers:
+                    nearest = min(self._deadline(buffer) for buffer in self._buffers.values())
+                    timeout = nearest - time.monotonic()
+                    if timeout > 0:
+                        self._condition.wait(timeout)
+                        continue
+                else:
+                    self._condition.wait()
+                    continue
+            self.flush(force=False)
@@ -0,0 +1,66 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+
+class PacketDeduplicator:
+    """Индекс недавно обработанных пакетов (from, id) с ограничением по времени
+
+    Один и тот же пакет приходит от каждого шлюза, который его услышал.
+    Индекс - LRU фиксированной емкости: записи старше ttl считаются
+    устаревшими, при переполнении вытесняются самые старые.
+    """
+
+    def __init__(self, capacity: int = 10000, ttl: float = 600.0):
+        if capacity < 1:
+            raise ValueError("capacity должен быть положительным")
+        self.capacity = capacity
+        self.ttl = ttl
+        self._seen: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def seen(self, key: Hashable) -> bool:
+        """True - пакет уже обрабатывался, иначе он запоминается"""
+        now = time.monotonic()
+        with self._lock:
+            received_at = self._seen.get(key)
+            if received_at is not None and now - received_at < self.ttl:
+                self.hits += 1
+                return True
+
+            self.misses += 1
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+            self._expire(now)
+            return False
+
+    def _expire(self, now: float):
+        """Удаление устаревших записей и вытеснение сверх емкости"""
+        seen = self._seen
+        while seen:
+            key, received_at = next(iter(seen.items()))
+            if len(seen) <= self.capacity and now - received_at < self.ttl:
+                break
+            seen.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._seen)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._seen),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
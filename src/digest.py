@@ -0,0 +1,174 @@
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from .geo import haversine_km
+
+
+class _NodePositions:
+    """Позиции узла, накопленные за окно"""
+
+    __slots__ = ('count', 'first', 'last')
+
+    def __init__(self, position: Tuple[float, float]):
+        self.count = 1
+        self.first = position
+        self.last = position
+
+
+class AdminDigest:
+    """Сводка событий узлов для администраторов
+
+    События (позиция, низкий заряд) копятся по узлам и раз в `window`
+    секунд отправляются одним сообщением. Повторы подавляются с гистерезисом:
+    - низкий заряд сообщается при переходе ниже `battery_low` и снова - только
+      после восстановления до `battery_recovered`;
+    - позиция попадает в сводку, если узел сместился больше чем на
+      `position_min_move_km` от последней отправленной позиции.
+    """
+
+    def __init__(self, send: Callable[[str], None], window: float = 300.0,
+                 battery_low: int = 20, battery_recovered: int = 30,
+                 position_min_move_km: float = 0.5,
+                 name_resolver: Optional[Callable[[str], Optional[str]]] = None):
+        if battery_recovered < battery_low:
+            raise ValueError("battery_recovered должен быть не меньше battery_low")
+        self.logger = logging.getLogger(__name__)
+        self.send = send
+        self.window = window
+        self.battery_low = battery_low
+        self.battery_recovered = battery_recovered
+        self.position_min_move_km = position_min_move_km
+        self.name_resolver = name_resolver
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Состояние гистерезиса
+        self._low_battery_nodes = set()
+        self._reported_positions: Dict[str, Tuple[float, float]] = {}
+
+        # События текущего окна
+        self._battery_events: Dict[str, int] = {}
+        self._recovered_events: Dict[str, int] = {}
+        self._positions: Dict[str, _NodePositions] = {}
+
+        self.events = 0
+        self.suppressed = 0
+        self.digests = 0
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='admin-digest', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def record_battery(self, node_id: str, level) -> bool:
+        """Учет заряда батареи, True - событие попадет в сводку"""
+        if level is None:
+            return False
+        with self._lock:
+            if node_id in self._low_battery_nodes:
+                if level >= self.battery_recovered:
+                    self._low_battery_nodes.discard(node_id)
+                    self._battery_events.pop(node_id, None)
+                    self._recovered_events[node_id] = level
+                    self.events += 1
+                    return True
+                if node_id in self._battery_events:
+                    # Уточнение значения в пределах окна
+                    self._battery_events[node_id] = min(self._battery_events[node_id], level)
+                self.suppressed += 1
+                return False
+            if level < self.battery_low:
+                self._low_battery_nodes.add(node_id)
+                self._recovered_events.pop(node_id, None)
+                self._battery_events[node_id] = level
+                self.events += 1
+                return True
+            return False
+
+    def record_position(self, node_id: str, latitude: float, longitude: float) -> bool:
+        """Учет позиции, True - позиция попадет в сводку"""
+        position = (latitude, longitude)
+        with self._lock:
+            pending = self._positions.get(node_id)
+            if pending is not None:
+                pending.count += 1
+                pending.last = position
+                return True
+            reported = self._reported_positions.get(node_id)
+            if reported is not None and haversine_km(*reported, *position) < self.position_min_move_km:
+                self.suppressed += 1
+                return False
+            self._positions[node_id] = _NodePositions(position)
+            self.events += 1
+            return True
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._battery_events) + len(self._recovered_events) + len(self._positions)
+
+    def flush(self) -> Optional[str]:
+        """Формирование и отправка сводки за окно, None - событий не было"""
+        with self._lock:
+            battery_events, self._battery_events = self._battery_events, {}
+            recovered_events, self._recovered_events = self._recovered_events, {}
+            positions, self._positions = self._positions, {}
+            for node_id, pending in positions.items():
+                self._reported_positions[node_id] = pending.last
+
+        if not (battery_events or recovered_events or positions):
+            return None
+
+        text = self.render(battery_events, recovered_events, positions)
+        try:
+            self.send(text)
+            self.digests += 1
+        except Exception as e:
+            self.logger.error(f"Ошибка отправки сводки администраторам: {e}")
+        return text
+
+    def render(self, battery_events: Dict[str, int], recovered_events: Dict[str, int],
+               positions: Dict[str, _NodePositions]) -> str:
+        lines = [f"📋 Сводка за {self.window / 60:g} мин"]
+        if battery_events:
+            lines.append("")
+            lines.append("⚠️ Низкий заряд батареи:")
+            for node_id, level in sorted(battery_events.items(), key=lambda item: item[1]):
+                lines.append(f"• {self._name(node_id)}: {level}%")
+        if recovered_events:
+            lines.append("")
+            lines.append("✅ Заряд восстановлен:")
+            for node_id, level in sorted(recovered_events.items()):
+                lines.append(f"• {self._name(node_id)}: {level}%")
+        if positions:
+            lines.append("")
+            lines.append("📍 Позиции узлов:")
+            for node_id, pending in sorted(positions.items()):
+                line = f"• {self._name(node_id)}: {pending.last[0]:.5f}, {pending.last[1]:.5f}"
+                if pending.count > 1:
+                    moved = haversine_km(*pending.first, *pending.last)
+                    line += f" ({pending.count} пакетов, смещение {moved:.2f} км)"
+                lines.append(line)
+        return "\n".join(lines)
+
+    def _name(self, node_id: str) -> str:
+        if self.name_resolver is not None:
+            try:
+                name = self.name_resolver(node_id)
+                if name:
+                    return f"{name} ({node_id})"
+            except Exception:
+                pass
+        return node_id
+
+    def _run(self):
+        while not self._stop_event.wait(self.window):
+            self.flush()
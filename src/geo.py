@@ -0,0 +1,21 @@
+import math
+from typing import Sequence, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по поверхности Земли в километрах"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def track_length_km(points: Sequence[Tuple[float, float]]) -> float:
+    """Длина ломаной по последовательности (lat, lon)"""
+    return sum(
+        haversine_km(lat1, lon1, lat2, lon2)
+        for (lat1, lon1), (lat2, lon2) in zip(points, points[1:])
+    )
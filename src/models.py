@@ -1,8 +1,19 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text, Float
+from sqlalchemy import create_engine, event, insert, update, delete, case, func, or_, Column, Index, Integer, String, DateTime, Boolean, Text, Float
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from sqlalchemy.pool import StaticPool
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import logging
+import threading
+
+from .write_buffer import WriteBehindBuffer
+from .node_cache import NodeState, NodeStateCache
+from .spatial_index import NodeSpatialIndex
+from .telemetry import TELEMETRY_METRICS, ROLLUP_MINUTE, ROLLUP_HOUR, aggregate_rollups
 
 Base = declarative_base()
 
@@ -24,12 +35,12 @@ class Message(Base):
     __tablename__ = 'messages'
     
     id = Column(Integer, primary_key=True)
-    direction = Column(String(10))  # 'to_mesh' или 'from_mesh'
+    direction = Column(String(10), index=True)  # 'to_mesh' или 'from_mesh'
     chat_id = Column(Integer)
-    mesh_node = Column(String(50))
+    mesh_node = Column(String(50), index=True)
     content = Column(Text)
     message_type = Column(String(20))  # 'text', 'position', 'command'
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
 
 class MeshNode(Base):
     __tablename__ = 'mesh_nodes'
@@ -39,99 +50,728 @@ class MeshNode(Base):
     long_name = Column(String(100))
     short_name = Column(String(50))
     hardware_model = Column(String(50))
-    last_seen = Column(DateTime)
+    last_seen = Column(DateTime, index=True)
     battery_level = Column(Integer)
     latitude = Column(Float)
     longitude = Column(Float)
     altitude = Column(Float)
     message_count = Column(Integer, default=0)
 
+class BridgeStat(Base):
+    """Предвычисленные счетчики для /stats"""
+    __tablename__ = 'bridge_stats'
+    
+    key = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class TelemetrySample(Base):
+    """Значения телеметрии: строка на метрику, хранение по (узел, метрика, время)"""
+    __tablename__ = 'telemetry_samples'
+    __table_args__ = (
+        Index('ix_telemetry_samples_ts', 'ts'),
+        {'sqlite_with_rowid': False},
+    )
+    
+    node_id = Column(String(50), primary_key=True)
+    metric = Column(String(30), primary_key=True)
+    ts = Column(DateTime, primary_key=True)
+    value = Column(Float, nullable=False)
+
+class TelemetryRollup(Base):
+    """Агрегаты телеметрии за 1 минуту и 1 час"""
+    __tablename__ = 'telemetry_rollups'
+    __table_args__ = (
+        Index('ix_telemetry_rollups_resolution_bucket', 'resolution', 'bucket'),
+        {'sqlite_with_rowid': False},
+    )
+    
+    node_id = Column(String(50), primary_key=True)
+    metric = Column(String(30), primary_key=True)
+    resolution = Column(Integer, primary_key=True)  # шаг в секундах
+    bucket = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False)
+    min_value = Column(Float, nullable=False)
+    max_value = Column(Float, nullable=False)
+
+class PositionSample(Base):
+    """История координат узлов для /track"""
+    __tablename__ = 'position_history'
+    __table_args__ = (
+        Index('ix_position_history_node_ts', 'node_id', 'ts'),
+        Index('ix_position_history_ts', 'ts'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    node_id = Column(String(50), nullable=False)
+    ts = Column(DateTime, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    altitude = Column(Float)
+
+# Счетчики и запросы для их начального заполнения
+STAT_COUNTERS = {
+    'messages_to_mesh': lambda session: session.query(Message).filter_by(direction='to_mesh').count(),
+    'messages_from_mesh': lambda session: session.query(Message).filter_by(direction='from_mesh').count(),
+    'users_total': lambda session: session.query(User).count(),
+    'users_active': lambda session: session.query(User).filter(User.last_active != None).count(),
+}
+
 class Database:
-    def __init__(self, db_url):
+    def __init__(self, db_url, options: Optional[Dict[str, Any]] = None):
+        self.logger = logging.getLogger(__name__)
+        options = options or {}
         try:
-            self.engine = create_engine(db_url, echo=False)
+            self.engine = self._create_engine(db_url, options)
             Base.metadata.create_all(self.engine)
-            Session = sessionmaker(bind=self.engine)
-            self.session = Session()
-            self.logger = logging.getLogger(__name__)
+            # Сессия создается на каждую единицу работы, объекты остаются
+            # доступными для чтения после закрытия сессии
+            self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
             self.logger.info(f"Подключение к базе данных: {db_url}")
+            
+            # Счетчики статистики в памяти, синхронные с таблицей bridge_stats
+            self._counters_lock = threading.Lock()
+            self.counters = self._load_counters()
+            
+            # Кэш получателей рассылки, сбрасывается при изменении пользователей
+            self._recipients_lock = threading.Lock()
+            self._recipients: Optional[frozenset] = None
+            self._recipients_generation = 0
+            
+            # Отложенная пакетная запись журнала сообщений
+            self.message_buffer = None
+            buffer_config = options.get('log_buffer', {})
+            if buffer_config.get('enabled', True):
+                self.message_buffer = WriteBehindBuffer(
+                    self._write_messages,
+                    name='message-log',
+                    max_batch=buffer_config.get('max_batch', 100),
+                    flush_interval=buffer_config.get('flush_interval', 2.0),
+                    durability=buffer_config.get('durability', 'journal'),
+                    journal_path=buffer_config.get('journal_path', 'storage/message_log.journal'),
+                    **self._retry_options(buffer_config)
+                )
+                self.message_buffer.start()
+            
+            # Состояния узлов обновляются в памяти и сбрасываются пачками
+            cache_config = options.get('node_cache', {})
+            self.node_cache_enabled = cache_config.get('enabled', True)
+            self.node_cache = NodeStateCache(
+                self._upsert_nodes,
+                flush_interval=cache_config.get('flush_interval', 10.0),
+                capacity=cache_config.get('capacity', 2000),
+                load_func=self._load_node_state
+            )
+            with self.session_scope() as session:
+                recent = (
+                    session.query(MeshNode)
+                    .order_by(MeshNode.last_seen.desc())
+                    .limit(self.node_cache.capacity)
+                )
+                self.node_cache.load([NodeState.from_row(node) for node in reversed(recent.all())])
+            if self.node_cache_enabled:
+                self.node_cache.start()
+            
+            # Сетка последних координат узлов для поиска ближайших
+            index_config = options.get('node_index', {})
+            self.node_index = NodeSpatialIndex(index_config.get('cell_size', 0.1))
+            with self.session_scope() as session:
+                positions = session.query(MeshNode.node_id, MeshNode.latitude, MeshNode.longitude).filter(
+                    MeshNode.latitude.isnot(None), MeshNode.longitude.isnot(None)
+                )
+                for node_id, latitude, longitude in positions:
+                    self.node_index.update(node_id, latitude, longitude)
+            
+            # История телеметрии: пакетная запись, агрегаты и очистка
+            telemetry_config = options.get('telemetry', {})
+            retention = telemetry_config.get('retention', {})
+            self.telemetry_retention = {
+                'raw': timedelta(days=retention.get('raw_days', 7)),
+                ROLLUP_MINUTE: timedelta(days=retention.get('minute_days', 30)),
+                ROLLUP_HOUR: timedelta(days=retention.get('hour_days', 365)),
+            }
+            self.telemetry_prune_interval = telemetry_config.get('prune_interval', 3600)
+            self._pruned_at: Dict[str, datetime] = {}
+            self.telemetry_buffer = None
+            if telemetry_config.get('enabled', True):
+                self.telemetry_buffer = WriteBehindBuffer(
+                    self._write_telemetry,
+                    name='telemetry',
+                    max_batch=telemetry_config.get('max_batch', 200),
+                    flush_interval=telemetry_config.get('flush_interval', 5.0),
+                    durability=telemetry_config.get('durability', 'none'),
+                    journal_path=telemetry_config.get('journal_path', 'storage/telemetry.journal'),
+                    **self._retry_options(telemetry_config)
+                )
+                self.telemetry_buffer.start()
+            
+            # История координат узлов
+            positions_config = options.get('positions', {})
+            self.positions_retention = timedelta(days=positions_config.get('retention_days', 30))
+            self.positions_prune_interval = positions_config.get('prune_interval', 3600)
+            self.positions_buffer = None
+            if positions_config.get('enabled', True):
+                self.positions_buffer = WriteBehindBuffer(
+                    self._write_positions,
+                    name='positions',
+                    max_batch=positions_config.get('max_batch', 200),
+                    flush_interval=positions_config.get('flush_interval', 5.0),
+                    durability=positions_config.get('durability', 'none'),
+                    journal_path=positions_config.get('journal_path', 'storage/positions.journal'),
+                    **self._retry_options(positions_config)
+                )
+                self.positions_buffer.start()
         except Exception as e:
-            self.logger = logging.getLogger(__name__)
             self.logger.error(f"Ошибка подключения к базе данных: {e}")
             raise
     
+    @staticmethod
+    def _retry_options(config: Dict[str, Any]) -> Dict[str, Any]:
+        """Параметры повторов и отложенных записей буфера пакетной записи"""
+        return {
+            'max_retries': config.get('max_retries', 5),
+            'retry_backoff': config.get('retry_backoff', 1.0),
+            'max_backoff': config.get('max_backoff', 60.0),
+            'dead_letter_path': config.get('dead_letter_path'),
+            # Недоступность или блокировка БД повторяется, а не откладывается
+            'transient_errors': (OperationalError,),
+        }
+    
+    def _create_engine(self, db_url: str, options: Dict[str, Any]):
+        """Создание движка с настройками пула под тип базы"""
+        url = make_url(db_url)
+        busy_timeout = options.get('busy_timeout', 5.0)
+        
+        if url.get_backend_name() != 'sqlite':
+            return create_engine(
+                db_url,
+                echo=False,
+                pool_size=options.get('pool_size', 5),
+                max_overflow=options.get('max_overflow', 10),
+                pool_pre_ping=True,
+                pool_recycle=options.get('pool_recycle', 3600)
+            )
+        
+        in_memory = url.database in (None, '', ':memory:')
+        engine_args = {
+            'echo': False,
+            # Соединения используются из потоков MQTT и цикла asyncio
+            'connect_args': {'check_same_thread': False, 'timeout': busy_timeout},
+        }
+        if in_memory:
+            # Одна общая база в памяти для всех потоков
+            engine_args['poolclass'] = StaticPool
+        else:
+            engine_args['pool_size'] = options.get('pool_size', 5)
+            engine_args['max_overflow'] = options.get('max_overflow', 10)
+        engine = create_engine(db_url, **engine_args)
+        
+        @event.listens_for(engine, "connect")
+        def _configure_sqlite(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            if not in_memory:
+                # WAL позволяет читать параллельно с записью
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+            cursor.close()
+        
+        return engine
+    
+    @contextmanager
+    def session_scope(self):
+        """Сессия на единицу работы с фиксацией или откатом"""
+        session = self.Session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    
     def add_user(self, chat_id, username, first_name, last_name, is_admin=False):
         try:
-            user = self.session.query(User).filter_by(chat_id=chat_id).first()
-            if not user:
-                user = User(
-                    chat_id=chat_id,
-                    username=username,
-                    first_name=first_name,
-                    last_name=last_name,
-                    is_admin=is_admin
-                )
-                self.session.add(user)
-                self.session.commit()
-                self.logger.info(f"Добавлен новый пользователь: {first_name} (ID: {chat_id})")
-            return user
+            with self.session_scope() as session:
+                user = session.query(User).filter_by(chat_id=chat_id).first()
+                if not user:
+                    user = User(
+                        chat_id=chat_id,
+                        username=username,
+                        first_name=first_name,
+                        last_name=last_name,
+                        is_admin=is_admin
+                    )
+                    session.add(user)
+                    session.flush()
+                    self._bump_counters(session, {'users_total': 1, 'users_active': 1})
+                    event.listen(session, "after_commit", lambda session: self.invalidate_recipients(), once=True)
+                    self.logger.info(f"Добавлен новый пользователь: {first_name} (ID: {chat_id})")
+                return user
         except Exception as e:
             self.logger.error(f"Ошибка при добавлении пользователя: {e}")
-            self.session.rollback()
             raise
     
-    def log_message(self, direction, chat_id, content, mesh_node=None, message_type='text'):
+    def set_user_flags(self, chat_id, is_admin=None, is_approved=None) -> bool:
+        """Изменение прав и одобрения пользователя"""
+        values = {}
+        if is_admin is not None:
+            values['is_admin'] = is_admin
+        if is_approved is not None:
+            values['is_approved'] = is_approved
+        if not values:
+            return False
+        
         try:
-            message = Message(
-                direction=direction,
-                chat_id=chat_id,
-                mesh_node=mesh_node,
-                content=content,
-                message_type=message_type
+            with self.session_scope() as session:
+                result = session.execute(update(User).where(User.chat_id == chat_id).values(**values))
+            self.invalidate_recipients()
+            return result.rowcount > 0
+        except Exception as e:
+            self.logger.error(f"Ошибка при изменении пользователя {chat_id}: {e}")
+            raise
+    
+    def get_recipient_ids(self) -> frozenset:
+        """Chat ID одобренных пользователей для рассылки (из кэша)"""
+        with self._recipients_lock:
+            if self._recipients is not None:
+                return self._recipients
+            generation = self._recipients_generation
+        
+        with self.session_scope() as session:
+            recipients = frozenset(
+                chat_id for (chat_id,) in
+                session.query(User.chat_id).filter(User.is_approved.is_not(False))
             )
-            self.session.add(message)
-            
-            if direction == 'to_mesh':
-                user = self.session.query(User).filter_by(chat_id=chat_id).first()
-                if user:
-                    user.message_count += 1
-                    user.last_active = datetime.utcnow()
+        
+        with self._recipients_lock:
+            # Кэш не сохраняется, если его сбросили во время загрузки
+            if generation == self._recipients_generation:
+                self._recipients = recipients
+        return recipients
+    
+    def cached_recipient_ids(self) -> Optional[frozenset]:
+        """Получатели без обращения к БД, None если кэш пуст"""
+        with self._recipients_lock:
+            return self._recipients
+    
+    def invalidate_recipients(self):
+        with self._recipients_lock:
+            self._recipients = None
+            self._recipients_generation += 1
+    
+    def get_user(self, chat_id):
+        with self.session_scope() as session:
+            return session.query(User).filter_by(chat_id=chat_id).first()
+    
+    def query_nodes(self, page: int = 0, page_size: int = 10, node_filter: Optional[str] = None,
+                    hours: float = 24, battery_threshold: int = 20) -> Tuple[List[MeshNode], int]:
+        """Страница узлов, отсортированных по времени последней активности
+        
+        Фильтры: 'active' - активны за последние `hours` часов,
+        'position' - есть координаты, 'lowbat' - заряд ниже `battery_threshold`.
+        Возвращает узлы страницы и общее число узлов под фильтром.
+        """
+        # Сброс накопленных изменений, чтобы выборка совпадала с памятью
+        self.node_cache.flush()
+        
+        with self.session_scope() as session:
+            query = session.query(MeshNode)
+            if node_filter == 'active':
+                query = query.filter(MeshNode.last_seen >= datetime.utcnow() - timedelta(hours=hours))
+            elif node_filter == 'position':
+                query = query.filter(MeshNode.latitude != None, MeshNode.longitude != None)
+            elif node_filter == 'lowbat':
+                query = query.filter(MeshNode.battery_level != None, MeshNode.battery_level < battery_threshold)
             
-            self.session.commit()
+            total = query.count()
+            nodes = (
+                query.order_by(MeshNode.last_seen.desc().nulls_last(), MeshNode.id)
+                .limit(page_size)
+                .offset(page * page_size)
+                .all()
+            )
+            return nodes, total
+    
+    def get_stats(self) -> Dict[str, int]:
+        with self._counters_lock:
+            return {
+                'to_mesh': self.counters['messages_to_mesh'],
+                'from_mesh': self.counters['messages_from_mesh'],
+                'total_users': self.counters['users_total'],
+                'active_users': self.counters['users_active'],
+                'total_nodes': len(self.node_cache),
+            }
+    
+    def _load_counters(self) -> Dict[str, int]:
+        """Загрузка счетчиков, недостающие заполняются однократным подсчетом"""
+        with self.session_scope() as session:
+            counters = {stat.key: stat.value for stat in session.query(BridgeStat)}
+            for key, count_query in STAT_COUNTERS.items():
+                if key not in counters:
+                    counters[key] = count_query(session)
+                    session.add(BridgeStat(key=key, value=counters[key]))
+            return counters
+    
+    def _bump_counters(self, session, deltas: Dict[str, int]):
+        """Увеличение счетчиков в той же транзакции, что и данные"""
+        for key, delta in deltas.items():
+            if not delta:
+                continue
+            session.execute(
+                update(BridgeStat).where(BridgeStat.key == key).values(value=BridgeStat.value + delta)
+            )
+        
+        # Память обновляется после фиксации транзакции
+        @event.listens_for(session, "after_commit", once=True)
+        def _apply(session):
+            with self._counters_lock:
+                for key, delta in deltas.items():
+                    self.counters[key] = self.counters.get(key, 0) + delta
+    
+    def log_message(self, direction, chat_id, content, mesh_node=None, message_type='text'):
+        entry = {
+            'direction': direction,
+            'chat_id': chat_id,
+            'mesh_node': mesh_node,
+            'content': content,
+            'message_type': message_type,
+            'timestamp': datetime.utcnow(),
+        }
+        try:
+            if self.message_buffer is not None:
+                self.message_buffer.add(entry)
+            else:
+                self._write_messages([entry])
         except Exception as e:
             self.logger.error(f"Ошибка при логировании сообщения: {e}")
-            self.session.rollback()
+    
+    def _write_messages(self, entries: List[Dict[str, Any]]):
+        """Запись пачки сообщений и счетчиков пользователей одной транзакцией"""
+        user_activity: Dict[int, List] = {}
+        deltas = {'messages_to_mesh': 0, 'messages_from_mesh': 0}
+        for entry in entries:
+            counter = f"messages_{entry['direction']}"
+            if counter in deltas:
+                deltas[counter] += 1
+            if entry['direction'] == 'to_mesh':
+                activity = user_activity.setdefault(entry['chat_id'], [0, entry['timestamp']])
+                activity[0] += 1
+                activity[1] = max(activity[1], entry['timestamp'])
+        
+        with self.session_scope() as session:
+            session.execute(insert(Message), entries)
+            for chat_id, (count, last_active) in user_activity.items():
+                session.execute(
+                    update(User)
+                    .where(User.chat_id == chat_id)
+                    .values(message_count=User.message_count + count, last_active=last_active)
+                )
+            self._bump_counters(session, deltas)
+    
+    def flush(self):
+        """Принудительный сброс отложенных записей"""
+        if self.message_buffer is not None:
+            self.message_buffer.flush()
+        if self.telemetry_buffer is not None:
+            self.telemetry_buffer.flush()
+        if self.positions_buffer is not None:
+            self.positions_buffer.flush()
+        self.node_cache.flush()
+    
+    def _load_node_state(self, node_id: str) -> Optional[NodeState]:
+        """Состояние узла из БД для промаха кэша узлов"""
+        with self.session_scope() as session:
+            node = session.query(MeshNode).filter_by(node_id=node_id).first()
+            return NodeState.from_row(node) if node else None
+    
+    def get_node_names(self, node_id: str):
+        """Имена узла (long_name, short_name) или None, если узел неизвестен"""
+        return self.node_cache.names(node_id)
     
     def update_node(self, node_id, node_data):
         try:
-            node = self.session.query(MeshNode).filter_by(node_id=node_id).first()
-            if not node:
-                node = MeshNode(node_id=node_id)
-                self.session.add(node)
-            
-            if 'user' in node_data:
-                user_info = node_data['user']
-                if isinstance(user_info, dict):
-                    node.long_name = user_info.get('longName')
-                    node.short_name = user_info.get('shortName')
-                    node.hardware_model = user_info.get('hwModel')
-            
-            if 'position' in node_data:
-                pos = node_data['position']
-                if isinstance(pos, dict):
-                    node.latitude = pos.get('latitude')
-                    node.longitude = pos.get('longitude')
-                    node.altitude = pos.get('altitude')
-            
-            if 'deviceMetrics' in node_data:
-                metrics = node_data['deviceMetrics']
-                if isinstance(metrics, dict):
-                    node.battery_level = metrics.get('batteryLevel')
-            
-            node.last_seen = datetime.utcnow()
-            self.session.commit()
-            return node
+            state = self.node_cache.apply(node_id, node_data)
+            if 'position' in node_data and state.latitude is not None and state.longitude is not None:
+                self.node_index.update(node_id, state.latitude, state.longitude)
+            if not self.node_cache_enabled:
+                self.node_cache.flush()
+            return state
         except Exception as e:
             self.logger.error(f"Ошибка при обновлении узла {node_id}: {e}")
-            self.session.rollback()
-            raise
\ No newline at end of file
+            raise
+    
+    def _dialect_insert(self, model):
+        """INSERT с поддержкой ON CONFLICT или None, если СУБД его не поддерживает"""
+        dialect = self.engine.dialect.name
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            return None
+        return dialect_insert(model)
+    
+    def _upsert_nodes(self, rows: List[Dict[str, Any]]):
+        """Запись пачки состояний узлов одним upsert"""
+        statement = self._dialect_insert(MeshNode)
+        if statement is not None:
+            statement = statement.on_conflict_do_update(
+                index_elements=[MeshNode.node_id],
+                set_={name: statement.excluded[name] for name in NodeState.FIELDS}
+            )
+            with self.session_scope() as session:
+                session.execute(statement, rows)
+            return
+        
+        # Универсальный вариант для остальных СУБД
+        with self.session_scope() as session:
+            existing = {
+                node.node_id: node for node in
+                session.query(MeshNode).filter(MeshNode.node_id.in_([row['node_id'] for row in rows]))
+            }
+            for row in rows:
+                node = existing.get(row['node_id'])
+                if node is None:
+                    session.add(MeshNode(**row))
+                else:
+                    for name in NodeState.FIELDS:
+                        setattr(node, name, row[name])
+    
+    def log_telemetry(self, node_id: str, metrics: Dict[str, Any], ts: Optional[datetime] = None):
+        """Добавление значений телеметрии узла в историю"""
+        ts = ts or datetime.utcnow()
+        try:
+            for metric, value in metrics.items():
+                if metric not in TELEMETRY_METRICS or not isinstance(value, (int, float)):
+                    continue
+                entry = {'node_id': node_id, 'metric': metric, 'ts': ts, 'value': float(value)}
+                if self.telemetry_buffer is not None:
+                    self.telemetry_buffer.add(entry)
+                else:
+                    self._write_telemetry([entry])
+        except Exception as e:
+            self.logger.error(f"Ошибка при записи телеметрии {node_id}: {e}")
+    
+    def _write_telemetry(self, samples: List[Dict[str, Any]]):
+        """Запись пачки значений и обновление агрегатов одной транзакцией"""
+        unique = {(sample['node_id'], sample['metric'], sample['ts']): sample for sample in samples}
+        
+        with self.session_scope() as session:
+            # Агрегаты строятся только по новым значениям: повтор пачки не учитывается дважды
+            samples = self._new_samples(session, unique)
+            if not samples:
+                return
+            rollups = aggregate_rollups(samples)
+            statement = self._dialect_insert(TelemetrySample)
+            if statement is not None:
+                session.execute(statement.on_conflict_do_nothing(), samples)
+                statement = self._dialect_insert(TelemetryRollup)
+                excluded = statement.excluded
+                statement = statement.on_conflict_do_update(
+                    index_elements=['node_id', 'metric', 'resolution', 'bucket'],
+                    set_={
+                        'count': TelemetryRollup.count + excluded.count,
+                        'total': TelemetryRollup.total + excluded.total,
+                        'min_value': case(
+                            (excluded.min_value < TelemetryRollup.min_value, excluded.min_value),
+                            else_=TelemetryRollup.min_value
+                        ),
+                        'max_value': case(
+                            (excluded.max_value > TelemetryRollup.max_value, excluded.max_value),
+                            else_=TelemetryRollup.max_value
+                        ),
+                    }
+                )
+                session.execute(statement, rollups)
+            else:
+                self._merge_telemetry(session, samples, rollups)
+        
+        self._prune_if_due('telemetry', self.prune_telemetry, self.telemetry_prune_interval)
+    
+    def _new_samples(self, session, unique: Dict[Tuple[str, str, datetime], Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Значения пачки, которых еще нет в таблице"""
+        timestamps = [key[2] for key in unique]
+        stored = session.query(TelemetrySample.node_id, TelemetrySample.metric, TelemetrySample.ts).filter(
+            TelemetrySample.node_id.in_({key[0] for key in unique}),
+            TelemetrySample.ts.between(min(timestamps), max(timestamps))
+        )
+        existing = {tuple(row) for row in stored}
+        return [sample for key, sample in unique.items() if key not in existing]
+    
+    def _merge_telemetry(self, session, samples: List[Dict[str, Any]], rollups: List[Dict[str, Any]]):
+        """Универсальная запись телеметрии для СУБД без ON CONFLICT"""
+        session.add_all(TelemetrySample(**sample) for sample in samples)
+        for row in rollups:
+            key = (row['node_id'], row['metric'], row['resolution'], row['bucket'])
+            rollup = session.get(TelemetryRollup, key)
+            if rollup is None:
+                session.add(TelemetryRollup(**row))
+                continue
+            rollup.count += row['count']
+            rollup.total += row['total']
+            rollup.min_value = min(rollup.min_value, row['min_value'])
+            rollup.max_value = max(rollup.max_value, row['max_value'])
+    
+    def _prune_if_due(self, name: str, prune: Callable[[datetime], int], interval: float):
+        """Очистка истории не чаще одного раза за interval секунд"""
+        now = datetime.utcnow()
+        pruned_at = self._pruned_at.get(name)
+        if pruned_at and (now - pruned_at).total_seconds() < interval:
+            return
+        self._pruned_at[name] = now
+        try:
+            prune(now)
+        except Exception as e:
+            self.logger.error(f"Ошибка очистки истории {name}: {e}")
+    
+    def prune_telemetry(self, now: Optional[datetime] = None) -> int:
+        """Удаление значений и агрегатов старше срока хранения"""
+        now = now or datetime.utcnow()
+        with self.session_scope() as session:
+            removed = session.execute(
+                delete(TelemetrySample).where(TelemetrySample.ts < now - self.telemetry_retention['raw'])
+            ).rowcount
+            for resolution in (ROLLUP_MINUTE, ROLLUP_HOUR):
+                removed += session.execute(
+                    delete(TelemetryRollup)
+                    .where(TelemetryRollup.resolution == resolution)
+                    .where(TelemetryRollup.bucket < now - self.telemetry_retention[resolution])
+                ).rowcount
+        if removed:
+            self.logger.info(f"Удалено устаревших записей телеметрии: {removed}")
+        return removed
+    
+    def query_telemetry(self, node_id: str, hours: float = 24) -> Tuple[int, Dict[str, List[TelemetryRollup]]]:
+        """Агрегаты телеметрии узла за период по метрикам
+        
+        До 6 часов используются минутные агрегаты, дальше - часовые,
+        поэтому объем чтения не зависит от длины истории.
+        """
+        if self.telemetry_buffer is not None:
+            self.telemetry_buffer.flush()
+        
+        resolution = ROLLUP_MINUTE if hours <= 6 else ROLLUP_HOUR
+        since = datetime.utcnow() - timedelta(hours=hours)
+        series: Dict[str, List[TelemetryRollup]] = {}
+        with self.session_scope() as session:
+            rollups = (
+                session.query(TelemetryRollup)
+                .filter(TelemetryRollup.node_id == node_id)
+                .filter(TelemetryRollup.resolution == resolution)
+                .filter(TelemetryRollup.bucket >= since)
+                .order_by(TelemetryRollup.metric, TelemetryRollup.bucket)
+            )
+            for rollup in rollups:
+                series.setdefault(rollup.metric, []).append(rollup)
+        return resolution, series
+    
+    def log_position(self, node_id: str, latitude: float, longitude: float,
+                     altitude: Optional[float] = None, ts: Optional[datetime] = None):
+        """Добавление координат узла в историю"""
+        entry = {
+            'node_id': node_id,
+            'ts': ts or datetime.utcnow(),
+            'latitude': latitude,
+            'longitude': longitude,
+            'altitude': altitude,
+        }
+        try:
+            if self.positions_buffer is not None:
+                self.positions_buffer.add(entry)
+            else:
+                self._write_positions([entry])
+        except Exception as e:
+            self.logger.error(f"Ошибка при записи позиции {node_id}: {e}")
+    
+    def _write_positions(self, entries: List[Dict[str, Any]]):
+        with self.session_scope() as session:
+            session.execute(insert(PositionSample), entries)
+        self._prune_if_due('positions', self.prune_positions, self.positions_prune_interval)
+    
+    def prune_positions(self, now: Optional[datetime] = None) -> int:
+        """Удаление координат старше срока хранения"""
+        now = now or datetime.utcnow()
+        with self.session_scope() as session:
+            removed = session.execute(
+                delete(PositionSample).where(PositionSample.ts < now - self.positions_retention)
+            ).rowcount
+        if removed:
+            self.logger.info(f"Удалено устаревших координат: {removed}")
+        return removed
+    
+    def query_track(self, node_id: str, hours: float = 24) -> List[PositionSample]:
+        """Координаты узла за период в порядке времени"""
+        if self.positions_buffer is not None:
+            self.positions_buffer.flush()
+        
+        since = datetime.utcnow() - timedelta(hours=hours)
+        with self.session_scope() as session:
+            return (
+                session.query(PositionSample)
+                .filter(PositionSample.node_id == node_id)
+                .filter(PositionSample.ts >= since)
+                .order_by(PositionSample.ts)
+                .all()
+            )
+    
+    def nearest_nodes(self, latitude: float, longitude: float, k: int = 5,
+                      max_km: Optional[float] = None, hours: Optional[float] = 24) -> List[Tuple[str, float]]:
+        """k ближайших узлов по последним координатам: (node_id, км)
+        
+        hours - только узлы, от которых были пакеты за этот период (None - все).
+        """
+        accept = None
+        if hours is not None:
+            since = datetime.utcnow() - timedelta(hours=hours)
+            
+            def accept(node_id: str) -> bool:
+                last_seen = self.node_cache.last_seen(node_id)
+                return last_seen is not None and last_seen >= since
+        return self.node_index.nearest(latitude, longitude, k, max_km, accept)
+    
+    def nodes_within(self, latitude: float, longitude: float, radius_km: float,
+                     hours: float = 24) -> List[Tuple[NodeState, float]]:
+        """Узлы, последняя позиция которых в радиусе radius_km, ближние первыми
+        
+        Поиск идет по тому же индексу последних координат, что и
+        nearest_nodes, поэтому /near и ответ на присланное местоположение
+        не расходятся.
+        """
+        result = []
+        for node_id, distance in self.nearest_nodes(latitude, longitude, len(self.node_index), radius_km, hours):
+            state = self.node_cache.get(node_id)
+            if state is not None:
+                result.append((state, distance))
+        return result
+    
+    def find_node(self, query: str) -> Optional[NodeState]:
+        """Поиск узла по ID (!abcd1234) или имени без учета регистра"""
+        state = self.node_cache.get(query)
+        if state is not None:
+            return state
+        query = query.casefold()
+        for state in self.node_cache.all():
+            if query in ((state.long_name or '').casefold(), (state.short_name or '').casefold()):
+                return state
+        
+        # Узел мог быть вытеснен из памяти
+        self.node_cache.flush()
+        with self.session_scope() as session:
+            node = session.query(MeshNode).filter(
+                or_(func.lower(MeshNode.long_name) == query, func.lower(MeshNode.short_name) == query)
+            ).order_by(MeshNode.last_seen.desc()).first()
+            node_id = node.node_id if node else None
+        return self.node_cache.get(node_id) if node_id else None
+    
+    def close(self):
+        """Сброс отложенных записей и закрытие всех соединений пула"""
+        if self.message_buffer is not None:
+            self.message_buffer.stop()
+        if self.telemetry_buffer is not None:
+            self.telemetry_buffer.stop()
+        if self.positions_buffer is not None:
+            self.positions_buffer.stop()
+        self.node_cache.stop()
+        self.engine.dispose()
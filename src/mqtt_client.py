@@ -4,12 +4,40 @@ import paho.mqtt.client as mqtt
 from typing import Callable, Dict, Any
 import ssl
 
+from .pipeline import IngestPipeline
+from .packet_codec import PacketDecoder
+from .packets import build_packet
+from .topic_router import TopicRouter
+from .dedup import PacketDeduplicator
+
 class MeshtasticMQTTClient:
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.logger = logging.getLogger(__name__)
         self.message_handlers = []
-        self.mesh_nodes: Dict[str, Dict[str, Any]] = {}  # Хранение информации об узлах
+        
+        # Декодер JSON и protobuf (ServiceEnvelope) топиков
+        self.decoder = PacketDecoder(config['mqtt'])
+        self.router = TopicRouter()
+        
+        # Один пакет публикуют все услышавшие его шлюзы
+        dedup_config = config['mqtt'].get('dedup', {})
+        self.deduplicator = None
+        if dedup_config.get('enabled', True):
+            self.deduplicator = PacketDeduplicator(
+                capacity=dedup_config.get('capacity', 10000),
+                ttl=dedup_config.get('ttl', 600.0)
+            )
+        
+        # Конвейер обработки: поток paho только ставит сообщения в очередь
+        ingest_config = config['mqtt'].get('ingest', {})
+        self.pipeline = IngestPipeline(
+            self._process_message,
+            workers=ingest_config.get('workers', 2),
+            queue_size=ingest_config.get('queue_size', 1000),
+            overflow_policy=ingest_config.get('overflow_policy', 'drop_oldest'),
+            block_timeout=ingest_config.get('block_timeout', 1.0)
+        )
         
         # MQTT клиент
         self.client = mqtt.Client(client_id=config['mqtt']['client_id'])
@@ -52,19 +80,38 @@ class MeshtasticMQTTClient:
         self.logger.debug(f"Успешная подписка (mid: {mid})")
     
     def _on_message(self, client, userdata, msg):
+        self.logger.debug(f"Получено MQTT сообщение: {msg.topic}")
+        self.pipeline.submit(msg.topic, msg.payload)
+    
+    def _process_message(self, topic: str, payload: bytes):
+        """Декодирование и диспетчеризация сообщения (рабочий поток конвейера)"""
         try:
-            self.logger.debug(f"Получено MQTT сообщение: {msg.topic}")
-            
-            # Парсинг JSON
-            data = json.loads(msg.payload.decode('utf-8'))
+            # Декодирование по формату топика (JSON или protobuf)
+            topic_info = self.router.parse(topic)
+            data = self.decoder.decode(topic, payload, topic_info.fmt)
+            if data is None:
+                return
             
             # Определение типа сообщения
-            message_type = self._get_message_type(msg.topic, data)
+            message_type = self.router.message_type(topic, data)
+            packet = build_packet(message_type, data)
+            if packet is None:
+                return
+            if packet.channel_name is None:
+                packet.channel_name = topic_info.channel
+            if packet.sender is None:
+                packet.sender = topic_info.gateway
+            
+            # Повторы того же пакета от других шлюзов пропускаются
+            if self.deduplicator is not None and packet.packet_id:
+                if self.deduplicator.seen((packet.from_node, packet.packet_id)):
+                    self.logger.debug(f"Дубликат пакета {packet.packet_id} от {packet.from_node}: {topic}")
+                    return
             
             # Вызов обработчиков
             for handler in self.message_handlers:
                 try:
-                    handler(message_type, data, msg.topic)
+                    handler(message_type, packet, topic)
                 except Exception as e:
                     self.logger.error(f"Ошибка в обработчике сообщений: {e}")
                     
@@ -79,27 +126,14 @@ class MeshtasticMQTTClient:
         else:
             self.logger.info("Отключение от MQTT брокера")
     
-    def _get_message_type(self, topic: str, data: Dict) -> str:
-        """Определение типа сообщения"""
-        if 'text' in topic or data.get('type') == 'sendtext':
-            return 'text'
-        elif 'position' in topic or data.get('type') == 'position':
-            return 'position'
-        elif 'telemetry' in topic:
-            return 'telemetry'
-        elif 'nodeinfo' in topic:
-            return 'nodeinfo'
-        else:
-            return 'unknown'
-    
-    def send_text_message(self, text: str, destination: str = "^all"):
-        """Отправка текстового сообщения в Mesh"""
+    def send_text_message(self, text: str, destination: str = "^all", channel: int = 0):
+        """Отправка текстового сообщения в Mesh (destination - узел для личного сообщения)"""
         try:
             message = {
                 "type": "sendtext",
                 "text": text,
                 "destination": destination,
-                "channel": 0
+                "channel": channel
             }
             
             topic = self.config['mqtt']['topics']['publish']
@@ -133,6 +167,7 @@ class MeshtasticMQTTClient:
     def connect(self):
         """Подключение к MQTT брокеру"""
         try:
+            self.pipeline.start()
             self.client.connect(
                 self.config['mqtt']['host'],
                 self.config['mqtt']['port'],
@@ -146,4 +181,5 @@ class MeshtasticMQTTClient:
     def disconnect(self):
         """Отключение от MQTT брокера"""
         self.client.loop_stop()
-        self.client.disconnect()
\ No newline at end of file
+        self.client.disconnect()
+        self.pipeline.stop()
\ No newline at end of file
@@ -0,0 +1,223 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class NodeState:
+    """Состояние узла сети в памяти (зеркало строки mesh_nodes)"""
+
+    FIELDS = (
+        'long_name', 'short_name', 'hardware_model', 'last_seen', 'battery_level',
+        'latitude', 'longitude', 'altitude', 'message_count'
+    )
+    __slots__ = ('node_id',) + FIELDS
+
+    def __init__(self, node_id: str, **fields):
+        self.node_id = node_id
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+        if self.message_count is None:
+            self.message_count = 0
+
+    @classmethod
+    def from_row(cls, row) -> 'NodeState':
+        return cls(row.node_id, **{name: getattr(row, name) for name in cls.FIELDS})
+
+    def as_row(self) -> Dict[str, Any]:
+        row = {name: getattr(self, name) for name in self.FIELDS}
+        row['node_id'] = self.node_id
+        return row
+
+    def copy(self) -> 'NodeState':
+        return NodeState(self.node_id, **{name: getattr(self, name) for name in self.FIELDS})
+
+    def apply(self, node_data: Dict[str, Any]):
+        """Применение данных из пакета (та же логика, что была в update_node)"""
+        if 'user' in node_data:
+            user_info = node_data['user']
+            if isinstance(user_info, dict):
+                self.long_name = user_info.get('longName')
+                self.short_name = user_info.get('shortName')
+                self.hardware_model = user_info.get('hwModel')
+
+        if 'position' in node_data:
+            pos = node_data['position']
+            if isinstance(pos, dict):
+                self.latitude = pos.get('latitude')
+                self.longitude = pos.get('longitude')
+                self.altitude = pos.get('altitude')
+
+        if 'deviceMetrics' in node_data:
+            metrics = node_data['deviceMetrics']
+            if isinstance(metrics, dict):
+                self.battery_level = metrics.get('batteryLevel')
+
+        self.last_seen = datetime.utcnow()
+
+
+class NodeStateCache:
+    """Таблица состояний узлов в памяти с периодическим сбросом в БД
+
+    Частые обновления (позиция, телеметрия, nodeinfo) только меняют
+    запись в памяти и помечают узел как измененный. Фоновый поток раз в
+    `flush_interval` секунд записывает все измененные узлы одним upsert.
+
+    При `capacity` в памяти остается не больше capacity узлов: вытесняются
+    записанные в БД узлы, к которым дольше всего не обращались. Промах
+    по вытесненному узлу читается через `load_func` и снова кэшируется.
+    """
+
+    def __init__(self, flush_func: Callable[[List[Dict[str, Any]]], None], flush_interval: float = 10.0,
+                 capacity: Optional[int] = None,
+                 load_func: Optional[Callable[[str], Optional[NodeState]]] = None):
+        if capacity is not None and capacity < 1:
+            raise ValueError("capacity должен быть положительным")
+        self.logger = logging.getLogger(__name__)
+        self.flush_func = flush_func
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.load_func = load_func
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # Порядок - от давно не использованных к недавним
+        self._nodes: "OrderedDict[str, NodeState]" = OrderedDict()
+        self._dirty = set()
+        self._thread: Optional[threading.Thread] = None
+
+        self.updates = 0
+        self.flushed = 0
+        self.evictions = 0
+        self.misses = 0
+
+    def load(self, states: List[NodeState]):
+        """Начальная загрузка состояний из БД, состояния передаются от старых к новым"""
+        with self._lock:
+            for state in states:
+                self._nodes[state.node_id] = state
+                self._nodes.move_to_end(state.node_id)
+            self._evict()
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='node-cache', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка с финальным сбросом измененных узлов"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def apply(self, node_id: str, node_data: Dict[str, Any]) -> NodeState:
+        """Обновление узла в памяти, возвращает копию состояния"""
+        state = self._lookup(node_id)
+        with self._lock:
+            # Вытесненный узел дополняется сохраненным в БД состоянием
+            state = self._nodes.get(node_id) or state or NodeState(node_id)
+            self._nodes[node_id] = state
+            self._nodes.move_to_end(node_id)
+            state.apply(node_data)
+            self._dirty.add(node_id)
+            self.updates += 1
+            self._evict()
+            return state.copy()
+
+    def get(self, node_id: str) -> Optional[NodeState]:
+        state = self._lookup(node_id)
+        return state.copy() if state else None
+
+    def names(self, node_id: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """(long_name, short_name) узла без копирования состояния"""
+        state = self._lookup(node_id)
+        return (state.long_name, state.short_name) if state else None
+
+    def last_seen(self, node_id: str) -> Optional[datetime]:
+        """Время последнего пакета узла без копирования состояния"""
+        state = self._lookup(node_id)
+        return state.last_seen if state else None
+
+    def all(self) -> List[NodeState]:
+        """Узлы, находящиеся в памяти"""
+        with self._lock:
+            return [state.copy() for state in self._nodes.values()]
+
+    def _lookup(self, node_id: str) -> Optional[NodeState]:
+        """Состояние из памяти, при промахе - из БД через load_func"""
+        with self._lock:
+            state = self._nodes.get(node_id)
+            if state is not None:
+                self._nodes.move_to_end(node_id)
+                return state
+            self.misses += 1
+        if self.load_func is None:
+            return None
+
+        try:
+            loaded = self.load_func(node_id)
+        except Exception as e:
+            self.logger.error(f"Ошибка чтения состояния узла {node_id}: {e}")
+            return None
+        if loaded is None:
+            return None
+        with self._lock:
+            # Пока шло чтение, узел мог обновиться в памяти
+            state = self._nodes.setdefault(node_id, loaded)
+            self._nodes.move_to_end(node_id)
+            self._evict()
+            return state
+
+    def _evict(self):
+        """Вытеснение записанных в БД узлов сверх capacity (под self._lock)"""
+        if self.capacity is None or len(self._nodes) <= self.capacity:
+            return
+        excess = len(self._nodes) - self.capacity
+        victims = []
+        for node_id in self._nodes:
+            if len(victims) == excess:
+                break
+            # Измененные узлы остаются в памяти до сброса
+            if node_id not in self._dirty:
+                victims.append(node_id)
+        for node_id in victims:
+            del self._nodes[node_id]
+        self.evictions += len(victims)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._nodes)
+
+    def dirty_count(self) -> int:
+        with self._lock:
+            return len(self._dirty)
+
+    def flush(self):
+        """Запись всех измененных узлов одной транзакцией"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                dirty = self._dirty
+                self._dirty = set()
+                rows = [self._nodes[node_id].as_row() for node_id in dirty]
+
+            try:
+                self.flush_func(rows)
+            except Exception as e:
+                self.logger.error(f"Ошибка сброса состояний узлов, узлов: {len(rows)}: {e}")
+                with self._lock:
+                    self._dirty |= dirty
+                return
+
+            self.flushed += len(rows)
+            with self._lock:
+                self._evict()
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
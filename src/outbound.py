@@ -0,0 +1,327 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+from .airtime import airtime_ms
+
+
+class OutboundMessage:
+    """Сообщение в очереди отправки в Mesh"""
+
+    __slots__ = ('user', 'kind', 'payload', 'size', 'airtime', 'enqueued_at', 'merged', 'continued', 'mergeable')
+
+    def __init__(self, user: Hashable, kind: str, payload: Dict[str, Any], size: int, airtime: float):
+        self.user = user
+        self.kind = kind
+        self.payload = payload
+        self.size = size
+        self.airtime = airtime
+        self.enqueued_at = time.monotonic()
+        self.merged = 1
+        # Фрагмент длинного сообщения: следующий фрагмент идет сразу за ним
+        self.continued = False
+        self.mergeable = True
+
+
+class SubmitResult:
+    """Результат постановки сообщения в очередь"""
+
+    SENT = 'sent'
+    QUEUED = 'queued'
+    MERGED = 'merged'
+    REJECTED = 'rejected'
+
+    __slots__ = ('status', 'wait', 'reason')
+
+    def __init__(self, status: str, wait: float = 0.0, reason: Optional[str] = None):
+        self.status = status
+        self.wait = wait
+        self.reason = reason
+
+
+class AirtimeScheduler:
+    """Планировщик отправки в Mesh с учетом времени в эфире
+
+    Время в эфире каждого пакета оценивается по длине и пресету модема.
+    Бюджет - ведро токенов в миллисекундах эфира: пополняется со скоростью
+    `duty_cycle` (доля времени передачи) и вмещает не больше `burst_ms`.
+    Очереди ведутся по пользователям и обслуживаются по кругу, поэтому
+    активный чат не вытесняет остальных; фрагменты длинного сообщения
+    отправляются подряд, без вставки чужих сообщений. Когда бюджета нет, текст
+    объединяется с последним ожидающим сообщением того же пользователя,
+    а при заполненной очереди сообщение отклоняется. Фрагменты длинного
+    сообщения устаревают и отбрасываются только вместе. При остановке
+    очередь отправляется в пределах бюджета эфира не дольше
+    `drain_timeout`, остаток отбрасывается с записью в лог.
+    """
+
+    def __init__(self, send: Callable[[str, Dict[str, Any]], None], modem_preset: str = 'LONG_FAST',
+                 duty_cycle: float = 0.1, burst_ms: float = 10000.0, max_queue: int = 100,
+                 max_per_user: int = 5, max_wait: float = 600.0, max_payload_bytes: int = 200,
+                 drain_timeout: float = 5.0):
+        if not 0 < duty_cycle <= 1:
+            raise ValueError("duty_cycle должен быть в диапазоне (0, 1]")
+        airtime_ms(0, modem_preset)  # проверка пресета
+
+        self.logger = logging.getLogger(__name__)
+        self.send = send
+        self.modem_preset = modem_preset
+        self.duty_cycle = duty_cycle
+        self.burst_ms = burst_ms
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.max_wait = max_wait
+        self.max_payload_bytes = max_payload_bytes
+        self.drain_timeout = drain_timeout
+
+        self._tokens = burst_ms
+        self._updated = time.monotonic()
+        self._queues: "OrderedDict[Hashable, Deque[OutboundMessage]]" = OrderedDict()
+        self._queued = 0
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._draining = False
+        # Пользователь, чье многофрагментное сообщение отправляется сейчас
+        self._in_group: Optional[Hashable] = None
+        self._thread: Optional[threading.Thread] = None
+
+        # Эфир за последний час для метрики загрузки
+        self._recent: Deque = deque()
+
+        self.stats_counters = {'sent': 0, 'queued': 0, 'merged': 0, 'rejected': 0, 'expired': 0, 'failed': 0,
+                               'dropped': 0}
+        self.airtime_total_ms = 0.0
+        self.wait_total = 0.0
+
+    def start(self):
+        self._stopping = False
+        self._draining = False
+        self._thread = threading.Thread(target=self._run, name='mesh-outbound', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка: отправка очереди в пределах drain_timeout, остаток отбрасывается"""
+        with self._condition:
+            self._draining = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(self.drain_timeout)
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+        with self._condition:
+            dropped = self._queued
+            self._queues.clear()
+            self._queued = 0
+            self._in_group = None
+            self.stats_counters['dropped'] += dropped
+        if dropped:
+            self.logger.warning(f"Очередь в Mesh остановлена, не отправлено сообщений: {dropped}")
+
+    def estimate(self, kind: str, payload: Dict[str, Any]) -> tuple:
+        """Размер полезной нагрузки в байтах и время в эфире, мс"""
+        if kind == 'text':
+            size = len(payload['text'].encode('utf-8'))
+        else:
+            # Позиция: protobuf Position (широта, долгота, высота, время)
+            size = 24
+        return size, airtime_ms(size, self.modem_preset)
+
+    def _required(self, airtime: float) -> float:
+        """Бюджет для отправки: пакет длиннее запаса ждет полного ведра"""
+        return min(airtime, self.burst_ms)
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst_ms, self._tokens + (now - self._updated) * 1000.0 * self.duty_cycle)
+        self._updated = now
+
+    def submit(self, user: Hashable, kind: str, payload: Dict[str, Any]) -> SubmitResult:
+        """Постановка сообщения в очередь отправки"""
+        size, airtime = self.estimate(kind, payload)
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            queue = self._queues.get(user)
+
+            # Бюджет есть и очередь пользователя пуста - отправка без ожидания
+            if not queue and self._queued == 0 and self._tokens >= self._required(airtime):
+                message = OutboundMessage(user, kind, payload, size, airtime)
+                self._enqueue(message)
+                return SubmitResult(SubmitResult.SENT)
+
+            # Бюджета нет: текст присоединяется к ожидающему сообщению пользователя
+            if kind == 'text' and queue and self._merge(queue[-1], payload, size):
+                self.stats_counters['merged'] += 1
+                return SubmitResult(SubmitResult.MERGED, self._estimate_wait())
+
+            if queue is not None and len(queue) >= self.max_per_user:
+                self.stats_counters['rejected'] += 1
+                return SubmitResult(SubmitResult.REJECTED, reason='user_queue_full')
+            if self._queued >= self.max_queue:
+                self.stats_counters['rejected'] += 1
+                return SubmitResult(SubmitResult.REJECTED, reason='queue_full')
+
+            message = OutboundMessage(user, kind, payload, size, airtime)
+            self._enqueue(message)
+            self.stats_counters['queued'] += 1
+            return SubmitResult(SubmitResult.QUEUED, self._estimate_wait())
+
+    def submit_frames(self, user: Hashable, kind: str, payloads: List[Dict[str, Any]]) -> SubmitResult:
+        """Постановка фрагментов одного сообщения в очередь целиком или отказ"""
+        if len(payloads) == 1:
+            return self.submit(user, kind, payloads[0])
+        messages = []
+        for payload in payloads:
+            size, airtime = self.estimate(kind, payload)
+            messages.append(OutboundMessage(user, kind, payload, size, airtime))
+        for message in messages:
+            message.mergeable = False
+        for message in messages[:-1]:
+            message.continued = True
+
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            queue = self._queues.get(user)
+            if queue is not None and len(queue) >= self.max_per_user:
+                self.stats_counters['rejected'] += 1
+                return SubmitResult(SubmitResult.REJECTED, reason='user_queue_full')
+            if self._queued + len(messages) > self.max_queue:
+                self.stats_counters['rejected'] += 1
+                return SubmitResult(SubmitResult.REJECTED, reason='queue_full')
+
+            immediate = not queue and self._queued == 0 and \
+                self._tokens >= sum(self._required(message.airtime) for message in messages)
+            for message in messages:
+                self._enqueue(message)
+            if immediate:
+                return SubmitResult(SubmitResult.SENT)
+            self.stats_counters['queued'] += len(messages)
+            return SubmitResult(SubmitResult.QUEUED, self._estimate_wait())
+
+    def _enqueue(self, message: OutboundMessage):
+        self._queues.setdefault(message.user, deque()).append(message)
+        self._queued += 1
+        self._condition.notify_all()
+
+    def _merge(self, tail: OutboundMessage, payload: Dict[str, Any], size: int) -> bool:
+        """Объединение текста с последним сообщением, если пакет не превысит лимит"""
+        if tail.kind != 'text' or not tail.mergeable:
+            return False
+        if tail.payload.get('destination') != payload.get('destination') or \
+                tail.payload.get('channel') != payload.get('channel'):
+            return False
+        merged_size = tail.size + 1 + size
+        if merged_size > self.max_payload_bytes:
+            return False
+        tail.payload = dict(tail.payload, text=f"{tail.payload['text']}\n{payload['text']}")
+        tail.size = merged_size
+        tail.airtime = airtime_ms(merged_size, self.modem_preset)
+        tail.merged += 1
+        return True
+
+    def _estimate_wait(self) -> float:
+        """Оценка ожидания до отправки всей очереди, сек"""
+        pending = sum(message.airtime for queue in self._queues.values() for message in queue)
+        deficit = max(0.0, pending - self._tokens)
+        return deficit / (1000.0 * self.duty_cycle)
+
+    def _pop_group(self, queue: Deque[OutboundMessage]) -> int:
+        """Удаление первого сообщения очереди вместе с остальными его фрагментами"""
+        count = 0
+        while queue:
+            message = queue.popleft()
+            count += 1
+            if not message.continued:
+                break
+        self._queued -= count
+        return count
+
+    def _next_message(self, now: float) -> Optional[OutboundMessage]:
+        """Следующее сообщение по кругу пользователей, устаревшие отбрасываются"""
+        for user in list(self._queues):
+            queue = self._queues[user]
+            # Начатое многофрагментное сообщение досылается целиком
+            while queue and user != self._in_group and now - queue[0].enqueued_at > self.max_wait:
+                self.stats_counters['expired'] += self._pop_group(queue)
+            if not queue:
+                del self._queues[user]
+        if not self._queues:
+            return None
+        user, queue = next(iter(self._queues.items()))
+        message = queue[0]
+        if self._tokens < self._required(message.airtime):
+            return None
+        queue.popleft()
+        self._queued -= 1
+        if message.continued and queue:
+            # Фрагменты сообщения уходят подряд, очередь пользователя остается первой
+            self._in_group = user
+            return message
+        self._in_group = None
+        # Пользователь перемещается в конец круга
+        del self._queues[user]
+        if queue:
+            self._queues[user] = queue
+        return message
+
+    def _run(self):
+        while True:
+            with self._condition:
+                message = None
+                while not self._stopping:
+                    now = time.monotonic()
+                    self._refill(now)
+                    message = self._next_message(now)
+                    if message is not None:
+                        break
+                    if self._draining and not self._queues:
+                        return
+                    if self._queues:
+                        # Ожидание накопления бюджета для первого в круге
+                        head = next(iter(self._queues.values()))[0]
+                        timeout = (self._required(head.airtime) - self._tokens) / (1000.0 * self.duty_cycle)
+                        self._condition.wait(max(timeout, 0.01))
+                    else:
+                        self._condition.wait()
+                if self._stopping:
+                    return
+                self._tokens -= message.airtime
+
+            try:
+                self.send(message.kind, message.payload)
+            except Exception as e:
+                self.logger.error(f"Ошибка отправки в Mesh: {e}")
+                with self._condition:
+                    self.stats_counters['failed'] += 1
+                continue
+
+            with self._condition:
+                now = time.monotonic()
+                self.stats_counters['sent'] += 1
+                self.airtime_total_ms += message.airtime
+                self.wait_total += now - message.enqueued_at
+                self._recent.append((now, message.airtime))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            while self._recent and now - self._recent[0][0] > 3600:
+                self._recent.popleft()
+            sent = self.stats_counters['sent']
+            return dict(
+                self.stats_counters,
+                depth=self._queued,
+                users_waiting=len(self._queues),
+                budget_ms=round(max(self._tokens, 0.0)),
+                airtime_total_ms=round(self.airtime_total_ms),
+                airtime_last_hour_ms=round(sum(airtime for _, airtime in self._recent)),
+                avg_wait=self.wait_total / sent if sent else 0.0,
+            )
@@ -0,0 +1,213 @@
+import base64
+import json
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .topic_router import parse_topic
+
+# Необязательные быстрые JSON декодеры
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Необязательные зависимости для двоичного формата (msh/.../e/...)
+try:
+    from google.protobuf.json_format import MessageToDict
+    from meshtastic.protobuf import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2
+    PROTOBUF_AVAILABLE = True
+except ImportError:
+    PROTOBUF_AVAILABLE = False
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    CRYPTO_AVAILABLE = True
+except ImportError:
+    CRYPTO_AVAILABLE = False
+
+# Ключ канала по умолчанию Meshtastic (PSK "AQ==")
+DEFAULT_PSK = bytes.fromhex('d4f1bb3a20290759f0bcffabcf4e6901')
+
+
+def json_loader(backend: str = 'auto') -> Tuple[str, Callable[[bytes], Any]]:
+    """Функция разбора JSON прямо из bytes: orjson, msgspec или стандартный json"""
+    loaders = {'json': json.loads}
+    if msgspec is not None:
+        loaders['msgspec'] = msgspec.json.Decoder().decode
+    if orjson is not None:
+        loaders['orjson'] = orjson.loads
+
+    if backend == 'auto':
+        for name in ('orjson', 'msgspec', 'json'):
+            if name in loaders:
+                return name, loaders[name]
+    if backend not in loaders:
+        raise ValueError(f"JSON декодер недоступен: {backend}")
+    return backend, loaders[backend]
+
+
+def expand_channel_key(key: str) -> bytes:
+    """Ключ канала из base64, однобайтовые ключи - вариации ключа по умолчанию"""
+    raw = base64.b64decode(key)
+    if len(raw) == 1:
+        index = raw[0]
+        if index == 0:
+            return b''
+        return DEFAULT_PSK[:-1] + bytes([(DEFAULT_PSK[-1] + index - 1) & 0xFF])
+    if len(raw) not in (16, 32):
+        raise ValueError(f"Недопустимая длина ключа канала: {len(raw)} байт")
+    return raw
+
+
+class ProtobufCodec:
+    """Декодирование ServiceEnvelope в те же словари, что и JSON топики"""
+
+    def __init__(self, channel_keys: Optional[Dict[str, str]] = None, default_key: Optional[str] = 'AQ=='):
+        if not PROTOBUF_AVAILABLE:
+            raise ImportError("Для протокола protobuf требуется пакет meshtastic")
+        self.logger = logging.getLogger(__name__)
+        self.channel_keys = {name: expand_channel_key(key) for name, key in (channel_keys or {}).items()}
+        self.default_key = expand_channel_key(default_key) if default_key else None
+
+        self.handlers = {
+            portnums_pb2.TEXT_MESSAGE_APP: self._decode_text,
+            portnums_pb2.POSITION_APP: self._decode_position,
+            portnums_pb2.NODEINFO_APP: self._decode_nodeinfo,
+            portnums_pb2.TELEMETRY_APP: self._decode_telemetry,
+        }
+
+    def decode(self, payload: bytes) -> Optional[Dict[str, Any]]:
+        """Разбор ServiceEnvelope, None - пакет не поддерживается или не расшифрован"""
+        envelope = mqtt_pb2.ServiceEnvelope()
+        envelope.ParseFromString(payload)
+        packet = envelope.packet
+
+        if packet.HasField('decoded'):
+            data = packet.decoded
+        elif packet.encrypted:
+            data = self._decrypt(packet, envelope.channel_id)
+            if data is None:
+                return None
+        else:
+            return None
+
+        handler = self.handlers.get(data.portnum)
+        if handler is None:
+            return None
+
+        message_type, message_payload = handler(data.payload)
+        return {
+            'from': f"!{getattr(packet, 'from'):08x}",
+            'to': '^all' if packet.to == 0xFFFFFFFF else f"!{packet.to:08x}",
+            # В ServiceEnvelope поле channel - хеш канала, а не индекс как в JSON;
+            # канал определяется по имени (channelId)
+            'channel': None,
+            'channelHash': packet.channel,
+            'type': message_type,
+            'payload': message_payload,
+            'id': packet.id,
+            'rxTime': packet.rx_time,
+            'rxSnr': packet.rx_snr,
+            'hopLimit': packet.hop_limit,
+            'wantAck': packet.want_ack,
+            'sender': envelope.gateway_id,
+            'channelId': envelope.channel_id,
+        }
+
+    def _decrypt(self, packet, channel_id: str):
+        """Расшифровка AES-CTR ключом канала"""
+        key = self.channel_keys.get(channel_id, self.default_key)
+        if not key or not CRYPTO_AVAILABLE:
+            return None
+
+        # Nonce: ID пакета (8 байт LE), ID отправителя (4 байта LE), 4 нулевых байта
+        nonce = packet.id.to_bytes(8, 'little') + getattr(packet, 'from').to_bytes(4, 'little') + bytes(4)
+        decryptor = Cipher(algorithms.AES(key), modes.CTR(nonce)).decryptor()
+        plaintext = decryptor.update(packet.encrypted) + decryptor.finalize()
+
+        data = mesh_pb2.Data()
+        try:
+            data.ParseFromString(plaintext)
+        except Exception:
+            # Неверный ключ дает случайные байты
+            return None
+        if not data.portnum:
+            return None
+        return data
+
+    def _decode_text(self, payload: bytes):
+        return 'text', {'text': payload.decode('utf-8', errors='replace')}
+
+    def _decode_position(self, payload: bytes):
+        position = mesh_pb2.Position()
+        position.ParseFromString(payload)
+        return 'position', {
+            'latitude': position.latitude_i * 1e-7,
+            'longitude': position.longitude_i * 1e-7,
+            'altitude': position.altitude,
+            'time': position.time,
+        }
+
+    def _decode_nodeinfo(self, payload: bytes):
+        user = mesh_pb2.User()
+        user.ParseFromString(payload)
+        return 'nodeinfo', {
+            'user': {
+                'id': user.id,
+                'longName': user.long_name,
+                'shortName': user.short_name,
+                'hwModel': mesh_pb2.HardwareModel.Name(user.hw_model),
+                'role': user.role,
+            }
+        }
+
+    def _decode_telemetry(self, payload: bytes):
+        telemetry = telemetry_pb2.Telemetry()
+        telemetry.ParseFromString(payload)
+        # Метрики приводятся к плоскому виду, как в JSON топиках
+        result = {'time': telemetry.time}
+        for field in ('device_metrics', 'environment_metrics'):
+            if telemetry.HasField(field):
+                result.update(MessageToDict(getattr(telemetry, field)))
+        return 'telemetry', result
+
+
+class PacketDecoder:
+    """Выбор декодера по формату топика"""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.logger = logging.getLogger(__name__)
+        self.protobuf = None
+
+        self.json_backend, self._json_loads = json_loader(config.get('json_backend', 'auto'))
+        self.logger.info(f"JSON декодер: {self.json_backend}")
+
+        protobuf_config = config.get('protobuf', {})
+        if protobuf_config.get('enabled', True):
+            try:
+                self.protobuf = ProtobufCodec(
+                    protobuf_config.get('channel_keys'),
+                    protobuf_config.get('default_key', 'AQ==')
+                )
+                if not CRYPTO_AVAILABLE:
+                    self.logger.warning("Пакет cryptography не установлен, зашифрованные пакеты пропускаются")
+            except ImportError:
+                self.logger.info("Пакет meshtastic не установлен, топики protobuf не обрабатываются")
+
+    def decode(self, topic: str, payload: bytes, fmt: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Нормализованный словарь пакета, None - пакет пропускается"""
+        if fmt is None:
+            fmt = parse_topic(topic).fmt
+        if fmt == 'json':
+            data = self._json_loads(payload)
+            return data if isinstance(data, dict) else None
+        if fmt in ('e', 'c'):
+            if self.protobuf is None:
+                return None
+            return self.protobuf.decode(payload)
+        return None
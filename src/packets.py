@@ -0,0 +1,159 @@
+from typing import Any, Dict, Optional
+
+BROADCAST_NUM = 0xFFFFFFFF
+
+
+def normalize_node_id(value: Any) -> Any:
+    """ID узла в каноническом виде '!%08x'
+
+    JSON прошивки передает номер узла целым числом (или его строкой),
+    protobuf кодек - строкой '!xxxxxxxx'; широковещательный адрес - '^all'.
+    Нераспознанные значения возвращаются как есть.
+    """
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith('!'):
+            try:
+                value = int(text[1:], 16)
+            except ValueError:
+                return value
+        elif text.isdigit():
+            value = int(text)
+        else:
+            return value
+    if isinstance(value, int):
+        if value == BROADCAST_NUM:
+            return '^all'
+        return f"!{value & BROADCAST_NUM:08x}"
+    return value
+
+
+class Packet:
+    """Общие поля пакета Meshtastic"""
+
+    TYPE = 'unknown'
+    __slots__ = (
+        'from_node', 'to', 'channel', 'channel_hash', 'packet_id', 'rx_time', 'rx_snr', 'hop_limit', 'sender',
+        'channel_name'
+    )
+
+    def __init__(self, data: Dict[str, Any]):
+        # Один формат ID для JSON и protobuf: ключи БД, реестра и дедупликации совпадают
+        self.from_node = normalize_node_id(data.get('from', 'unknown'))
+        self.to = normalize_node_id(data.get('to'))
+        # Индекс канала (JSON); для protobuf известны только хеш и имя канала
+        self.channel = data.get('channel', 0)
+        self.channel_hash = data.get('channelHash')
+        self.packet_id = data.get('id')
+        self.rx_time = data.get('rxTime')
+        self.rx_snr = data.get('rxSnr')
+        self.hop_limit = data.get('hopLimit')
+        self.sender = data.get('sender')
+        # Имя канала из ServiceEnvelope или топика (дополняет MQTT клиент)
+        self.channel_name = data.get('channelId')
+
+    @staticmethod
+    def _payload(data: Dict[str, Any]) -> Dict[str, Any]:
+        payload = data.get('payload')
+        return payload if isinstance(payload, dict) else {}
+
+
+class TextPacket(Packet):
+    TYPE = 'text'
+    __slots__ = ('text',)
+
+    def __init__(self, data: Dict[str, Any]):
+        super().__init__(data)
+        payload = data.get('payload')
+        # Прошивка может передавать текст строкой прямо в payload
+        if isinstance(payload, str):
+            self.text = payload
+        else:
+            self.text = self._payload(data).get('text', '')
+
+
+class PositionPacket(Packet):
+    TYPE = 'position'
+    __slots__ = ('latitude', 'longitude', 'altitude', 'time')
+
+    def __init__(self, data: Dict[str, Any]):
+        super().__init__(data)
+        payload = self._payload(data)
+        self.latitude = payload.get('latitude')
+        self.longitude = payload.get('longitude')
+        # JSON прошивки передает координаты целыми числами (latitude_i * 1e7)
+        if self.latitude is None and payload.get('latitude_i') is not None:
+            self.latitude = payload['latitude_i'] * 1e-7
+        if self.longitude is None and payload.get('longitude_i') is not None:
+            self.longitude = payload['longitude_i'] * 1e-7
+        self.altitude = payload.get('altitude', 0) or 0
+        self.time = payload.get('time')
+
+    def as_position(self) -> Dict[str, Any]:
+        return {'latitude': self.latitude, 'longitude': self.longitude, 'altitude': self.altitude}
+
+
+class TelemetryPacket(Packet):
+    TYPE = 'telemetry'
+    __slots__ = (
+        'battery_level', 'voltage', 'channel_utilization', 'air_util_tx',
+        'temperature', 'relative_humidity', 'barometric_pressure'
+    )
+
+    def __init__(self, data: Dict[str, Any]):
+        super().__init__(data)
+        payload = self._payload(data)
+        self.battery_level = _first(payload, 'batteryLevel', 'battery_level')
+        self.voltage = payload.get('voltage')
+        self.channel_utilization = _first(payload, 'channelUtilization', 'channel_utilization')
+        self.air_util_tx = _first(payload, 'airUtilTx', 'air_util_tx')
+        self.temperature = payload.get('temperature')
+        self.relative_humidity = _first(payload, 'relativeHumidity', 'relative_humidity')
+        self.barometric_pressure = _first(payload, 'barometricPressure', 'barometric_pressure')
+
+    def as_device_metrics(self) -> Dict[str, Any]:
+        return {'batteryLevel': self.battery_level}
+
+    def as_metrics(self) -> Dict[str, Any]:
+        """Переданные в пакете метрики для истории телеметрии"""
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+
+class NodeInfoPacket(Packet):
+    TYPE = 'nodeinfo'
+    __slots__ = ('node_id', 'long_name', 'short_name', 'hw_model', 'role')
+
+    def __init__(self, data: Dict[str, Any]):
+        super().__init__(data)
+        payload = self._payload(data)
+        # Вложенный объект user или плоский формат JSON прошивки
+        user = payload.get('user') if isinstance(payload.get('user'), dict) else payload
+        self.node_id = normalize_node_id(user.get('id') or self.from_node)
+        self.long_name = _first(user, 'longName', 'longname', 'long_name')
+        self.short_name = _first(user, 'shortName', 'shortname', 'short_name')
+        self.hw_model = _first(user, 'hwModel', 'hardware', 'hw_model')
+        self.role = user.get('role')
+
+    def as_user(self) -> Dict[str, Any]:
+        return {'longName': self.long_name, 'shortName': self.short_name, 'hwModel': self.hw_model}
+
+
+PACKET_TYPES = {cls.TYPE: cls for cls in (TextPacket, PositionPacket, TelemetryPacket, NodeInfoPacket)}
+
+
+def build_packet(message_type: str, data: Dict[str, Any]) -> Optional[Packet]:
+    """Типизированный пакет по типу сообщения, None для неизвестных типов"""
+    packet_class = PACKET_TYPES.get(message_type)
+    if packet_class is None:
+        return None
+    return packet_class(data)
+
+
+def _first(source: Dict[str, Any], *keys: str) -> Any:
+    for key in keys:
+        value = source.get(key)
+        if value is not None:
+            return value
+    return None
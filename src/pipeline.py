@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Callable, Dict, Any, List
+
+
+class IngestPipeline:
+    """Ограниченная очередь входящих MQTT сообщений с пулом обработчиков
+
+    Сетевой поток paho только кладет сырые (topic, payload) в очередь,
+    а декодирование и вызов обработчиков выполняют рабочие потоки.
+    Сообщения распределяются по потокам по хэшу топика, поэтому порядок
+    сообщений внутри одного топика сохраняется.
+    """
+
+    POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, process: Callable[[str, bytes], None], workers: int = 1,
+                 queue_size: int = 1000, overflow_policy: str = 'drop_oldest',
+                 block_timeout: float = 1.0):
+        if overflow_policy not in self.POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {overflow_policy}")
+
+        self.logger = logging.getLogger(__name__)
+        self.process = process
+        self.workers = max(1, int(workers))
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        # Емкость делится между очередями рабочих потоков
+        self.shard_size = max(1, int(queue_size) // self.workers)
+
+        self._queues: List[deque] = [deque() for _ in range(self.workers)]
+        self._conditions = [threading.Condition() for _ in range(self.workers)]
+        self._threads: List[threading.Thread] = []
+        self._running = False
+
+        self._stats_lock = threading.Lock()
+        self._received = 0
+        self._processed = 0
+        self._dropped = 0
+        self._errors = 0
+        self._max_depth = 0
+
+    def start(self):
+        """Запуск рабочих потоков"""
+        if self._running:
+            return
+        self._running = True
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker,
+                args=(index,),
+                name=f"mqtt-ingest-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        self.logger.info(
+            f"Запущен конвейер MQTT: потоков {self.workers}, "
+            f"емкость {self.shard_size * self.workers}, политика {self.overflow_policy}"
+        )
+
+    def stop(self, timeout: float = 5.0):
+        """Остановка с дообработкой уже принятых сообщений"""
+        if not self._running:
+            return
+        self._running = False
+        for condition in self._conditions:
+            with condition:
+                condition.notify_all()
+
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+        pending = sum(len(q) for q in self._queues)
+        if pending:
+            self.logger.warning(f"Конвейер MQTT остановлен, не обработано сообщений: {pending}")
+
+    def submit(self, topic: str, payload: bytes) -> bool:
+        """Постановка сообщения в очередь (вызывается из потока paho)"""
+        index = zlib.crc32(topic.encode('utf-8')) % self.workers
+        queue = self._queues[index]
+        condition = self._conditions[index]
+
+        with condition:
+            if len(queue) >= self.shard_size:
+                if self.overflow_policy == 'block':
+                    # Обратное давление: поток paho ждет освобождения места
+                    if not condition.wait_for(lambda: len(queue) < self.shard_size or not self._running,
+                                              timeout=self.block_timeout):
+                        self._count_drop(topic)
+                        return False
+                elif self.overflow_policy == 'drop_oldest':
+                    queue.popleft()
+                    self._count_drop(topic)
+                else:
+                    self._count_drop(topic)
+                    return False
+
+            queue.append((topic, payload))
+            depth = len(queue)
+            condition.notify_all()
+
+        with self._stats_lock:
+            self._received += 1
+            if depth > self._max_depth:
+                self._max_depth = depth
+        return True
+
+    def _count_drop(self, topic: str):
+        with self._stats_lock:
+            self._dropped += 1
+            dropped = self._dropped
+        # Не засоряем лог при длительной перегрузке
+        if dropped == 1 or dropped % 100 == 0:
+            self.logger.warning(f"Очередь MQTT переполнена, отброшено сообщений: {dropped} (топик {topic})")
+
+    def _worker(self, index: int):
+        queue = self._queues[index]
+        condition = self._conditions[index]
+
+        while True:
+            with condition:
+                condition.wait_for(lambda: queue or not self._running)
+                if not queue:
+                    return
+                topic, payload = queue.popleft()
+                # Освободилось место для потока paho в режиме 'block'
+                condition.notify_all()
+
+            try:
+                self.process(topic, payload)
+                with self._stats_lock:
+                    self._processed += 1
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += 1
+                self.logger.error(f"Ошибка обработки сообщения из очереди MQTT: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики конвейера"""
+        with self._stats_lock:
+            return {
+                'workers': self.workers,
+                'depth': sum(len(q) for q in self._queues),
+                'capacity': self.shard_size * self.workers,
+                'received': self._received,
+                'processed': self._processed,
+                'dropped': self._dropped,
+                'errors': self._errors,
+                'max_depth': self._max_depth,
+            }
@@ -0,0 +1,165 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from .packets import normalize_node_id
+
+BROADCAST_DESTINATION = '^all'
+_BROADCAST_IDS = {None, BROADCAST_DESTINATION, 0xFFFFFFFF, '!ffffffff', '4294967295'}
+
+DIRECTIONS = ('both', 'to_telegram', 'to_mesh')
+
+# Получатель в Telegram: (chat_id, thread_id темы форума или None)
+TelegramTarget = Tuple[int, Optional[int]]
+
+
+def is_broadcast(to) -> bool:
+    """Пакет адресован всем узлам, а не конкретному"""
+    return to in _BROADCAST_IDS
+
+
+class MeshTarget:
+    """Куда отправлять сообщения из чата Telegram"""
+
+    __slots__ = ('channel', 'destination')
+
+    def __init__(self, channel: int = 0, destination: str = BROADCAST_DESTINATION):
+        self.channel = channel
+        self.destination = destination
+
+    @property
+    def is_direct(self) -> bool:
+        return self.destination != BROADCAST_DESTINATION
+
+
+class RoutingTable:
+    """Маршруты между каналами Mesh и чатами Telegram
+
+    Конфигурация компилируется при запуске в словари, поэтому выбор
+    маршрута для пакета - несколько обращений к словарю независимо от
+    числа маршрутов:
+    - Mesh -> Telegram: (шлюз, имя или индекс канала) -> получатели;
+      маршрут без шлюза подходит для любого шлюза;
+    - Telegram -> Mesh: (chat_id, thread_id) -> канал и адресат;
+    - личные сообщения: узел <-> чат в обе стороны.
+    Пакеты protobuf (msh/.../e/) несут хеш канала вместо индекса, поэтому
+    сопоставляются только по channel_name; индекс работает для JSON топиков.
+    Без секции routing все сообщения идут как раньше: рассылка всем
+    пользователям и канал 0 для отправки в Mesh.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.logger = logging.getLogger(__name__)
+        self.enabled = bool(config.get('routes') or config.get('direct'))
+        self.broadcast_unrouted = config.get('broadcast_unrouted', True)
+        default_channel = config.get('default_channel', 0)
+        self.default_target = MeshTarget(default_channel) if default_channel is not None else None
+
+        self._to_telegram: Dict[Tuple[Optional[str], str], Tuple[TelegramTarget, ...]] = {}
+        self._to_mesh: Dict[TelegramTarget, MeshTarget] = {}
+        self._direct_to_telegram: Dict[str, Tuple[TelegramTarget, ...]] = {}
+
+        for route in config.get('routes', []):
+            self._add_route(route)
+        for route in config.get('direct', []):
+            self._add_direct(route)
+
+    @staticmethod
+    def _target(route: Dict[str, Any]) -> TelegramTarget:
+        if route.get('chat_id') is None:
+            raise ValueError(f"В маршруте не указан chat_id: {route}")
+        return int(route['chat_id']), route.get('thread_id')
+
+    @staticmethod
+    def _direction(route: Dict[str, Any]) -> str:
+        direction = route.get('direction', 'both')
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Неизвестное направление маршрута: {direction}")
+        return direction
+
+    def _append(self, table: Dict, key, target: TelegramTarget):
+        targets = table.get(key, ())
+        if target not in targets:
+            table[key] = targets + (target,)
+
+    def _add_route(self, route: Dict[str, Any]):
+        target = self._target(route)
+        direction = self._direction(route)
+        channel = route.get('channel', 0)
+        if direction in ('both', 'to_telegram'):
+            gateway = route.get('gateway')
+            self._append(self._to_telegram, (gateway, str(channel)), target)
+            if route.get('channel_name'):
+                self._append(self._to_telegram, (gateway, route['channel_name']), target)
+            else:
+                self.logger.warning(
+                    f"Маршрут канала {channel} в чат {target[0]} без channel_name: "
+                    f"пакеты protobuf (msh/.../e/) по нему не пересылаются"
+                )
+        if direction in ('both', 'to_mesh'):
+            if target in self._to_mesh:
+                raise ValueError(f"Чат {target[0]} уже связан с каналом Mesh")
+            self._to_mesh[target] = MeshTarget(int(channel))
+
+    def _add_direct(self, route: Dict[str, Any]):
+        # Узел в конфигурации может быть записан числом или в другом регистре
+        node = normalize_node_id(route.get('node'))
+        if not node:
+            raise ValueError(f"В личном маршруте не указан узел: {route}")
+        target = self._target(route)
+        direction = self._direction(route)
+        if direction in ('both', 'to_telegram'):
+            self._append(self._direct_to_telegram, node, target)
+        if direction in ('both', 'to_mesh'):
+            if target in self._to_mesh:
+                raise ValueError(f"Чат {target[0]} уже связан с каналом Mesh")
+            self._to_mesh[target] = MeshTarget(int(route.get('channel', 0)), node)
+
+    def telegram_targets(self, from_node: str, to, channel=None, channel_name: Optional[str] = None,
+                         gateway: Optional[str] = None) -> Optional[Tuple[TelegramTarget, ...]]:
+        """Получатели сообщения из Mesh
+
+        None - рассылка всем пользователям (маршрутизация выключена или
+        маршрут не найден при broadcast_unrouted), пустой кортеж - не пересылать.
+        """
+        if not self.enabled:
+            return None
+        if not is_broadcast(to):
+            targets = self._direct_to_telegram.get(from_node)
+            if targets:
+                return targets
+        for gateway_key in ((gateway, None) if gateway else (None,)):
+            if channel_name:
+                targets = self._to_telegram.get((gateway_key, channel_name))
+                if targets:
+                    return targets
+            if channel is not None:
+                targets = self._to_telegram.get((gateway_key, str(channel)))
+                if targets:
+                    return targets
+        return None if self.broadcast_unrouted else ()
+
+    def mesh_target(self, chat_id: int, thread_id: Optional[int] = None) -> Optional[MeshTarget]:
+        """Канал и адресат в Mesh для чата (темы), None - чат не связан с Mesh"""
+        if not self.enabled:
+            return self.default_target
+        target = self._to_mesh.get((chat_id, thread_id))
+        if target is None and thread_id is not None:
+            target = self._to_mesh.get((chat_id, None))
+        return target if target is not None else self.default_target
+
+    def routed_chats(self) -> List[int]:
+        """Чаты из маршрутов (для проверки доступа)"""
+        chats = {chat_id for chat_id, _ in self._to_mesh}
+        for targets in list(self._to_telegram.values()) + list(self._direct_to_telegram.values()):
+            chats.update(chat_id for chat_id, _ in targets)
+        return sorted(chats)
+
+    def describe(self) -> str:
+        """Краткая сводка маршрутов для /admin"""
+        if not self.enabled:
+            return "Маршрутизация: выключена (рассылка всем, канал 0)"
+        return (
+            f"Маршрутизация: Mesh→Telegram {len(self._to_telegram)}, "
+            f"Telegram→Mesh {len(self._to_mesh)}, личных {len(self._direct_to_telegram)}"
+        )
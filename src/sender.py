@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union
+
+from telegram.error import RetryAfter, TimedOut, NetworkError, Forbidden, BadRequest
+
+
+class AsyncTokenBucket:
+    """Ведро токенов для ограничения частоты внутри цикла asyncio"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Ожидание и списание одного токена"""
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BroadcastScheduler:
+    """Параллельная рассылка с учетом лимитов Telegram
+
+    Одновременно выполняется не более `concurrency` запросов, общий поток
+    ограничен `global_per_second`, а каждый чат - собственным ведром
+    (для групп лимит в минуту). RetryAfter приостанавливает все отправки
+    на указанное Telegram время, сетевые ошибки повторяются с отсрочкой.
+    Каждый запрос отправки ограничен `recipient_timeout`, чтобы зависший
+    запрос не задерживал всю рассылку; ожидание лимитов и паузы RetryAfter
+    в этот предел не входят, поэтому длинная рассылка не теряет хвост.
+    Запрос, не уложившийся в предел, не повторяется, а отсрочки перед
+    повтором ждут вне семафора - зависший чат не занимает место других.
+    Сообщения одному чату уходят в порядке постановки.
+    """
+
+    def __init__(self, send: Callable[[int, str], Awaitable[Any]], concurrency: int = 16,
+                 global_per_second: float = 30.0, per_chat_per_second: float = 1.0,
+                 group_per_minute: float = 20.0, max_retries: int = 3,
+                 recipient_timeout: Optional[float] = 60.0):
+        self.logger = logging.getLogger(__name__)
+        self.send = send
+        self.concurrency = max(1, concurrency)
+        self.per_chat_per_second = per_chat_per_second
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self.recipient_timeout = recipient_timeout
+
+        self._global_bucket = AsyncTokenBucket(global_per_second)
+        self._chat_buckets: Dict[int, AsyncTokenBucket] = {}
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._paused_until = 0.0
+
+        self.totals = {'broadcasts': 0, 'sent': 0, 'failed': 0, 'retries': 0, 'timeouts': 0}
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_config(cls, send: Callable[[int, str], Awaitable[Any]], config: Dict[str, Any]):
+        rate_config = config['telegram'].get('rate_limit', {})
+        return cls(
+            send,
+            concurrency=rate_config.get('concurrency', 16),
+            global_per_second=rate_config.get('global_per_second', 30.0),
+            per_chat_per_second=rate_config.get('per_chat_per_second', 1.0),
+            group_per_minute=rate_config.get('group_per_minute', 20.0),
+            max_retries=rate_config.get('max_retries', 3),
+            recipient_timeout=rate_config.get('recipient_timeout', 60.0)
+        )
+
+    def _chat_bucket(self, chat_id: int) -> AsyncTokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные ID - группы и каналы
+            if chat_id < 0:
+                bucket = AsyncTokenBucket(self.group_per_minute / 60.0, capacity=1)
+            else:
+                bucket = AsyncTokenBucket(self.per_chat_per_second, capacity=1)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _wait_pause(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send_with_timeout(self, chat_id: int, text: str, thread_id: Optional[int],
+                                 timeout: Optional[float]):
+        """Один запрос отправки, ограниченный timeout"""
+        send = self.send(chat_id, text) if thread_id is None else self.send(chat_id, text, thread_id)
+        if not timeout:
+            await send
+        else:
+            await asyncio.wait_for(send, timeout)
+
+    async def _deliver(self, recipient: Union[int, Tuple[int, Optional[int]]], text: str,
+                       report: Dict[str, Any], timeout: Optional[float] = None):
+        """Отправка одному получателю с повторами"""
+        chat_id, thread_id = recipient if isinstance(recipient, tuple) else (recipient, None)
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = self._chat_locks[chat_id] = asyncio.Lock()
+        async with lock:
+            if await self._attempts(chat_id, thread_id, text, report, timeout):
+                report['sent'] += 1
+            else:
+                report['failed'] += 1
+
+    async def _attempts(self, chat_id: int, thread_id: Optional[int], text: str,
+                        report: Dict[str, Any], timeout: Optional[float]) -> bool:
+        """Попытки отправки одному чату, True - сообщение доставлено"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                report['retries'] += 1
+            await self._chat_bucket(chat_id).acquire()
+            await self._wait_pause()
+            backoff = 0.0
+            async with self._semaphore:
+                await self._global_bucket.acquire()
+                try:
+                    await self._send_with_timeout(chat_id, text, thread_id, timeout)
+                    return True
+                except RetryAfter as e:
+                    delay = e.retry_after
+                    if isinstance(delay, timedelta):
+                        delay = delay.total_seconds()
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    self.logger.warning(f"Превышен лимит Telegram, пауза {delay} с (chat {chat_id})")
+                except (Forbidden, BadRequest) as e:
+                    # Бот заблокирован или чат недоступен - повтор бесполезен
+                    self.logger.error(f"Отправка в chat {chat_id} невозможна: {e}")
+                    return False
+                except asyncio.TimeoutError:
+                    # Зависший чат не повторяется, чтобы не задерживать следующие сообщения
+                    report['timeouts'] += 1
+                    self.logger.warning(f"Отправка в chat {chat_id} не завершилась за {timeout} с")
+                    return False
+                except (TimedOut, NetworkError) as e:
+                    self.logger.warning(f"Сетевая ошибка при отправке в chat {chat_id}: {e}")
+                    backoff = min(2 ** attempt, 30)
+                except Exception as e:
+                    self.logger.error(f"Ошибка отправки в Telegram chat {chat_id}: {e}")
+                    return False
+            if backoff:
+                await asyncio.sleep(backoff)
+        return False
+
+    async def broadcast(self, chat_ids: Iterable[Union[int, Tuple[int, Optional[int]]]], text: str,
+                        timeout: Optional[float] = None, label: str = "Рассылка") -> Dict[str, Any]:
+        """Рассылка сообщения списку чатов, возвращает отчет
+
+        Получатель - chat_id или пара (chat_id, thread_id) для темы форума.
+        timeout - ограничение одного запроса отправки, по умолчанию
+        recipient_timeout; не уложившийся в него получатель считается
+        неудачным без повторов.
+        """
+        chat_ids = list(dict.fromkeys(chat_ids))
+        if timeout is None:
+            timeout = self.recipient_timeout
+        report = {'recipients': len(chat_ids), 'sent': 0, 'failed': 0, 'retries': 0, 'timeouts': 0}
+        started = time.monotonic()
+
+        await asyncio.gather(*(self._deliver(recipient, text, report, timeout) for recipient in chat_ids))
+
+        report['duration'] = round(time.monotonic() - started, 3)
+        self.last_report = report
+        self.totals['broadcasts'] += 1
+        for key in ('sent', 'failed', 'retries', 'timeouts'):
+            self.totals[key] += report[key]
+
+        self.logger.info(
+            f"{label} завершена за {report['duration']} с: "
+            f"отправлено {report['sent']}/{report['recipients']}, ошибок {report['failed']}"
+        )
+        return report
@@ -0,0 +1,191 @@
+import heapq
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .geo import EARTH_RADIUS_KM, haversine_km
+
+
+class NodeSpatialIndex:
+    """Сетка последних координат узлов в памяти для поиска ближайших
+
+    Плоскость широта/долгота разбита на ячейки `cell_size` градусов. Поиск
+    обходит кольца ячеек вокруг точки и останавливается, когда следующее
+    кольцо заведомо дальше k-го найденного узла, поэтому время не зависит
+    от общего числа узлов.
+    """
+
+    def __init__(self, cell_size: float = 0.1):
+        if cell_size <= 0:
+            raise ValueError("cell_size должен быть положительным")
+        self.cell_size = cell_size
+        self.lon_cells = max(1, int(round(360.0 / cell_size)))
+        self._positions: Dict[str, Tuple[float, float]] = {}
+        self._cells: Dict[Tuple[int, int], Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_size)), int(math.floor((lon + 180.0) / self.cell_size)) % self.lon_cells
+
+    def update(self, node_id: str, lat: float, lon: float):
+        """Добавление или перемещение узла"""
+        cell = self._cell(lat, lon)
+        with self._lock:
+            previous = self._positions.get(node_id)
+            if previous is not None:
+                previous_cell = self._cell(*previous)
+                if previous_cell != cell:
+                    self._discard(previous_cell, node_id)
+            self._positions[node_id] = (lat, lon)
+            self._cells.setdefault(cell, set()).add(node_id)
+
+    def remove(self, node_id: str):
+        with self._lock:
+            previous = self._positions.pop(node_id, None)
+            if previous is not None:
+                self._discard(self._cell(*previous), node_id)
+
+    def _discard(self, cell: Tuple[int, int], node_id: str):
+        nodes = self._cells.get(cell)
+        if nodes is not None:
+            nodes.discard(node_id)
+            if not nodes:
+                del self._cells[cell]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._positions)
+
+    def nearest(self, lat: float, lon: float, k: int = 5, max_km: Optional[float] = None,
+                accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, float]]:
+        """k ближайших узлов: список (node_id, расстояние в км) по возрастанию
+
+        accept - отбор узлов (например, по давности); отклоненные не
+        занимают места среди k ближайших.
+        """
+        if k < 1:
+            return []
+        center_lat, center_lon = self._cell(lat, lon)
+        best: List[Tuple[float, str]] = []  # max-heap через отрицательные расстояния
+
+        def consider(cell):
+            for node_id in self._cells.get(cell, ()):
+                node_lat, node_lon = self._positions[node_id]
+                distance = haversine_km(lat, lon, node_lat, node_lon)
+                if max_km is not None and distance > max_km:
+                    continue
+                if accept is not None and not accept(node_id):
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, node_id))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, node_id))
+
+        with self._lock:
+            ring = 0
+            while True:
+                if (2 * ring + 1) ** 2 > len(self._cells):
+                    # Узлы далеко (или у полюса): дешевле перебрать занятые ячейки
+                    # в порядке оценки расстояния, чем продолжать обход колец
+                    # (просмотренные кольца проверяются заново, без дублей в best)
+                    best.clear()
+                    limit = max_km if max_km is not None else math.inf
+                    remaining = [(self._cell_min_km(lat, lon, cell, limit), cell) for cell in self._cells]
+                    heapq.heapify(remaining)
+                    while remaining:
+                        bound, cell = heapq.heappop(remaining)
+                        if max_km is not None and bound > max_km:
+                            break
+                        if len(best) == k and bound > -best[0][0]:
+                            break
+                        consider(cell)
+                    break
+                for cell in self._ring(center_lat, center_lon, ring):
+                    consider(cell)
+
+                # Нижняя граница расстояния до следующего кольца
+                bound = self._ring_min_km(lat, lon, ring + 1)
+                if max_km is not None and bound > max_km:
+                    break
+                if len(best) == k and bound > -best[0][0]:
+                    break
+                ring += 1
+
+        return sorted(((node_id, -negative) for negative, node_id in best), key=lambda item: item[1])
+
+    def _ring(self, center_lat: int, center_lon: int, ring: int) -> List[Tuple[int, int]]:
+        """Ячейки на расстоянии ring (по Чебышеву) от центральной"""
+        if ring == 0:
+            return [(center_lat, center_lon)]
+        lon_cells = self.lon_cells
+        cells = []
+        for dlat in range(-ring, ring + 1):
+            lon_steps = range(-ring, ring + 1) if abs(dlat) == ring else (-ring, ring)
+            for dlon in lon_steps:
+                cells.append((center_lat + dlat, (center_lon + dlon) % lon_cells))
+        if 2 * ring + 1 > lon_cells:
+            # Кольцо обошло весь круг долгот, ячейки повторяются
+            cells = list(dict.fromkeys(cells))
+        return cells
+
+    def _cell_min_km(self, lat: float, lon: float, cell: Tuple[int, int], limit: float = math.inf) -> float:
+        """Оценка снизу расстояния от точки до любой точки ячейки"""
+        size = self.cell_size
+        row_low, row_high = cell[0] * size, (cell[0] + 1) * size
+        lat_gap = max(row_low - lat, lat - row_high, 0.0)
+        lat_km = EARTH_RADIUS_KM * math.radians(lat_gap)
+        if lat_km > limit:
+            # Одной разницы широт достаточно, чтобы отбросить ячейку
+            return lat_km
+        col_low = cell[1] * size - 180.0
+        if col_low <= lon <= col_low + size:
+            lon_gap = 0.0
+        else:
+            # Зазор по кругу долгот: до начала ячейки на восток или до конца на запад
+            lon_gap = min((col_low - lon) % 360.0, (lon - col_low - size) % 360.0)
+        max_abs_lat = min(max(abs(row_low), abs(row_high)), 90.0)
+        hav = (
+            math.sin(math.radians(lat_gap) / 2) ** 2
+            + math.cos(math.radians(lat)) * math.cos(math.radians(max_abs_lat))
+            * math.sin(math.radians(min(lon_gap, 180.0)) / 2) ** 2
+        )
+        return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(hav)))
+
+    def _ring_min_km(self, lat: float, lon: float, ring: int) -> float:
+        """Минимально возможное расстояние от точки до узлов кольца ring
+
+        Для каждой строки ячеек кольца берется наименьшая разница широт и
+        долгот до точки; hav(d) = hav(dφ) + cos φ1 cos φ2 hav(dλ) дает
+        оценку снизу без обхода самих ячеек.
+        """
+        if ring <= 1:
+            return 0.0
+        cell = self.cell_size
+        center_lat, center_lon = self._cell(lat, lon)
+        cos_lat = math.cos(math.radians(lat))
+
+        # Зазор по долготе до левого и правого столбцов кольца
+        offset = lon + 180.0 - center_lon * cell
+        lon_gap = min((ring - 1) * cell + (cell - offset), (ring - 1) * cell + offset)
+        if 2 * ring - 1 > self.lon_cells:
+            # Все долготы уже просмотрены, новые ячейки отличаются только широтой
+            lon_gap = None
+        else:
+            hav_lon = math.sin(math.radians(min(lon_gap, 180.0)) / 2) ** 2
+
+        best = math.inf
+        for row_offset in range(-ring, ring + 1):
+            row = center_lat + row_offset
+            row_low, row_high = row * cell, (row + 1) * cell
+            if row_low >= 90.0 or row_high <= -90.0:
+                continue
+            lat_gap = max(row_low - lat, lat - row_high, 0.0)
+            hav = math.sin(math.radians(lat_gap) / 2) ** 2
+            if abs(row_offset) < ring:
+                if lon_gap is None:
+                    continue
+                # Ближайшая к полюсу широта строки дает наименьший cos
+                max_abs_lat = min(max(abs(row_low), abs(row_high)), 90.0)
+                hav += cos_lat * math.cos(math.radians(max_abs_lat)) * hav_lon
+            best = min(best, 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(hav))))
+        return best
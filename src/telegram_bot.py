@@ -1,22 +1,33 @@
 import logging
 import asyncio
-import warnings
-from queue import Queue, Empty
-from telegram import Update, BotCommand
+import secrets
+import signal
+from datetime import datetime, timedelta
+from telegram import Update, BotCommand, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler, 
+    Application, CommandHandler, MessageHandler, CallbackQueryHandler,
     ContextTypes, filters, CallbackContext
 )
 from typing import Dict, Any, Callable, List, Optional
-from .models import User, Message, MeshNode
-
-# Подавляем предупреждение о JobQueue, так как используем альтернативный метод
-warnings.filterwarnings('ignore', message='.*JobQueue.*', category=UserWarning)
+from .channel import AsyncMessageChannel
+from .sender import BroadcastScheduler
+from .outbound import SubmitResult
+from .async_db import AsyncDatabase
+from .telemetry import downsample, sparkline
+from .geo import haversine_km, track_length_km
+from .chunking import split_frames
+from .routing import RoutingTable
+from .webhook import WebhookServer
 
 class TelegramBot:
-    def __init__(self, config: Dict[str, Any], database, message_queue: Optional[Queue] = None):
+    def __init__(self, config: Dict[str, Any], database, message_queue: Optional[AsyncMessageChannel] = None,
+                 routing: Optional[RoutingTable] = None):
         self.config = config
         self.database = database
+        self.routing = routing or RoutingTable(config.get('routing'))
+        self._routed_chats = set(self.routing.routed_chats())
+        # Запросы к БД выполняются вне цикла событий
+        self.db = AsyncDatabase(database, config.get('database', {}).get('executor_workers', 4))
         self.message_queue = message_queue
         self.logger = logging.getLogger(__name__)
         
@@ -26,8 +37,26 @@ class TelegramBot:
         # Обработчики внешних сообщений
         self.message_handlers = []
         
-        # Задача для обработки очереди сообщений (если job_queue недоступен)
+        # Последнее местоположение, присланное из чата (для /near)
+        self.user_locations: Dict[int, tuple] = {}
+        # /near и ближайшие узлы учитывают только узлы, слышанные за этот период
+        self.near_hours = config.get('bridge', {}).get('near_hours', 24)
+        
+        # Дополнительные строки статуса для /admin
+        self.status_providers: List[Callable[[], str]] = []
+        
+        # Планировщик рассылок с учетом лимитов Telegram
+        self.broadcaster = BroadcastScheduler.from_config(self._send_raw, config)
+        
+        # Задача для обработки очереди сообщений и задачи доставки
         self._queue_task = None
+        self._delivery_tasks = set()
+        
+        # Остановка источников сообщений перед завершением цикла событий
+        self.stop_handlers: List[Callable[[], None]] = []
+        
+        # Сервер приема обновлений в режиме webhook
+        self.webhook_server: Optional[WebhookServer] = None
         
         # Регистрация команд
         self._register_handlers()
@@ -36,6 +65,17 @@ class TelegramBot:
         """Добавление обработчика для отправки сообщений в Telegram"""
         self.message_handlers.append(handler)
     
+    def add_stop_handler(self, handler: Callable[[], None]):
+        """Добавление обработчика остановки приема (вызывается в потоке до закрытия бота)
+        
+        Сообщения, поставленные в очередь обработчиком, еще доставляются.
+        """
+        self.stop_handlers.append(handler)
+    
+    def add_status_provider(self, provider: Callable[[], str]):
+        """Добавление источника строк статуса для панели администратора"""
+        self.status_providers.append(provider)
+    
     def _register_handlers(self):
         """Регистрация обработчиков команд"""
         handlers = [
@@ -43,8 +83,15 @@ class TelegramBot:
             CommandHandler("help", self._help_command),
             CommandHandler("nodes", self._nodes_command),
             CommandHandler("stats", self._stats_command),
+            CommandHandler("telemetry", self._telemetry_command),
+            CommandHandler("track", self._track_command),
+            CommandHandler("near", self._near_command),
+            CommandHandler("dm", self._dm_command),
             CommandHandler("location", self._location_command),
             CommandHandler("admin", self._admin_command),
+            CommandHandler("approve", self._approve_command),
+            CommandHandler("block", self._block_command),
+            CallbackQueryHandler(self._nodes_page_callback, pattern=r'^nodes:'),
             MessageHandler(filters.TEXT & ~filters.COMMAND, self._text_message),
             MessageHandler(filters.LOCATION, self._location_message)
         ]
@@ -59,25 +106,36 @@ class TelegramBot:
         if self.message_queue:
             async def post_init_with_queue(application):
                 await self._set_commands(application)
-                # Инициализация job_queue для обработки очереди
-                # Подавляем предупреждение PTBUserWarning при проверке job_queue
-                with warnings.catch_warnings():
-                    warnings.filterwarnings('ignore', message='.*JobQueue.*', category=UserWarning)
-                    try:
-                        job_queue = getattr(application, 'job_queue', None)
-                        if job_queue is not None:
-                            job_queue.run_repeating(
-                                self._process_message_queue, 
-                                interval=1.0, 
-                                first=1.0
-                            )
-                            return
-                    except (AttributeError, RuntimeError, TypeError):
-                        pass
-                
-                # Альтернативный способ: создаем asyncio task для обработки очереди
+                # Канал будит обработчик сразу при поступлении сообщения
+                self.message_queue.bind()
                 self._queue_task = asyncio.create_task(self._process_message_queue_loop())
+            
             self.application.post_init = post_init_with_queue
+        
+        async def post_stop(application):
+            # Бот еще может отправлять: источники останавливаются, очередь дочитывается
+            loop = asyncio.get_running_loop()
+            for handler in self.stop_handlers:
+                try:
+                    await loop.run_in_executor(None, handler)
+                except Exception as e:
+                    self.logger.error(f"Ошибка остановки приема сообщений: {e}")
+            if self.message_queue and self._queue_task:
+                timeout = self.config['telegram'].get('drain_timeout', 30.0)
+                if not await self.message_queue.drain(timeout):
+                    self.logger.warning(f"Очередь сообщений в Telegram не доставлена за {timeout} с")
+        
+        async def post_shutdown(application):
+            if self._queue_task:
+                self._queue_task.cancel()
+            for task in list(self._delivery_tasks):
+                task.cancel()
+            if self.message_queue:
+                self.message_queue.unbind()
+            self.db.shutdown()
+        
+        self.application.post_stop = post_stop
+        self.application.post_shutdown = post_shutdown
     
     async def _set_commands(self, application):
         """Настройка меню команд"""
@@ -86,49 +144,59 @@ class TelegramBot:
             BotCommand("help", "Помощь"),
             BotCommand("nodes", "Список узлов"),
             BotCommand("stats", "Статистика"),
+            BotCommand("telemetry", "История телеметрии узла"),
+            BotCommand("track", "Трек узла"),
+            BotCommand("near", "Узлы рядом"),
+            BotCommand("dm", "Личное сообщение узлу"),
             BotCommand("location", "Отправить местоположение"),
         ]
         await application.bot.set_my_commands(commands)
     
-    async def _process_message_queue(self, context: ContextTypes.DEFAULT_TYPE = None):
-        """Обработка сообщений из очереди"""
-        if not self.message_queue:
-            return
-        
+    async def _process_message_queue(self, batch: List):
+        """Запуск доставки пачки сообщений из очереди
+
+        Каждое сообщение доставляется отдельной задачей, поэтому медленный
+        получатель одной рассылки не задерживает следующие сообщения;
+        порядок сообщений одному чату сохраняет планировщик рассылок.
+        """
+        for enqueued_at, (action, message) in batch:
+            task = asyncio.create_task(self._deliver_queued(enqueued_at, action, message))
+            self._delivery_tasks.add(task)
+            task.add_done_callback(self._delivery_tasks.discard)
+    
+    async def _deliver_queued(self, enqueued_at: float, action: str, message):
+        """Доставка одного сообщения из очереди"""
         try:
-            while True:
-                try:
-                    action, message = self.message_queue.get_nowait()
-                    
-                    if action == 'broadcast':
-                        await self.broadcast_message(message)
-                    elif action == 'notify_admins':
-                        await self._notify_admins(message)
-                    
-                except Empty:
-                    break
+            if action == 'broadcast':
+                await self.broadcast_message(message)
+            elif action == 'send_routed':
+                targets, text = message
+                await self.broadcaster.broadcast(targets, text)
+            elif action == 'notify_admins':
+                await self._notify_admins(message)
         except Exception as e:
             self.logger.error(f"Ошибка обработки очереди сообщений: {e}")
+        finally:
+            self.message_queue.mark_delivered(enqueued_at)
     
     async def _process_message_queue_loop(self):
-        """Цикл обработки очереди сообщений (альтернатива job_queue)"""
+        """Цикл обработки очереди сообщений"""
         while True:
             try:
-                await self._process_message_queue()
-                await asyncio.sleep(1.0)
+                batch = await self.message_queue.get_batch()
+                await self._process_message_queue(batch)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 self.logger.error(f"Ошибка в цикле обработки очереди: {e}")
-                await asyncio.sleep(1.0)
     
     async def _notify_admins(self, message: str):
-        """Уведомление администраторов"""
-        for admin_id in self.config['telegram']['admin_ids']:
-            try:
-                await self.send_message(admin_id, message)
-            except Exception as e:
-                self.logger.error(f"Ошибка уведомления администратора {admin_id}: {e}")
+        """Уведомление администраторов через планировщик рассылок"""
+        admin_ids = self.config['telegram']['admin_ids']
+        if not admin_ids:
+            return
+        timeout = self.config['telegram'].get('rate_limit', {}).get('admin_timeout', 15.0)
+        await self.broadcaster.broadcast(admin_ids, message, timeout=timeout, label="Уведомление администраторов")
     
     async def _start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
@@ -142,10 +210,10 @@ class TelegramBot:
         
         # Добавление/обновление пользователя
         is_admin = chat_id in self.config['telegram']['admin_ids']
-        self.database.add_user(chat_id, user.username, user.first_name, user.last_name, is_admin)
+        await self.db.add_user(chat_id, user.username, user.first_name, user.last_name, is_admin)
         
         await update.message.reply_text(self.config['telegram']['welcome_message'])
-        self.database.log_message('command', chat_id, '/start')
+        await self.db.log_message('command', chat_id, '/start')
     
     async def _help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /help"""
@@ -155,8 +223,12 @@ class TelegramBot:
 **Основные команды:**
 /start - Начать работу с ботом
 /help - Показать эту справку
-/nodes - Список активных узлов сети
+/nodes - Список узлов сети (фильтры: active [часы], pos, lowbat)
 /stats - Статистика моста
+/telemetry <узел> [часы] - История телеметрии узла
+/track <узел> [часы] - Трек перемещения узла
+/near [км] - Узлы рядом с вашим местоположением
+/dm <узел> <текст> - Личное сообщение узлу Mesh
 /location - Отправить ваше местоположение
 
 **Использование:**
@@ -168,59 +240,299 @@ class TelegramBot:
 Сообщения из Mesh: 📡 Узел: Текст
         """
         await update.message.reply_text(help_text)
-        self.database.log_message('command', update.effective_chat.id, '/help')
+        await self.db.log_message('command', update.effective_chat.id, '/help')
+    
+    # Поиск узлов рядом (/near)
+    NEAR_DEFAULT_RADIUS_KM = 10.0
+    NEAR_MAX_RADIUS_KM = 500.0
+    NEAR_MAX_RESULTS = 20
+    
+    # Фильтры /nodes: аргумент команды -> (фильтр запроса, заголовок)
+    NODE_FILTERS = {
+        'active': ('active', "Активные за {hours:g} ч"),
+        'pos': ('position', "С координатами"),
+        'lowbat': ('lowbat', "Низкий заряд"),
+    }
     
     async def _nodes_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик команды /nodes"""
+        """Обработчик команды /nodes [active [часы] | pos | lowbat]"""
+        args = context.args or []
+        filter_key = args[0].lower() if args else '-'
+        if filter_key != '-' and filter_key not in self.NODE_FILTERS:
+            await update.message.reply_text(
+                "❌ Неизвестный фильтр. Используйте: /nodes, /nodes active [часы], /nodes pos, /nodes lowbat"
+            )
+            return
+        
+        hours = 24.0
+        if filter_key == 'active' and len(args) > 1:
+            try:
+                hours = float(args[1])
+            except ValueError:
+                await update.message.reply_text("❌ Укажите число часов, например: /nodes active 6")
+                return
+        
         try:
-            nodes = self.database.session.query(MeshNode).all()
+            text, keyboard = await self._render_nodes_page(filter_key, hours, 0)
         except Exception as e:
             self.logger.error(f"Ошибка при получении списка узлов: {e}")
             await update.message.reply_text("❌ Ошибка при получении данных об узлах")
             return
         
-        if not nodes:
-            await update.message.reply_text("❌ Нет данных об узлах сети")
+        await update.message.reply_text(text, reply_markup=keyboard)
+        await self.db.log_message('command', update.effective_chat.id, '/nodes')
+    
+    async def _nodes_page_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Переключение страниц списка узлов"""
+        query = update.callback_query
+        try:
+            _, filter_key, hours, page = query.data.split(':')
+            text, keyboard = await self._render_nodes_page(filter_key, float(hours), int(page))
+        except Exception as e:
+            self.logger.error(f"Ошибка при переключении страницы узлов: {e}")
+            await query.answer("❌ Ошибка при получении данных об узлах")
             return
         
-        nodes_text = "📡 **Активные узлы сети:**\n\n"
+        await query.answer()
+        await query.edit_message_text(text, reply_markup=keyboard)
+    
+    async def _render_nodes_page(self, filter_key: str, hours: float, page: int):
+        """Текст и клавиатура страницы списка узлов"""
+        page_size = self.config['bridge'].get('nodes_page_size', 10)
+        node_filter, title = self.NODE_FILTERS.get(filter_key, (None, "Узлы сети"))
+        title = title.format(hours=hours)
         
-        for node in nodes[:10]:  # Ограничиваем вывод
+        nodes, total = await self.db.query_nodes(page, page_size, node_filter, hours)
+        if not total:
+            return "❌ Нет данных об узлах сети", None
+        
+        pages = (total + page_size - 1) // page_size
+        nodes_text = f"📡 **{title}** (стр. {page + 1}/{pages}, всего {total}):\n\n"
+        
+        now = datetime.utcnow()
+        for node in nodes:
             nodes_text += f"• **{node.long_name or node.node_id}**\n"
             if node.hardware_model:
                 nodes_text += f"  📟 {node.hardware_model}\n"
             if node.battery_level:
                 nodes_text += f"  🔋 {node.battery_level}%\n"
             if node.last_seen:
-                from datetime import datetime
-                try:
-                    last_seen = (datetime.utcnow() - node.last_seen).total_seconds() / 60
-                    nodes_text += f"  ⏱ {last_seen:.0f} мин назад\n"
-                except Exception:
-                    nodes_text += f"  ⏱ Данные недоступны\n"
+                last_seen = (now - node.last_seen).total_seconds() / 60
+                nodes_text += f"  ⏱ {last_seen:.0f} мин назад\n"
             nodes_text += "\n"
         
-        if len(nodes) > 10:
-            nodes_text += f"\n... и еще {len(nodes) - 10} узлов"
+        buttons = []
+        if page > 0:
+            buttons.append(InlineKeyboardButton("◀️", callback_data=f"nodes:{filter_key}:{hours:g}:{page - 1}"))
+        if page + 1 < pages:
+            buttons.append(InlineKeyboardButton("▶️", callback_data=f"nodes:{filter_key}:{hours:g}:{page + 1}"))
+        keyboard = InlineKeyboardMarkup([buttons]) if buttons else None
+        
+        return nodes_text, keyboard
+    
+    @staticmethod
+    def _parse_node_args(args: Optional[List[str]], default_hours: float = 24.0):
+        """Аргументы вида <узел> [часы]: имя узла может содержать пробелы"""
+        args = args or []
+        hours = default_hours
+        if len(args) > 1:
+            try:
+                hours = float(args[-1])
+                args = args[:-1]
+            except ValueError:
+                pass
+        return ' '.join(args), hours
+    
+    # Метрики /telemetry: имя -> (подпись, единица, знаков после запятой)
+    TELEMETRY_LABELS = {
+        'battery_level': ("🔋 Заряд", "%", 0),
+        'voltage': ("⚡ Напряжение", " В", 2),
+        'channel_utilization': ("📶 Загрузка канала", "%", 1),
+        'air_util_tx': ("📡 Эфир TX", "%", 1),
+        'temperature': ("🌡 Температура", " °C", 1),
+        'relative_humidity': ("💧 Влажность", "%", 0),
+        'barometric_pressure': ("🧭 Давление", " гПа", 0),
+    }
+    
+    async def _telemetry_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /telemetry <узел> [часы]"""
+        query, hours = self._parse_node_args(context.args)
+        if not query:
+            await update.message.reply_text("❌ Укажите узел, например: /telemetry !12345678 24")
+            return
+        if hours <= 0:
+            await update.message.reply_text("❌ Период должен быть больше нуля")
+            return
+        
+        try:
+            node = await self.db.find_node(query)
+            if node is None:
+                await update.message.reply_text(f"❌ Узел не найден: {query}")
+                return
+            resolution, series = await self.db.query_telemetry(node.node_id, hours)
+        except Exception as e:
+            self.logger.error(f"Ошибка при получении телеметрии: {e}")
+            await update.message.reply_text("❌ Ошибка при получении телеметрии")
+            return
+        
+        title = node.long_name or node.node_id
+        if not series:
+            await update.message.reply_text(f"❌ Нет телеметрии от {title} за {hours:g} ч")
+            return
+        
+        step = "1 мин" if resolution == 60 else "1 ч"
+        end = datetime.utcnow()
+        start = end - timedelta(hours=hours)
+        text = f"📈 **Телеметрия {title}** ({node.node_id}) за {hours:g} ч, шаг {step}:\n\n"
+        for metric, (label, unit, digits) in self.TELEMETRY_LABELS.items():
+            rollups = series.get(metric)
+            if not rollups:
+                continue
+            averages = [rollup.total / rollup.count for rollup in rollups]
+            count = sum(rollup.count for rollup in rollups)
+            low = min(rollup.min_value for rollup in rollups)
+            high = max(rollup.max_value for rollup in rollups)
+            average = sum(rollup.total for rollup in rollups) / count
+            text += (
+                f"{label}: {averages[-1]:.{digits}f}{unit}\n"
+                f"  мин. {low:.{digits}f}, ср. {average:.{digits}f}, макс. {high:.{digits}f}\n"
+                f"  {sparkline(downsample(rollups, start, end))}\n"
+            )
+        
+        await update.message.reply_text(text)
+        await self.db.log_message('command', update.effective_chat.id, '/telemetry')
+    
+    async def _track_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /track <узел> [часы]"""
+        query, hours = self._parse_node_args(context.args)
+        if not query:
+            await update.message.reply_text("❌ Укажите узел, например: /track !12345678 24")
+            return
+        if hours <= 0:
+            await update.message.reply_text("❌ Период должен быть больше нуля")
+            return
+        
+        try:
+            node = await self.db.find_node(query)
+            if node is None:
+                await update.message.reply_text(f"❌ Узел не найден: {query}")
+                return
+            track = await self.db.query_track(node.node_id, hours)
+        except Exception as e:
+            self.logger.error(f"Ошибка при получении трека: {e}")
+            await update.message.reply_text("❌ Ошибка при получении трека")
+            return
+        
+        title = node.long_name or node.node_id
+        if not track:
+            await update.message.reply_text(f"❌ Нет координат от {title} за {hours:g} ч")
+            return
+        
+        points = [(sample.latitude, sample.longitude) for sample in track]
+        start, last = track[0], track[-1]
+        displacement = haversine_km(start.latitude, start.longitude, last.latitude, last.longitude)
+        max_distance = max(haversine_km(start.latitude, start.longitude, lat, lon) for lat, lon in points)
+        ago = (datetime.utcnow() - last.ts).total_seconds() / 60
+        
+        text = (
+            f"🧭 **Трек {title}** ({node.node_id}) за {hours:g} ч:\n\n"
+            f"Точек: {len(track)}\n"
+            f"Период: {start.ts:%d.%m %H:%M} – {last.ts:%d.%m %H:%M} UTC\n"
+            f"Пройдено: {track_length_km(points):.2f} км\n"
+            f"Смещение: {displacement:.2f} км (макс. удаление {max_distance:.2f} км)\n"
+            f"Последняя позиция: {last.latitude:.5f}, {last.longitude:.5f} ({ago:.0f} мин назад)\n"
+            f"🗺 https://www.openstreetmap.org/?mlat={last.latitude:.5f}&mlon={last.longitude:.5f}#map=14/"
+            f"{last.latitude:.5f}/{last.longitude:.5f}"
+        )
+        await update.message.reply_text(text)
+        await self.db.log_message('command', update.effective_chat.id, '/track')
+    
+    async def _dm_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /dm <узел> <текст>"""
+        chat_id = update.effective_chat.id
+        if not self._check_access(chat_id):
+            await update.message.reply_text("❌ Доступ запрещен")
+            return
+        args = context.args or []
+        if len(args) < 2:
+            await update.message.reply_text("❌ Используйте: /dm <узел> <текст>, например: /dm !12345678 привет")
+            return
+        
+        try:
+            node = await self.db.find_node(args[0])
+        except Exception as e:
+            self.logger.error(f"Ошибка поиска узла: {e}")
+            await update.message.reply_text("❌ Ошибка поиска узла")
+            return
+        if node is None:
+            await update.message.reply_text(f"❌ Узел не найден: {args[0]}")
+            return
+        
+        # Текст после имени узла с исходными пробелами и переносами
+        text = update.message.text.split(None, 2)[2]
+        target = self.routing.mesh_target(chat_id)
+        channel = target.channel if target is not None else 0
+        await self._forward_to_mesh(update, text, {'destination': node.node_id, 'channel': channel})
+    
+    async def _near_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /near [км] или /near <широта> <долгота> [км]"""
+        chat_id = update.effective_chat.id
+        args = context.args or []
+        try:
+            values = [float(arg.replace(',', '.')) for arg in args]
+        except ValueError:
+            await update.message.reply_text("❌ Используйте: /near [км] или /near <широта> <долгота> [км]")
+            return
+        
+        radius = self.NEAR_DEFAULT_RADIUS_KM
+        if len(values) >= 2:
+            lat, lon = values[0], values[1]
+            if len(values) > 2:
+                radius = values[2]
+        else:
+            location = self.user_locations.get(chat_id)
+            if location is None:
+                await update.message.reply_text(
+                    "📍 Сначала отправьте местоположение или укажите координаты: /near <широта> <долгота> [км]"
+                )
+                return
+            lat, lon = location
+            if values:
+                radius = values[0]
+        
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not 0 < radius <= self.NEAR_MAX_RADIUS_KM:
+            await update.message.reply_text(
+                f"❌ Неверные координаты или радиус (до {self.NEAR_MAX_RADIUS_KM} км)"
+            )
+            return
+        
+        try:
+            nodes = await self.db.nodes_within(lat, lon, radius, self.near_hours)
+        except Exception as e:
+            self.logger.error(f"Ошибка поиска узлов рядом: {e}")
+            await update.message.reply_text("❌ Ошибка при поиске узлов")
+            return
         
-        await update.message.reply_text(nodes_text)
-        self.database.log_message('command', update.effective_chat.id, '/nodes')
+        if not nodes:
+            await update.message.reply_text(f"❌ Нет узлов в радиусе {radius:g} км за последние {self.near_hours:g} ч")
+            return
+        
+        now = datetime.utcnow()
+        text = f"📡 **Узлы в радиусе {radius:g} км** за {self.near_hours:g} ч ({len(nodes)}):\n\n"
+        for node, distance in nodes[:self.NEAR_MAX_RESULTS]:
+            name = node.long_name or node.short_name or node.node_id
+            ago = (now - node.last_seen).total_seconds() / 60
+            text += f"• **{name}** - {distance:.2f} км ({ago:.0f} мин назад)\n"
+        if len(nodes) > self.NEAR_MAX_RESULTS:
+            text += f"\n...и еще {len(nodes) - self.NEAR_MAX_RESULTS}"
+        
+        await update.message.reply_text(text)
+        await self.db.log_message('command', chat_id, '/near')
     
     async def _stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /stats"""
         try:
-            # Статистика сообщений
-            to_mesh = self.database.session.query(Message).filter_by(direction='to_mesh').count()
-            from_mesh = self.database.session.query(Message).filter_by(direction='from_mesh').count()
-            
-            # Статистика пользователей
-            total_users = self.database.session.query(User).count()
-            active_users = self.database.session.query(User).filter(
-                User.last_active != None
-            ).count()
-            
-            # Статистика узлов
-            total_nodes = self.database.session.query(MeshNode).count()
+            stats = await self.db.get_stats()
         except Exception as e:
             self.logger.error(f"Ошибка при получении статистики: {e}")
             await update.message.reply_text("❌ Ошибка при получении статистики")
@@ -230,20 +542,20 @@ class TelegramBot:
 📊 **Статистика моста**
 
 👥 **Пользователи:**
-   Всего: {total_users}
-   Активных: {active_users}
+   Всего: {stats['total_users']}
+   Активных: {stats['active_users']}
 
 📨 **Сообщения:**
-   ➡️ В Mesh: {to_mesh}
-   ⬅️ Из Mesh: {from_mesh}
-   Всего: {to_mesh + from_mesh}
+   ➡️ В Mesh: {stats['to_mesh']}
+   ⬅️ Из Mesh: {stats['from_mesh']}
+   Всего: {stats['to_mesh'] + stats['from_mesh']}
 
 📡 **Узлы сети:**
-   Всего: {total_nodes}
+   Всего: {stats['total_nodes']}
         """
         
         await update.message.reply_text(stats_text)
-        self.database.log_message('command', update.effective_chat.id, '/stats')
+        await self.db.log_message('command', update.effective_chat.id, '/stats')
     
     async def _location_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /location"""
@@ -251,18 +563,23 @@ class TelegramBot:
             "📍 Отправьте ваше местоположение через вложение (Attachment) → Location"
         )
     
-    async def _admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик команды /admin"""
-        chat_id = update.effective_chat.id
+    async def _check_admin(self, update: Update) -> bool:
+        """Проверка прав администратора с ответом пользователю при отказе"""
         try:
-            user = self.database.session.query(User).filter_by(chat_id=chat_id).first()
+            user = await self.db.get_user(update.effective_chat.id)
         except Exception as e:
             self.logger.error(f"Ошибка при проверке прав администратора: {e}")
             await update.message.reply_text("❌ Ошибка при проверке прав")
-            return
+            return False
         
         if not user or not user.is_admin:
             await update.message.reply_text("❌ Недостаточно прав")
+            return False
+        return True
+    
+    async def _admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /admin"""
+        if not await self._check_admin(update):
             return
         
         admin_text = """
@@ -271,15 +588,92 @@ class TelegramBot:
 Доступные команды:
 • /stats - детальная статистика
 • /nodes - список всех узлов
+• /approve <chat_id> - включить рассылку пользователю
+• /block <chat_id> - исключить пользователя из рассылки
 
 Статус системы:
 • MQTT: ✅ Активно
 • База данных: ✅ Активно
 • Telegram: ✅ Активно
         """
-        
+
+        if self.message_queue:
+            queue_stats = self.message_queue.stats()
+            admin_text += (
+                f"\nОчередь Mesh → Telegram: {queue_stats['depth']}\n"
+                f"Задержка доставки: ср. {queue_stats['delivery']['avg_ms']:.0f} мс, "
+                f"макс. {queue_stats['delivery']['max_ms']:.0f} мс\n"
+            )
+
+        for provider in self.status_providers:
+            try:
+                admin_text += f"{provider()}\n"
+            except Exception as e:
+                self.logger.error(f"Ошибка получения статуса: {e}")
+
         await update.message.reply_text(admin_text)
     
+    async def _approve_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /approve <chat_id>"""
+        await self._set_approval(update, context, True)
+    
+    async def _block_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /block <chat_id>"""
+        await self._set_approval(update, context, False)
+    
+    async def _set_approval(self, update: Update, context: ContextTypes.DEFAULT_TYPE, approved: bool):
+        """Включение или исключение пользователя из рассылки сообщений из Mesh"""
+        if not await self._check_admin(update):
+            return
+        
+        command = 'approve' if approved else 'block'
+        args = context.args or []
+        try:
+            target = int(args[0]) if len(args) == 1 else None
+        except ValueError:
+            target = None
+        if target is None:
+            await update.message.reply_text(f"❌ Используйте: /{command} <chat_id>")
+            return
+        
+        try:
+            found = await self.db.set_user_flags(target, is_approved=approved)
+        except Exception as e:
+            self.logger.error(f"Ошибка при изменении пользователя {target}: {e}")
+            await update.message.reply_text("❌ Ошибка при изменении пользователя")
+            return
+        
+        if not found:
+            await update.message.reply_text(f"❌ Пользователь {target} не найден")
+            return
+        status = "получает" if approved else "не получает"
+        await update.message.reply_text(f"✅ Пользователь {target} {status} сообщения из Mesh")
+        await self.db.log_message('command', update.effective_chat.id, f"/{command} {target}")
+    
+    def _dispatch(self, action: str, data: Dict) -> List:
+        """Передача сообщения обработчикам, результаты постановки в очередь"""
+        results = []
+        for handler in self.message_handlers:
+            try:
+                results.append(handler(action, data))
+            except Exception as e:
+                self.logger.error(f"Ошибка в обработчике отправки: {e}")
+        return results
+    
+    def _delivery_status(self, results: List, sent_text: str):
+        """Ответ пользователю по результату планировщика: (принято, текст)"""
+        for result in results:
+            status = getattr(result, 'status', None)
+            if status == SubmitResult.REJECTED and result.reason == 'no_route':
+                return False, "❌ Этот чат не связан с каналом Mesh"
+            if status == SubmitResult.REJECTED:
+                return False, "❌ Эфир перегружен, сообщение не отправлено. Попробуйте позже"
+            if status == SubmitResult.QUEUED:
+                return True, f"⏳ Эфир занят, сообщение в очереди (~{result.wait:.0f} с)"
+            if status == SubmitResult.MERGED:
+                return True, f"⏳ Эфир занят, сообщение добавлено к ожидающему (~{result.wait:.0f} с)"
+        return True, sent_text
+    
     async def _text_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка текстовых сообщений"""
         chat_id = update.effective_chat.id
@@ -289,6 +683,12 @@ class TelegramBot:
             await update.message.reply_text("❌ Доступ запрещен")
             return
         
+        await self._forward_to_mesh(update, text)
+    
+    async def _forward_to_mesh(self, update: Update, text: str, route: Optional[Dict] = None):
+        """Отправка текста пользователя в Mesh; route - явные канал и адресат"""
+        chat_id = update.effective_chat.id
+        
         # Форматирование сообщения
         user = update.effective_user
         sender_name = user.first_name or user.username or "Unknown"
@@ -297,21 +697,30 @@ class TelegramBot:
             message=text
         )
         
-        # Ограничение длины
-        max_len = self.config['bridge']['max_message_length']
-        if len(formatted_text) > max_len:
-            formatted_text = formatted_text[:max_len-3] + "..."
+        # Разбиение на фрагменты по лимиту пакета Meshtastic в байтах UTF-8
+        frames_config = self.config['bridge'].get('frames', {})
+        frames, truncated = split_frames(
+            formatted_text,
+            frames_config.get('max_bytes', 200),
+            frames_config.get('max_frames', 8)
+        )
+        if truncated:
             await update.message.reply_text("⚠️ Сообщение обрезано")
         
-        # Отправка через обработчики
-        for handler in self.message_handlers:
-            try:
-                handler('send_text', {'text': formatted_text})
-            except Exception as e:
-                self.logger.error(f"Ошибка в обработчике отправки: {e}")
-        
-        await update.message.reply_text("✅ Сообщение отправлено в Mesh-сеть")
-        self.database.log_message('to_mesh', chat_id, text)
+        # Отправка через обработчики, маршрут определяется по чату и теме
+        data = {
+            'text': formatted_text,
+            'frames': frames,
+            'user': user.id,
+            'chat_id': chat_id,
+            'thread_id': update.message.message_thread_id if update.message.is_topic_message else None,
+        }
+        data.update(route or {})
+        results = self._dispatch('send_text', data)
+        accepted, status = self._delivery_status(results, "✅ Сообщение отправлено в Mesh-сеть")
+        await update.message.reply_text(status)
+        if accepted:
+            await self.db.log_message('to_mesh', chat_id, text)
     
     async def _location_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка сообщений с местоположением"""
@@ -328,20 +737,39 @@ class TelegramBot:
         location = update.message.location
         lat = location.latitude
         lon = location.longitude
+        self.user_locations[chat_id] = (lat, lon)
         
         # Отправка через обработчики
-        for handler in self.message_handlers:
-            try:
-                handler('send_position', {'lat': lat, 'lon': lon})
-            except Exception as e:
-                self.logger.error(f"Ошибка в обработчике отправки позиции: {e}")
+        user_id = update.effective_user.id if update.effective_user else chat_id
+        results = self._dispatch('send_position', {'lat': lat, 'lon': lon, 'user': user_id})
+        _, status = self._delivery_status(results, "✅ Местоположение отправлено!")
         
-        await update.message.reply_text(
-            f"✅ Местоположение отправлено!\n"
+        reply = (
+            f"{status}\n"
             f"📍 Широта: {lat:.6f}\n"
             f"📍 Долгота: {lon:.6f}"
         )
-        self.database.log_message('to_mesh', chat_id, f"POSITION: {lat}, {lon}", message_type='position')
+        
+        # Ближайшие узлы из индекса в памяти (того же, что у /near), без обращения к БД
+        try:
+            nearest = self.database.nearest_nodes(
+                lat, lon,
+                self.config['bridge'].get('nearest_nodes', 5),
+                self.config['bridge'].get('nearest_max_km', 300),
+                self.near_hours
+            )
+        except Exception as e:
+            self.logger.error(f"Ошибка поиска ближайших узлов: {e}")
+            nearest = []
+        if nearest:
+            reply += f"\n\n📡 Ближайшие узлы (слышны за {self.near_hours:g} ч):\n"
+            for node_id, distance in nearest:
+                names = self.database.get_node_names(node_id)
+                name = (names and (names[0] or names[1])) or node_id
+                reply += f"• {name} - {distance:.2f} км\n"
+        
+        await update.message.reply_text(reply)
+        await self.db.log_message('to_mesh', chat_id, f"POSITION: {lat}, {lon}", message_type='position')
     
     def _check_access(self, chat_id: int) -> bool:
         """Проверка доступа пользователя"""
@@ -351,7 +779,12 @@ class TelegramBot:
         if not allowed_chats:
             return True
         
-        return chat_id in allowed_chats
+        # Чаты из маршрутов разрешены без добавления в allowed_chats
+        return chat_id in allowed_chats or chat_id in self._routed_chats
+    
+    async def _send_raw(self, chat_id: int, text: str, thread_id: Optional[int] = None):
+        """Отправка без перехвата ошибок (для планировщика рассылок)"""
+        await self.application.bot.send_message(chat_id=chat_id, text=text, message_thread_id=thread_id)
     
     async def send_message(self, chat_id: int, text: str):
         """Отправка сообщения в Telegram"""
@@ -364,18 +797,84 @@ class TelegramBot:
     async def broadcast_message(self, text: str):
         """Широковещательная отправка сообщения всем пользователям"""
         try:
-            users = self.database.session.query(User).all()
+            # Список получателей берется из кэша, БД запрашивается только после его сброса
+            recipients = await self.db.get_recipient_ids()
         except Exception as e:
             self.logger.error(f"Ошибка при получении списка пользователей: {e}")
             return
         
-        for user in users:
-            try:
-                await self.send_message(user.chat_id, text)
-            except Exception as e:
-                self.logger.error(f"Ошибка отправки пользователю {user.chat_id}: {e}")
+        await self.broadcaster.broadcast(recipients, text)
     
     def run(self):
         """Запуск бота"""
         self.logger.info("Запуск Telegram бота...")
-        self.application.run_polling()
\ No newline at end of file
+        webhook_config = self.config['telegram'].get('webhook', {})
+        if webhook_config.get('enabled', False):
+            asyncio.run(self._run_webhook(webhook_config))
+        else:
+            self.application.run_polling()
+    
+    async def _process_webhook_update(self, data: Dict[str, Any]):
+        """Передача обновления из webhook в очередь обработки приложения"""
+        update = Update.de_json(data, self.application.bot)
+        await self.application.update_queue.put(update)
+    
+    async def _run_webhook(self, webhook_config: Dict[str, Any]):
+        """Прием обновлений через собственный webhook сервер вместо getUpdates"""
+        application = self.application
+        # Без заданного токена генерируется новый при каждом запуске
+        secret_token = webhook_config.get('secret_token') or secrets.token_urlsafe(32)
+        self.webhook_server = WebhookServer(
+            self._process_webhook_update,
+            path=webhook_config.get('path', '/telegram'),
+            secret_token=secret_token,
+            host=webhook_config.get('listen', '0.0.0.0'),
+            port=webhook_config.get('port', 8443),
+            max_body=webhook_config.get('max_body', 1024 * 1024)
+        )
+        self.add_status_provider(self._webhook_status)
+        
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await self.webhook_server.start()
+        try:
+            url = webhook_config.get('url')
+            if url:
+                await application.bot.set_webhook(
+                    url=url,
+                    secret_token=secret_token,
+                    allowed_updates=Update.ALL_TYPES,
+                    max_connections=webhook_config.get('max_connections', 40),
+                    drop_pending_updates=webhook_config.get('drop_pending_updates', False)
+                )
+                self.logger.info(f"Webhook зарегистрирован: {url}")
+            else:
+                self.logger.warning("telegram.webhook.url не задан, webhook в Telegram не регистрируется")
+            await application.start()
+            await stop_event.wait()
+        finally:
+            await self.webhook_server.stop()
+            if application.running:
+                await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+    
+    def _webhook_status(self) -> str:
+        """Строка статуса webhook сервера"""
+        stats = self.webhook_server.stats
+        return (
+            f"Webhook: запросов {stats['requests']}, обновлений {stats['updates']}, "
+            f"отклонено {stats['forbidden']}, некорректных {stats['invalid']}, ошибок {stats['errors']}"
+        )
\ No newline at end of file
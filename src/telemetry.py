@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Метрики, сохраняемые в истории телеметрии (поля TelemetryPacket)
+TELEMETRY_METRICS = (
+    'battery_level', 'voltage', 'channel_utilization', 'air_util_tx',
+    'temperature', 'relative_humidity', 'barometric_pressure'
+)
+
+# Шаги агрегатов: 1 минута и 1 час
+ROLLUP_MINUTE = 60
+ROLLUP_HOUR = 3600
+ROLLUP_RESOLUTIONS = (ROLLUP_MINUTE, ROLLUP_HOUR)
+
+EPOCH = datetime(1970, 1, 1)
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+# Ширина графика в символах независимо от периода
+SPARK_WIDTH = 24
+
+
+def bucket_start(ts: datetime, resolution: int) -> datetime:
+    """Начало интервала агрегации для метки времени (UTC без tzinfo)"""
+    seconds = int((ts - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def aggregate_rollups(samples: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Свертка пачки значений в агрегаты для всех шагов
+
+    Пачка сворачивается в памяти, поэтому на каждый интервал приходится
+    один upsert, а не одна запись на значение.
+    """
+    rollups: Dict[tuple, Dict[str, Any]] = {}
+    for sample in samples:
+        value = sample['value']
+        for resolution in ROLLUP_RESOLUTIONS:
+            bucket = bucket_start(sample['ts'], resolution)
+            key = (sample['node_id'], sample['metric'], resolution, bucket)
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollups[key] = {
+                    'node_id': sample['node_id'],
+                    'metric': sample['metric'],
+                    'resolution': resolution,
+                    'bucket': bucket,
+                    'count': 1,
+                    'total': value,
+                    'min_value': value,
+                    'max_value': value,
+                }
+            else:
+                rollup['count'] += 1
+                rollup['total'] += value
+                rollup['min_value'] = min(rollup['min_value'], value)
+                rollup['max_value'] = max(rollup['max_value'], value)
+    return list(rollups.values())
+
+
+def downsample(rollups: Iterable[Any], start: datetime, end: datetime,
+               width: int = SPARK_WIDTH) -> List[Optional[float]]:
+    """Средние агрегатов в `width` равных интервалах периода [start, end]
+
+    Среднее интервала взвешено числом значений, интервал без данных - None.
+    """
+    span = (end - start).total_seconds()
+    totals = [0.0] * width
+    counts = [0] * width
+    for rollup in rollups:
+        offset = (rollup.bucket - start).total_seconds()
+        index = min(width - 1, max(0, int(offset * width / span))) if span > 0 else width - 1
+        totals[index] += rollup.total
+        counts[index] += rollup.count
+    return [total / count if count else None for total, count in zip(totals, counts)]
+
+
+def sparkline(values: Sequence[Optional[float]]) -> str:
+    """Строка-график из символов разной высоты, пропуск (None) - пробел"""
+    present = [value for value in values if value is not None]
+    if not present:
+        return ''
+    low, high = min(present), max(present)
+    if high == low:
+        return ''.join(' ' if value is None else SPARK_CHARS[len(SPARK_CHARS) // 2] for value in values)
+    scale = (len(SPARK_CHARS) - 1) / (high - low)
+    return ''.join(' ' if value is None else SPARK_CHARS[int((value - low) * scale)] for value in values)
@@ -0,0 +1,74 @@
+import functools
+from typing import Any, Dict, Optional
+
+# Имена и номера портов Meshtastic -> тип сообщения моста
+PORT_ALIASES = {
+    'text': 'text', 'sendtext': 'text', 'TEXT_MESSAGE_APP': 'text', '1': 'text',
+    'position': 'position', 'POSITION_APP': 'position', '3': 'position',
+    'nodeinfo': 'nodeinfo', 'NODEINFO_APP': 'nodeinfo', '4': 'nodeinfo',
+    'telemetry': 'telemetry', 'TELEMETRY_APP': 'telemetry', '67': 'telemetry',
+}
+
+
+class TopicInfo:
+    """Разобранный топик msh/<region>/<ver>/<fmt>/<channel>/<gateway>/<port>"""
+
+    __slots__ = ('region', 'version', 'fmt', 'channel', 'gateway', 'port')
+
+    def __init__(self, region=None, version=None, fmt='json', channel=None, gateway=None, port=None):
+        self.region = region
+        self.version = version
+        self.fmt = fmt
+        self.channel = channel
+        self.gateway = gateway
+        self.port = port
+
+
+def parse_topic(topic: str) -> TopicInfo:
+    """Разбор структуры топика
+
+    msh/2/json/!12345678/text          -> fmt json, gateway !12345678, port text
+    msh/EU_868/2/e/LongFast/!a1b2c3d4  -> region EU_868, fmt e, channel LongFast
+    """
+    parts = topic.split('/')
+    version_index = None
+    for index in range(1, min(len(parts) - 1, 4)):
+        if parts[index] == '2':
+            version_index = index
+            break
+    if version_index is None:
+        return TopicInfo()
+
+    info = TopicInfo(
+        region='/'.join(parts[1:version_index]) or None,
+        version=parts[version_index],
+        fmt=parts[version_index + 1]
+    )
+    rest = parts[version_index + 2:]
+    if rest and rest[-1] and not rest[-1].startswith('!'):
+        info.port = PORT_ALIASES.get(rest.pop(), None)
+    if rest and rest[-1].startswith('!'):
+        info.gateway = rest.pop()
+    if rest and rest[-1]:
+        info.channel = rest[-1]
+    return info
+
+
+class TopicRouter:
+    """Классификация пакетов по разобранному топику
+
+    Топики повторяются, поэтому результат разбора кэшируется и тип
+    сообщения определяется одним обращением к словарю. Если порт в топике
+    не указан (топики прошивки), используется поле 'type' пакета.
+    """
+
+    def __init__(self, cache_size: int = 4096):
+        self.parse = functools.lru_cache(maxsize=cache_size)(parse_topic)
+
+    def message_type(self, topic: str, data: Optional[Dict[str, Any]] = None) -> str:
+        port = self.parse(topic).port
+        if port:
+            return port
+        if data:
+            return PORT_ALIASES.get(data.get('type'), 'unknown')
+        return 'unknown'
@@ -0,0 +1,154 @@
+import asyncio
+import hmac
+import json
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+# Telegram допускает 1-256 символов A-Z, a-z, 0-9, _ и -
+SECRET_TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]{1,256}$')
+
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 411: 'Length Required', 413: 'Payload Too Large',
+}
+
+
+class WebhookServer:
+    """Минимальный HTTP сервер для приема обновлений Telegram
+
+    Принимает только POST на `path` с заголовком
+    X-Telegram-Bot-Api-Secret-Token, равным `secret_token`. Тело запроса
+    передается в `handle` как словарь; ответ 200 отправляется сразу, не
+    дожидаясь обработки обновления. Соединения keep-alive обслуживаются
+    без переподключения.
+    """
+
+    def __init__(self, handle: Callable[[Dict[str, Any]], Awaitable[None]], path: str = '/telegram',
+                 secret_token: Optional[str] = None, host: str = '0.0.0.0', port: int = 8443,
+                 max_body: int = 1024 * 1024, read_timeout: float = 30.0):
+        if secret_token is not None and not SECRET_TOKEN_RE.match(secret_token):
+            raise ValueError("secret_token: 1-256 символов A-Z, a-z, 0-9, _ и -")
+        self.logger = logging.getLogger(__name__)
+        self.handle = handle
+        self.path = path
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self.read_timeout = read_timeout
+        self._server: Optional[asyncio.AbstractServer] = None
+
+        self.stats = {'requests': 0, 'updates': 0, 'forbidden': 0, 'invalid': 0, 'errors': 0}
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        # При port=0 порт выбирает система
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.logger.info(f"Webhook сервер слушает {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await asyncio.wait_for(self._read_request(reader), self.read_timeout)
+                if request is None:
+                    break
+                status, keep_alive = await self._dispatch(*request)
+                self._respond(writer, status, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            self.logger.error(f"Ошибка webhook соединения: {e}")
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple]:
+        """(метод, путь, заголовки, тело, версия HTTP) или None при закрытом соединении"""
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            return 'INVALID', '', {}, b'', 'HTTP/1.0'
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+            if len(headers) > 100:
+                return 'INVALID', '', {}, b'', version
+
+        body = b''
+        length = headers.get('content-length')
+        if length is not None:
+            if not length.isdigit():
+                return 'INVALID', '', {}, b'', version
+            if int(length) > self.max_body:
+                return 'TOO_LARGE', target, headers, b'', version
+            body = await reader.readexactly(int(length))
+        return method, target.split('?', 1)[0], headers, body, version
+
+    async def _dispatch(self, method: str, path: str, headers: Dict[str, str], body: bytes,
+                        version: str) -> Tuple[int, bool]:
+        """Код ответа и признак keep-alive"""
+        self.stats['requests'] += 1
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+        if method == 'INVALID':
+            self.stats['invalid'] += 1
+            return 400, False
+        if method == 'TOO_LARGE':
+            self.stats['invalid'] += 1
+            return 413, False
+        if path != self.path:
+            return 404, keep_alive
+        if method != 'POST':
+            return 405, keep_alive
+        if self.secret_token is not None and not hmac.compare_digest(
+                headers.get(SECRET_HEADER, '').encode(), self.secret_token.encode()):
+            self.stats['forbidden'] += 1
+            self.logger.warning("Webhook запрос с неверным секретным токеном")
+            return 403, keep_alive
+        if 'content-length' not in headers:
+            return 411, False
+
+        try:
+            data = json.loads(body)
+            if not isinstance(data, dict):
+                raise ValueError("ожидался объект JSON")
+        except ValueError as e:
+            self.stats['invalid'] += 1
+            self.logger.warning(f"Некорректное тело webhook запроса: {e}")
+            return 400, keep_alive
+
+        try:
+            await self.handle(data)
+            self.stats['updates'] += 1
+        except Exception as e:
+            # Повтор от Telegram не поможет - обновление подтверждается
+            self.stats['errors'] += 1
+            self.logger.error(f"Ошибка обработки обновления {data.get('update_id')}: {e}")
+        return 200, keep_alive
+
+    @staticmethod
+    def _respond(writer: asyncio.StreamWriter, status: int, keep_alive: bool):
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+        )
@@ -0,0 +1,300 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+
+class WriteBehindBuffer:
+    """Буфер отложенной пакетной записи в БД
+
+    Записи копятся в памяти и сбрасываются одной транзакцией при
+    достижении `max_batch`, по таймеру `flush_interval` или при остановке.
+    Гарантия сохранности при сбое задается параметром `durability`:
+      none    - записи в памяти теряются при аварийном завершении;
+      journal - каждая запись дописывается в журнал на диске (переживает
+                падение процесса, но не отключение питания);
+      fsync   - журнал синхронизируется с диском после каждой записи.
+    Журнал разбит на сегменты, сегмент удаляется после успешной фиксации
+    своей пачки; оставшиеся сегменты воспроизводятся при запуске.
+    Неудачная пачка повторяется с нарастающей паузой (`retry_backoff`,
+    не больше `max_backoff`). Ошибки из `transient_errors` (недоступность
+    БД) повторяются без ограничения числа попыток. После `max_retries`
+    прочих ошибок записи пачки сохраняются по одной, а не принятые БД
+    откладываются в `dead_letter_path` (или в лог, если путь не задан) и
+    больше не задерживают остальные.
+    """
+
+    DURABILITY = ('none', 'journal', 'fsync')
+
+    def __init__(self, flush_func: Callable[[List[Dict[str, Any]]], None], name: str = 'write-buffer',
+                 max_batch: int = 100, flush_interval: float = 2.0, durability: str = 'journal',
+                 journal_path: Optional[str] = None, max_retries: int = 5, retry_backoff: float = 1.0,
+                 max_backoff: float = 60.0, dead_letter_path: Optional[str] = None,
+                 transient_errors: Tuple[Type[BaseException], ...] = ()):
+        if durability not in self.DURABILITY:
+            raise ValueError(f"Неизвестный режим сохранности: {durability}")
+        if durability != 'none' and not journal_path:
+            raise ValueError("Для журналирования требуется journal_path")
+
+        self.logger = logging.getLogger(__name__)
+        self.flush_func = flush_func
+        self.name = name
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.journal_path = journal_path
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.dead_letter_path = dead_letter_path or (f"{journal_path}.dead" if journal_path else None)
+        self.transient_errors = transient_errors
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._buffer: List[Dict[str, Any]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        self._journal = None
+        self._segment = 0
+        # Сегменты журнала, записи которых еще не зафиксированы в БД
+        self._pending_segments: List[str] = []
+        # Подряд неудачных попыток сброса и время следующей попытки
+        self._failures = 0
+        self._retry_at = 0.0
+
+        self.flushed = 0
+        self.batches = 0
+        self.retries = 0
+        self.dead_lettered = 0
+
+    def start(self):
+        """Воспроизведение журнала и запуск фонового сброса"""
+        if self.durability != 'none':
+            self._replay_journal()
+            self._open_segment()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка со сбросом всех накопленных записей"""
+        self._running = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush(force=True)
+        if self._buffer and self.durability == 'none':
+            # Без журнала записи иначе пропадут при остановке
+            self._dead_letter(self._buffer, "не сохранены при остановке")
+            self._buffer = []
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+            if not self._buffer:
+                # Все записи зафиксированы, журнал больше не нужен
+                for path in self._pending_segments + [self._segment_path(self._segment)]:
+                    self._remove_segment(path)
+                self._pending_segments = []
+
+    def add(self, entry: Dict[str, Any]):
+        """Добавление записи (из любого потока)"""
+        with self._lock:
+            self._buffer.append(entry)
+            if self._journal:
+                self._journal.write(json.dumps(entry, default=_json_default, ensure_ascii=False) + '\n')
+                self._journal.flush()
+                if self.durability == 'fsync':
+                    os.fsync(self._journal.fileno())
+            full = len(self._buffer) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self, force: bool = False):
+        """Сброс накопленных записей одной транзакцией
+
+        После ошибки сброс откладывается до истечения паузы повтора,
+        force - попытка без ожидания (при остановке).
+        """
+        with self._flush_lock:
+            if not force and time.monotonic() < self._retry_at:
+                return
+            with self._lock:
+                if not self._buffer:
+                    return
+                batch = self._buffer
+                self._buffer = []
+                if self._journal:
+                    # Новые записи идут в следующий сегмент
+                    self._pending_segments.append(self._segment_path(self._segment))
+                    self._journal.close()
+                    self._segment += 1
+                    self._open_segment()
+
+            try:
+                self.flush_func(batch)
+                written = len(batch)
+            except Exception as e:
+                self._failures += 1
+                transient = isinstance(e, self.transient_errors)
+                if transient or self._failures <= self.max_retries:
+                    retry = f"{self._failures}" if transient else f"{self._failures}/{self.max_retries}"
+                    delay = self._postpone(batch)
+                    self.logger.error(
+                        f"Ошибка пакетной записи ({self.name}), записей: {len(batch)}: {e}; "
+                        f"повтор {retry} через {delay:.0f} с"
+                    )
+                    return
+                self.logger.error(
+                    f"Ошибка пакетной записи ({self.name}) после {self.max_retries} повторов: {e}; "
+                    f"записи сохраняются по одной"
+                )
+                written = self._write_one_by_one(batch)
+                if written is None:
+                    return
+
+            self._failures = 0
+            self._retry_at = 0.0
+            self.flushed += written
+            self.batches += 1
+            segments, self._pending_segments = self._pending_segments, []
+            for path in segments:
+                self._remove_segment(path)
+
+    def _postpone(self, batch: List[Dict[str, Any]]) -> float:
+        """Возврат пачки в начало буфера до следующей попытки, возвращает паузу"""
+        # Показатель ограничен: при долгой недоступности БД попытки не заканчиваются
+        delay = min(self.retry_backoff * 2 ** min(self._failures - 1, 32), self.max_backoff)
+        self._retry_at = time.monotonic() + delay
+        self.retries += 1
+        # Сегменты журнала сохраняются до фиксации пачки
+        with self._lock:
+            self._buffer = batch + self._buffer
+        return delay
+
+    def _write_one_by_one(self, batch: List[Dict[str, Any]]) -> Optional[int]:
+        """Запись пачки по одной, непринятые записи откладываются
+
+        Возвращает число записанных или None, если БД стала недоступна и
+        оставшиеся записи возвращены в буфер.
+        """
+        rejected = []
+        error = None
+        written = 0
+        for index, entry in enumerate(batch):
+            try:
+                self.flush_func([entry])
+                written += 1
+            except self.transient_errors as e:
+                # Недоступность БД не повод откладывать записи
+                self.flushed += written
+                if rejected:
+                    self._dead_letter(rejected, error)
+                delay = self._postpone(batch[index:])
+                self.logger.error(f"Ошибка записи ({self.name}): {e}; повтор через {delay:.0f} с")
+                return None
+            except Exception as e:
+                rejected.append(entry)
+                error = e
+        if rejected:
+            self._dead_letter(rejected, error)
+        return written
+
+    def _dead_letter(self, entries: List[Dict[str, Any]], reason):
+        """Сохранение непринятых записей отдельно от журнала"""
+        self.dead_lettered += len(entries)
+        lines = [json.dumps(entry, default=_json_default, ensure_ascii=False) for entry in entries]
+        if self.dead_letter_path:
+            try:
+                directory = os.path.dirname(self.dead_letter_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
+                self.logger.error(
+                    f"Отложено записей ({self.name}): {len(entries)} в {self.dead_letter_path}: {reason}"
+                )
+                return
+            except OSError as e:
+                self.logger.error(f"Не удалось записать {self.dead_letter_path}: {e}")
+        self.logger.error(f"Отброшено записей ({self.name}): {len(entries)}: {reason}")
+        for line in lines:
+            self.logger.error(f"Отброшенная запись ({self.name}): {line}")
+
+    def _run(self):
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _segment_path(self, segment: int) -> str:
+        return f"{self.journal_path}.{segment}"
+
+    def _open_segment(self):
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._journal = open(self._segment_path(self._segment), 'a', encoding='utf-8')
+
+    def _remove_segment(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.error(f"Не удалось удалить сегмент журнала {path}: {e}")
+
+    def _replay_journal(self):
+        """Загрузка записей, не зафиксированных до аварийного завершения"""
+        segments = []
+        for path in glob.glob(f"{glob.escape(self.journal_path)}.*"):
+            suffix = path.rsplit('.', 1)[-1]
+            if suffix.isdigit():
+                segments.append((int(suffix), path))
+        segments.sort()
+
+        restored = 0
+        for _, path in segments:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        self._buffer.append(json.loads(line, object_hook=_json_object_hook))
+                        restored += 1
+                    except json.JSONDecodeError:
+                        # Оборванная последняя строка при аварии
+                        self.logger.warning(f"Пропущена поврежденная запись журнала {path}")
+            self._pending_segments.append(path)
+
+        if segments:
+            if not restored:
+                for path in self._pending_segments:
+                    self._remove_segment(path)
+                self._pending_segments = []
+            self._segment = segments[-1][0] + 1
+        if restored:
+            self.logger.info(f"Восстановлено из журнала ({self.name}): {restored} записей")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def _json_object_hook(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import threading
+
+from src.channel import AsyncMessageChannel
+
+
+def test_drain_waits_for_items_put_from_threads(caplog):
+    channel = AsyncMessageChannel()
+    delivered = []
+
+    async def consume():
+        while True:
+            for enqueued_at, item in await channel.get_batch():
+                await asyncio.sleep(0.01)
+                delivered.append(item)
+                channel.mark_delivered(enqueued_at)
+
+    async def main():
+        channel.bind()
+        consumer = asyncio.create_task(consume())
+        # Сброс накопленных текстов при остановке идет из другого потока
+        producer = threading.Thread(target=lambda: [channel.put(i) for i in range(5)])
+        producer.start()
+        await asyncio.get_running_loop().run_in_executor(None, producer.join)
+        assert await channel.drain(1.0)
+        consumer.cancel()
+        await asyncio.sleep(0)
+        # Недоставленное при отвязке не пропадает молча
+        channel.put('queued')
+        await asyncio.sleep(0)
+        channel.put('late')
+        channel.unbind()
+        await asyncio.sleep(0)
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(main())
+    assert delivered == [0, 1, 2, 3, 4]
+    assert "не доставлено сообщений: 1" in caplog.text
+    assert "сообщение отброшено" in caplog.text
@@ -0,0 +1,58 @@
+import os
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+
+alembic = pytest.importorskip('alembic')
+from alembic import command
+from alembic.config import Config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _config(url):
+    config = Config(os.path.join(ROOT, 'alembic.ini'))
+    config.set_main_option('script_location', os.path.join(ROOT, 'migrations'))
+    config.set_main_option('sqlalchemy.url', url)
+    return config
+
+
+def test_node_ids_are_normalized_and_merged(tmp_path, monkeypatch):
+    monkeypatch.setenv('BRIDGE_CONFIG', str(tmp_path / 'missing.yaml'))
+    url = f"sqlite:///{tmp_path / 'bridge.db'}"
+    config = _config(url)
+    engine = sa.create_engine(url)
+
+    # База до нормализации: узел записан числом и еще раз в новом виде
+    command.upgrade(config, '0003')
+    old, new = datetime(2026, 1, 1), datetime(2026, 2, 1)
+    with engine.begin() as connection:
+        connection.execute(sa.text(
+            "INSERT INTO mesh_nodes (node_id, long_name, short_name, last_seen, message_count) VALUES "
+            "('123456789', 'Old name', 'OLD', :old, 5), ('!075BCD15', NULL, 'NEW', :new, 2), ('42', 'Other', NULL, :old, 1)"
+        ), {'old': old, 'new': new})
+        connection.execute(sa.text("INSERT INTO messages (direction, mesh_node, content) VALUES ('from_mesh', '123456789', 'hi')"))
+    command.upgrade(config, 'head')
+    with engine.begin() as connection:
+        connection.execute(sa.text(
+            "INSERT INTO telemetry_rollups (node_id, metric, resolution, bucket, count, total, min_value, max_value) "
+            "VALUES ('123456789', 'voltage', 60, :old, 2, 8.0, 3.9, 4.1), ('!075bcd15', 'voltage', 60, :old, 1, 3.5, 3.5, 3.5)"
+        ), {'old': old})
+        connection.execute(sa.text("INSERT INTO position_history (node_id, latitude, longitude, ts) VALUES ('123456789', 55.7, 37.6, :old)"), {'old': old})
+    # Таблицы истории созданы приложением (create_all) раньше, чем применена нормализация
+    command.stamp(config, '0003')
+    command.upgrade(config, 'head')
+
+    with engine.connect() as connection:
+        nodes = connection.execute(sa.text(
+            "SELECT node_id, long_name, short_name, last_seen, message_count FROM mesh_nodes ORDER BY node_id"
+        )).all()
+        assert [row[:3] for row in nodes] == [('!0000002a', 'Other', None), ('!075bcd15', 'Old name', 'NEW')]
+        assert nodes[1][4] == 7
+        assert connection.execute(sa.text("SELECT mesh_node FROM messages")).scalar() == '!075bcd15'
+        assert connection.execute(sa.text("SELECT node_id FROM position_history")).scalar() == '!075bcd15'
+        rollup = connection.execute(sa.text(
+            "SELECT node_id, count, total, min_value, max_value FROM telemetry_rollups"
+        )).all()
+        assert rollup == [('!075bcd15', 3, 11.5, 3.5, 4.1)]
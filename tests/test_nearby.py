@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models import Database
+
+
+@pytest.fixture
+def database(tmp_path):
+    options = {'log_buffer': {'enabled': False}, 'telemetry': {'enabled': False},
+               'positions': {'enabled': False}, 'node_cache': {'enabled': False}}
+    db = Database(f"sqlite:///{tmp_path / 'bridge.db'}", options)
+    yield db
+    db.close()
+
+
+def _place(db, node_id, lat, lon):
+    db.update_node(node_id, {'user': {'longName': node_id}, 'position': {'latitude': lat, 'longitude': lon}})
+
+
+def test_near_and_nearest_use_the_same_index(database):
+    _place(database, '!00000001', 55.75, 37.61)
+    _place(database, '!00000002', 55.80, 37.70)
+    _place(database, '!00000003', 55.76, 37.62)
+    # Узел с давней позицией не попадает ни в один из ответов
+    database.node_cache._nodes['!00000003'].last_seen = datetime.utcnow() - timedelta(hours=48)
+
+    within = database.nodes_within(55.75, 37.61, 50)
+    nearest = database.nearest_nodes(55.75, 37.61, 5, 50)
+    assert [node.node_id for node, _ in within] == [node_id for node_id, _ in nearest] == ['!00000001', '!00000002']
+    assert [round(km, 6) for _, km in within] == [round(km, 6) for _, km in nearest]
+    assert database.nearest_nodes(55.75, 37.61, 1, 50) == nearest[:1]
@@ -0,0 +1,59 @@
+from src.node_cache import NodeState, NodeStateCache
+
+
+def _cache(stored, capacity=2):
+    written = {}
+
+    def flush(rows):
+        for row in rows:
+            written[row['node_id']] = row
+            stored[row['node_id']] = NodeState(**row)
+
+    return NodeStateCache(flush, capacity=capacity, load_func=stored.get), written
+
+
+def _info(name):
+    return {'user': {'longName': name, 'shortName': name[:4]}}
+
+
+def test_evicts_least_recently_used_clean_nodes():
+    stored = {}
+    cache, _ = _cache(stored)
+    cache.apply('!00000001', _info('one'))
+    cache.apply('!00000002', _info('two'))
+    cache.apply('!00000003', _info('three'))
+    # Не записанные в БД узлы не вытесняются
+    assert len(cache) == 3
+
+    cache.flush()
+    assert len(cache) == 2 and cache.evictions == 1
+    assert '!00000001' not in cache._nodes
+
+
+def test_miss_falls_back_to_database():
+    stored = {}
+    cache, _ = _cache(stored)
+    for number in range(1, 4):
+        cache.apply(f'!0000000{number}', _info(f'node{number}'))
+        cache.flush()
+
+    misses = cache.misses
+    assert cache.names('!00000001') == ('node1', 'node')
+    assert cache.misses == misses + 1
+    # Возвращенный узел снова в памяти, вытеснен следующий по давности
+    assert list(cache._nodes) == ['!00000003', '!00000001']
+    assert cache.names('!00000009') is None
+
+
+def test_update_of_evicted_node_keeps_stored_fields():
+    stored = {}
+    cache, written = _cache(stored, capacity=1)
+    cache.apply('!00000001', {**_info('one'), 'position': {'latitude': 55.7, 'longitude': 37.6}})
+    cache.flush()
+    cache.apply('!00000002', _info('two'))
+    cache.flush()
+
+    cache.apply('!00000001', {'deviceMetrics': {'batteryLevel': 80}})
+    cache.flush()
+    row = written['!00000001']
+    assert (row['long_name'], row['latitude'], row['battery_level']) == ('one', 55.7, 80)
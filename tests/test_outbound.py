@@ -0,0 +1,52 @@
+import time
+
+from src.outbound import AirtimeScheduler
+
+
+def _text(n):
+    return {'text': f'fragment {n}'}
+
+
+def test_expired_frames_are_dropped_together():
+    sent = []
+    scheduler = AirtimeScheduler(lambda kind, payload: sent.append(payload['text']), max_wait=0.0)
+    # Бюджета нет - все остается в очереди до истечения max_wait
+    scheduler._tokens = 0.0
+    scheduler.submit_frames('alice', 'text', [_text(1), _text(2), _text(3)])
+    scheduler.submit('bob', 'text', _text(4))
+    time.sleep(0.01)
+    with scheduler._condition:
+        scheduler._tokens = scheduler.burst_ms
+        assert scheduler._next_message(time.monotonic()) is None
+    assert scheduler.stats()['expired'] == 4
+    assert scheduler.stats()['depth'] == 0
+
+
+def test_started_frame_group_is_not_expired():
+    scheduler = AirtimeScheduler(lambda kind, payload: None, max_wait=60.0)
+    scheduler._tokens = 0.0
+    scheduler.submit_frames('alice', 'text', [_text(1), _text(2)])
+    with scheduler._condition:
+        scheduler._tokens = scheduler.burst_ms
+        first = scheduler._next_message(time.monotonic())
+        # Второй фрагмент устарел бы, но начатое сообщение досылается
+        second = scheduler._next_message(time.monotonic() + 120)
+    assert [first.payload['text'], second.payload['text']] == ['fragment 1', 'fragment 2']
+
+
+def test_stop_drains_within_budget_and_counts_dropped():
+    sent = []
+    scheduler = AirtimeScheduler(lambda kind, payload: sent.append(payload['text']), drain_timeout=0.2)
+    scheduler.start()
+    scheduler.submit('alice', 'text', _text(1))
+    scheduler.submit('bob', 'text', _text(2))
+    scheduler.stop()
+    assert sorted(sent) == ['fragment 1', 'fragment 2']
+    assert scheduler.stats()['dropped'] == 0
+
+    scheduler = AirtimeScheduler(lambda kind, payload: None, drain_timeout=0.05)
+    scheduler._tokens = 0.0
+    scheduler.start()
+    scheduler.submit('alice', 'text', _text(1))
+    scheduler.stop()
+    assert scheduler.stats()['dropped'] == 1
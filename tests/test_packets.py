@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from src.dedup import PacketDeduplicator
+from src.packet_codec import PacketDecoder
+from src.packets import build_packet, normalize_node_id
+
+NODE_NUM = 0x7EFEEE00
+GATEWAY = '!a1b2c3d4'
+
+
+@pytest.mark.parametrize('value, expected', [
+    (NODE_NUM, '!7efeee00'),
+    (str(NODE_NUM), '!7efeee00'),
+    ('!7EFEEE00', '!7efeee00'),
+    ('!7efeee00', '!7efeee00'),
+    (0xFFFFFFFF, '^all'),
+    ('^all', '^all'),
+    ('unknown', 'unknown'),
+    (None, None),
+])
+def test_normalize_node_id(value, expected):
+    assert normalize_node_id(value) == expected
+
+
+def _json_payload(message_type, payload):
+    return json.dumps({
+        'from': NODE_NUM, 'to': 0xFFFFFFFF, 'channel': 0, 'type': message_type,
+        'payload': payload, 'id': 4242, 'sender': GATEWAY,
+    }).encode()
+
+
+def _protobuf_payload(portnum, payload):
+    mesh_pb2 = pytest.importorskip('meshtastic.protobuf.mesh_pb2')
+    mqtt_pb2 = pytest.importorskip('meshtastic.protobuf.mqtt_pb2')
+    envelope = mqtt_pb2.ServiceEnvelope(channel_id='LongFast', gateway_id=GATEWAY)
+    packet = envelope.packet
+    setattr(packet, 'from', NODE_NUM)
+    packet.to = 0xFFFFFFFF
+    packet.id = 4242
+    packet.decoded.portnum = portnum
+    packet.decoded.payload = payload
+    return envelope.SerializeToString()
+
+
+@pytest.fixture
+def decoder():
+    decoder = PacketDecoder({'protobuf': {'enabled': True}})
+    if decoder.protobuf is None:
+        pytest.skip("пакет meshtastic не установлен")
+    return decoder
+
+
+def test_text_round_trip_both_codecs(decoder):
+    portnums_pb2 = pytest.importorskip('meshtastic.protobuf.portnums_pb2')
+    from_json = build_packet('text', decoder.decode(
+        'msh/2/json/!a1b2c3d4/text', _json_payload('sendtext', {'text': 'привет'}), 'json'))
+    from_protobuf = build_packet('text', decoder.decode(
+        'msh/EU_868/2/e/LongFast/!a1b2c3d4',
+        _protobuf_payload(portnums_pb2.TEXT_MESSAGE_APP, 'привет'.encode()), 'e'))
+
+    assert from_json.from_node == from_protobuf.from_node == '!7efeee00'
+    assert from_json.to == from_protobuf.to == '^all'
+    assert from_json.text == from_protobuf.text
+
+    # Копии одного пакета от JSON и protobuf шлюзов - дубликат
+    deduplicator = PacketDeduplicator()
+    assert not deduplicator.seen((from_json.from_node, from_json.packet_id))
+    assert deduplicator.seen((from_protobuf.from_node, from_protobuf.packet_id))
+
+
+def test_nodeinfo_round_trip_both_codecs(decoder):
+    mesh_pb2 = pytest.importorskip('meshtastic.protobuf.mesh_pb2')
+    portnums_pb2 = pytest.importorskip('meshtastic.protobuf.portnums_pb2')
+    user = mesh_pb2.User(id='!7efeee00', long_name='Base', short_name='BS')
+    from_json = build_packet('nodeinfo', decoder.decode(
+        'msh/2/json/!a1b2c3d4/nodeinfo',
+        _json_payload('nodeinfo', {'id': NODE_NUM, 'longname': 'Base', 'shortname': 'BS'}), 'json'))
+    from_protobuf = build_packet('nodeinfo', decoder.decode(
+        'msh/EU_868/2/e/LongFast/!a1b2c3d4',
+        _protobuf_payload(portnums_pb2.NODEINFO_APP, user.SerializeToString()), 'e'))
+
+    assert from_json.node_id == from_protobuf.node_id == from_json.from_node == '!7efeee00'
+    assert (from_json.long_name, from_json.short_name) == (from_protobuf.long_name, from_protobuf.short_name)
@@ -0,0 +1,30 @@
+import pytest
+
+from src.models import Database
+
+
+@pytest.fixture
+def database(tmp_path):
+    options = {'log_buffer': {'enabled': False}, 'telemetry': {'enabled': False},
+               'positions': {'enabled': False}, 'node_cache': {'enabled': False}}
+    db = Database(f"sqlite:///{tmp_path / 'bridge.db'}", options)
+    yield db
+    db.close()
+
+
+def test_recipients_follow_approval_changes(database):
+    database.add_user(1, 'alice', 'Alice', None)
+    database.add_user(2, 'bob', 'Bob', None)
+    assert database.get_recipient_ids() == {1, 2}
+    assert database.cached_recipient_ids() == {1, 2}
+
+    assert database.set_user_flags(2, is_approved=False)
+    assert database.cached_recipient_ids() is None
+    assert database.get_recipient_ids() == {1}
+
+    assert database.set_user_flags(2, is_approved=True)
+    assert database.get_recipient_ids() == {1, 2}
+    # Неизвестный пользователь и пустое изменение не меняют получателей
+    assert not database.set_user_flags(3, is_approved=False)
+    assert not database.set_user_flags(1)
+    assert database.get_recipient_ids() == {1, 2}
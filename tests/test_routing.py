@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from src.packet_codec import PacketDecoder
+from src.packets import build_packet
+from src.routing import RoutingTable
+
+ROUTES = {'routes': [
+    {'channel': 1, 'channel_name': 'LongFast', 'chat_id': -100, 'direction': 'to_telegram'},
+    {'channel': 0, 'chat_id': -200, 'direction': 'to_telegram'},
+], 'broadcast_unrouted': False}
+
+
+def _protobuf_text(channel_hash):
+    mqtt_pb2 = pytest.importorskip('meshtastic.protobuf.mqtt_pb2')
+    portnums_pb2 = pytest.importorskip('meshtastic.protobuf.portnums_pb2')
+    envelope = mqtt_pb2.ServiceEnvelope(channel_id='LongFast', gateway_id='!a1b2c3d4')
+    packet = envelope.packet
+    setattr(packet, 'from', 0x12345678)
+    packet.to = 0xFFFFFFFF
+    packet.id = 1
+    packet.channel = channel_hash
+    packet.decoded.portnum = portnums_pb2.TEXT_MESSAGE_APP
+    packet.decoded.payload = b'hi'
+    return envelope.SerializeToString()
+
+
+def _route(table, packet):
+    return table.telegram_targets(packet.from_node, packet.to, packet.channel, packet.channel_name, packet.sender)
+
+
+def test_protobuf_channel_hash_is_not_an_index():
+    decoder = PacketDecoder({'protobuf': {'enabled': True}})
+    if decoder.protobuf is None:
+        pytest.skip("пакет meshtastic не установлен")
+    # Хеш 0 совпал бы с индексом 0 маршрута в чат -200
+    packet = build_packet('text', decoder.decode('msh/EU_868/2/e/LongFast/!a1b2c3d4', _protobuf_text(0), 'e'))
+    assert packet.channel is None
+    assert packet.channel_hash == 0
+    assert packet.channel_name == 'LongFast'
+    assert _route(RoutingTable(ROUTES), packet) == ((-100, None),)
+
+
+def test_json_channel_index_routes():
+    decoder = PacketDecoder({'protobuf': {'enabled': False}})
+    data = decoder.decode('msh/2/json/!a1b2c3d4/text', json.dumps(
+        {'from': 1, 'to': '^all', 'channel': 0, 'type': 'sendtext', 'payload': {'text': 'hi'}}).encode(), 'json')
+    packet = build_packet('text', data)
+    assert _route(RoutingTable(ROUTES), packet) == ((-200, None),)
+
+
+@pytest.mark.parametrize('node', ['!DEADBEEF', 0xDEADBEEF, '3735928559'])
+def test_direct_route_node_is_normalized(node):
+    table = RoutingTable({'direct': [{'node': node, 'chat_id': 42}]})
+    decoder = PacketDecoder({'protobuf': {'enabled': False}})
+    data = decoder.decode('msh/2/json/!a1b2c3d4/text', json.dumps(
+        {'from': 0xDEADBEEF, 'to': 0x12345678, 'channel': 0, 'type': 'sendtext', 'payload': {'text': 'hi'}}).encode(), 'json')
+    assert _route(table, build_packet('text', data)) == ((42, None),)
+    assert table.mesh_target(42).destination == '!deadbeef'
@@ -0,0 +1,71 @@
+import asyncio
+
+from src.sender import BroadcastScheduler
+
+
+def test_timeout_does_not_cover_rate_limit_wait():
+    sent = []
+
+    async def send(chat_id, text):
+        sent.append(chat_id)
+
+    # 60 получателей при 100/с - около 0.6 с очереди, предел запроса 0.2 с
+    scheduler = BroadcastScheduler(send, global_per_second=100, recipient_timeout=0.2)
+    report = asyncio.run(scheduler.broadcast(range(1, 61), 'text'))
+    assert report['sent'] == 60
+    assert report['failed'] == report['timeouts'] == 0
+
+
+def test_hanging_chat_is_not_retried_and_does_not_block_others():
+    attempts = []
+
+    async def send(chat_id, text):
+        attempts.append(chat_id)
+        if chat_id == 2:
+            await asyncio.sleep(10)
+
+    # Одновременно один запрос: зависший чат не должен держать место в семафоре
+    scheduler = BroadcastScheduler(send, concurrency=1, max_retries=3, recipient_timeout=0.05)
+    report = asyncio.run(asyncio.wait_for(scheduler.broadcast([2, 1, 3], 'text'), 1.0))
+    assert report['sent'] == 2
+    assert report['failed'] == report['timeouts'] == 1
+    assert attempts.count(2) == 1
+
+
+def test_hung_recipient_does_not_stall_queue():
+    from src.channel import AsyncMessageChannel
+    from src.telegram_bot import TelegramBot
+
+    config = {'telegram': {'token': '123:abc', 'admin_ids': [2, 1],
+                           'rate_limit': {'recipient_timeout': 0.3, 'admin_timeout': 0.3,
+                                          'per_chat_per_second': 100}}}
+    channel = AsyncMessageChannel()
+    bot = TelegramBot(config, None, channel)
+    delivered = []
+
+    async def send(chat_id, text):
+        if chat_id == 2:
+            await asyncio.sleep(10)
+        delivered.append((chat_id, text))
+
+    async def recipients():
+        return [1]
+
+    bot.broadcaster.send = send
+    bot.db.get_recipient_ids = recipients
+
+    async def main():
+        channel.bind()
+        consumer = asyncio.create_task(bot._process_message_queue_loop())
+        channel.put(('notify_admins', 'digest'))
+        channel.put(('broadcast', 'next'))
+        try:
+            await asyncio.sleep(0.2)
+            # Администратор 1 и следующее сообщение не ждут зависший чат 2
+            assert delivered == [(1, 'digest'), (1, 'next')]
+            await asyncio.sleep(0.3)
+        finally:
+            consumer.cancel()
+
+    asyncio.run(main())
+    assert bot.broadcaster.totals['timeouts'] == 1
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from src.models import Database, TelemetryRollup
+from src.telemetry import ROLLUP_HOUR, ROLLUP_MINUTE, SPARK_WIDTH, downsample, sparkline
+
+
+def _rollup(bucket, value, count=1):
+    return SimpleNamespace(bucket=bucket, total=value * count, count=count)
+
+
+def test_downsample_covers_whole_window():
+    start = datetime(2024, 1, 1)
+    end = start + timedelta(hours=6)
+    # 360 минутных агрегатов: рост в первой половине, затем ровно
+    rollups = [_rollup(start + timedelta(minutes=i), min(i, 180)) for i in range(360)]
+    values = downsample(rollups, start, end)
+    assert len(values) == SPARK_WIDTH
+    assert values[0] < values[5] < values[11]
+    assert values[12:] == [180.0] * 12
+
+
+def test_downsample_weights_by_count_and_marks_gaps():
+    start = datetime(2024, 1, 1)
+    end = start + timedelta(hours=24)
+    values = downsample([_rollup(start, 10, count=3), _rollup(start + timedelta(minutes=30), 20)], start, end)
+    assert values[0] == 12.5
+    assert values[1:] == [None] * (SPARK_WIDTH - 1)
+    assert sparkline([1.0, None, 3.0]) == '▁ █'
+
+
+@pytest.fixture
+def database(tmp_path):
+    options = {'log_buffer': {'enabled': False}, 'telemetry': {'enabled': False},
+               'positions': {'enabled': False}, 'node_cache': {'enabled': False}}
+    db = Database(f"sqlite:///{tmp_path / 'bridge.db'}", options)
+    yield db
+    db.close()
+
+
+@pytest.mark.parametrize('upsert', [True, False])
+def test_repeated_sample_is_counted_once(database, monkeypatch, upsert):
+    if not upsert:
+        # Путь для СУБД без ON CONFLICT
+        monkeypatch.setattr(database, '_dialect_insert', lambda model: None)
+    ts = datetime.utcnow().replace(second=30, microsecond=0) - timedelta(minutes=5)
+    first = {'node_id': '!00000001', 'metric': 'voltage', 'ts': ts, 'value': 4.0}
+    second = {'node_id': '!00000001', 'metric': 'voltage', 'ts': ts + timedelta(seconds=10), 'value': 3.0}
+    # Повтор пачки после сбоя: первое значение приходит снова
+    database._write_telemetry([first])
+    database._write_telemetry([first, second])
+    database._write_telemetry([first, second])
+
+    with database.session_scope() as session:
+        rollups = session.query(TelemetryRollup).all()
+        assert {(row.resolution, row.count, row.total, row.min_value, row.max_value) for row in rollups} == {
+            (ROLLUP_MINUTE, 2, 7.0, 3.0, 4.0), (ROLLUP_HOUR, 2, 7.0, 3.0, 4.0)
+        }
@@ -0,0 +1,117 @@
+import json
+
+from src.write_buffer import WriteBehindBuffer
+
+
+class FlakyStore:
+    """Хранилище, отклоняющее пачки с «отравленной» записью"""
+
+    def __init__(self):
+        self.rows = []
+        self.calls = 0
+
+    def write(self, batch):
+        self.calls += 1
+        if any(entry.get('poison') for entry in batch):
+            raise ValueError("constraint failed")
+        self.rows.extend(batch)
+
+
+def test_poison_row_is_dead_lettered(tmp_path):
+    store = FlakyStore()
+    buffer = WriteBehindBuffer(store.write, max_retries=2, retry_backoff=0.0, durability='journal',
+                               journal_path=str(tmp_path / 'log.journal'))
+    buffer.start()
+    try:
+        buffer.add({'id': 1})
+        buffer.add({'id': 2, 'poison': True})
+        buffer.add({'id': 3})
+        for _ in range(3):
+            buffer.flush()
+        buffer.add({'id': 4})
+        buffer.flush()
+    finally:
+        buffer.stop()
+
+    assert [row['id'] for row in store.rows] == [1, 3, 4]
+    assert buffer.retries == 2
+    assert buffer.dead_lettered == 1
+    with open(tmp_path / 'log.journal.dead', encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == [{'id': 2, 'poison': True}]
+    # Журнал очищен, отложенная запись не воспроизводится при запуске
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['log.journal.dead']
+
+
+def test_flush_waits_for_backoff():
+    store = FlakyStore()
+    buffer = WriteBehindBuffer(store.write, durability='none', retry_backoff=60.0)
+    buffer.add({'id': 1, 'poison': True})
+    buffer.flush()
+    buffer.flush()
+    assert store.calls == 1
+    assert len(buffer) == 1
+
+
+class OutageStore(FlakyStore):
+    """Хранилище, недоступное первые `outage` вызовов"""
+
+    def __init__(self, outage):
+        super().__init__()
+        self.outage = outage
+
+    def write(self, batch):
+        if self.calls < self.outage:
+            self.calls += 1
+            raise ConnectionError("database is locked")
+        super().write(batch)
+
+
+def test_outage_longer_than_retry_budget_is_not_dead_lettered(tmp_path):
+    store = OutageStore(outage=10)
+    buffer = WriteBehindBuffer(store.write, max_retries=2, retry_backoff=0.0, durability='journal',
+                               journal_path=str(tmp_path / 'log.journal'), transient_errors=(ConnectionError,))
+    buffer.start()
+    try:
+        buffer.add({'id': 1})
+        buffer.add({'id': 2, 'poison': True})
+        for _ in range(10):
+            buffer.flush()
+        # Пачка ждет в буфере и журнале, ничего не отложено
+        assert store.rows == [] and buffer.dead_lettered == 0
+        assert len(buffer) == 2
+        buffer.add({'id': 3})
+        # БД снова доступна: сначала повторы, затем запись по одной
+        for _ in range(3):
+            buffer.flush()
+    finally:
+        buffer.stop()
+
+    assert [row['id'] for row in store.rows] == [1, 3]
+    assert buffer.dead_lettered == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['log.journal.dead']
+
+
+def test_outage_during_one_by_one_write_returns_rows_to_buffer():
+    store = FlakyStore()
+    outage = {'on': False}
+
+    def write(batch):
+        if outage['on']:
+            raise ConnectionError("connection lost")
+        if len(batch) == 1 and batch[0]['id'] == 2:
+            # БД пропадает посреди записи по одной
+            outage['on'] = True
+        store.write(batch)
+
+    buffer = WriteBehindBuffer(write, durability='none', max_retries=0, retry_backoff=0.0,
+                               transient_errors=(ConnectionError,))
+    for entry in ({'id': 1, 'poison': True}, {'id': 2}, {'id': 3}):
+        buffer.add(entry)
+    buffer.flush()
+
+    assert [row['id'] for row in store.rows] == [2]
+    assert buffer.dead_lettered == 1
+    assert [entry['id'] for entry in buffer._buffer] == [3]
+    outage['on'] = False
+    buffer.flush()
+    assert [row['id'] for row in store.rows] == [2, 3]